@@ -0,0 +1,428 @@
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the sweep runs per process
+    fcntl = None
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from .database import engine
+from .images import DERIVED_DIR_NAME, is_raster, source_hash
+from .models import Artifact, ConversionJob, LibraryItem, Message, Presentation, Submission, User
+from .storage import get_storage
+
+logger = logging.getLogger("slideshare.artifacts")
+
+# Registry of stored files for per-user accounting, and a periodic sweep that
+# removes files nothing references any more (deleted presentations, replaced
+# avatars, re-conversions). Only areas this app writes are scanned; classroom
+# and submission folders are never touched.
+#
+# The scheduled sweep deletes files, so it is opt-in: set
+# ARTIFACT_GC_INTERVAL_HOURS (and try ARTIFACT_GC_DRY_RUN=1 first). Every worker
+# starts the timer, but a sweep only runs under an exclusive lock on
+# UPLOAD_DIR/.artifact-gc.lock, which also records when the last one ran, so
+# one process per interval does the work.
+ARTIFACT_GC_INTERVAL_HOURS = float(os.getenv("ARTIFACT_GC_INTERVAL_HOURS", "0"))  # 0 disables the sweep
+# files younger than this are never collected (uploads/conversions in flight)
+ARTIFACT_GC_MIN_AGE_HOURS = float(os.getenv("ARTIFACT_GC_MIN_AGE_HOURS", "24"))
+ARTIFACT_GC_BATCH_SIZE = int(os.getenv("ARTIFACT_GC_BATCH_SIZE", "200"))
+ARTIFACT_GC_DRY_RUN = os.getenv("ARTIFACT_GC_DRY_RUN", "0").lower() in ("1", "true", "yes")
+
+# per-presentation trees: <name>/<presentation id>/
+PRESENTATION_TREES = {"thumbs": "thumbs", "thumbs_hd": "thumbs_hd", "hls": "hls"}
+_WEB_VIDEO_RE = re.compile(r"^(\d+)_web\.mp4$")
+_TEMP_SUFFIXES = (".tmp", ".part")
+_URL_PREFIXES = ("/uploads/", "/media/")
+_IMAGE_URL_RE = re.compile(r"^/images/[a-z]+/\d+/")
+
+
+def upload_dir() -> Path:
+    return Path(os.getenv("UPLOAD_DIR", "./uploads"))
+
+
+def _key_path(key: str) -> Path:
+    return upload_dir() / key.rstrip("/")
+
+
+def _tree_stats(path: Path) -> Tuple[int, float]:
+    """(total bytes, newest mtime) of a file or directory tree."""
+    st = path.stat()
+    if not path.is_dir():
+        return st.st_size, st.st_mtime
+    size, newest = 0, st.st_mtime
+    for f in path.rglob("*"):
+        try:
+            fst = f.stat()
+        except OSError:
+            continue
+        newest = max(newest, fst.st_mtime)
+        if f.is_file():
+            size += fst.st_size
+    return size, newest
+
+
+def key_for_url(url: Optional[str]) -> Optional[str]:
+    """Storage key behind an /uploads/, /media/ or /images/ URL (None for others)."""
+    if not url:
+        return None
+    path = unquote(urlsplit(url).path)
+    m = _IMAGE_URL_RE.match(path)
+    if m:
+        return path[m.end():]
+    for prefix in _URL_PREFIXES:
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return None
+
+
+def record_artifact(key: str, kind: str, owner_id: Optional[int] = None,
+                    presentation_id: Optional[int] = None, size: Optional[int] = None) -> Optional[int]:
+    """Insert or update the registry row for a file (or a tree when key ends in "/").
+
+    Best effort: accounting must never fail the operation that produced the file.
+    """
+    try:
+        if size is None:
+            path = _key_path(key)
+            if path.exists():
+                size = _tree_stats(path)[0]
+            else:
+                obj = get_storage().stat(key) if not key.endswith("/") else None
+                size = obj.size if obj is not None else 0
+        with Session(engine) as session:
+            row = session.exec(select(Artifact).where(Artifact.key == key)).first()
+            if row is None:
+                row = Artifact(key=key, kind=kind)
+            row.kind = kind
+            row.owner_id = owner_id if owner_id is not None else row.owner_id
+            row.presentation_id = presentation_id if presentation_id is not None else row.presentation_id
+            row.size = int(size)
+            row.updated_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+        return int(size)
+    except Exception:
+        logger.debug("recording artifact %s failed", key, exc_info=True)
+        return None
+
+
+def _presentation_keys(session: Session, pres: Presentation) -> List[Tuple[str, str]]:
+    pid = int(pres.id)
+    keys = []
+    if pres.filename:
+        keys.append((pres.filename, "upload"))
+    jobs = session.exec(select(ConversionJob.result).where(ConversionJob.presentation_id == pid)).all()
+    for result in jobs:
+        if not result or result.startswith("s3://") or result == pres.filename or "/" in result:
+            continue
+        keys.append((result, "pdf" if result.lower().endswith(".pdf") else "video"))
+    keys.append((f"{pid}_web.mp4", "video"))
+    for tree, kind in PRESENTATION_TREES.items():
+        keys.append((f"{tree}/{pid}/", kind))
+    return list(dict.fromkeys(keys))
+
+
+def refresh_presentation_artifacts(presentation_id: int) -> int:
+    """Re-measure everything stored for a presentation; returns its total bytes.
+
+    Called after conversion, so re-rendered or removed previews are reflected.
+    """
+    total = 0
+    try:
+        with Session(engine) as session:
+            pres = session.get(Presentation, presentation_id)
+            if pres is None:
+                return 0
+            owner_id = pres.owner_id
+            keys = _presentation_keys(session, pres)
+            stale = session.exec(select(Artifact).where(Artifact.presentation_id == presentation_id)).all()
+        present = set()
+        for key, kind in keys:
+            path = _key_path(key)
+            if not path.exists() and not (kind == "upload" and get_storage().exists(key)):
+                continue
+            size = record_artifact(key, kind, owner_id, presentation_id)
+            present.add(key)
+            total += size or 0
+            if kind == "upload" and size:
+                with Session(engine) as session:
+                    pres = session.get(Presentation, presentation_id)
+                    if pres is not None and pres.file_size != size:
+                        pres.file_size = size
+                        session.add(pres)
+                        session.commit()
+        gone = [row.id for row in stale if row.key not in present]
+        if gone:
+            with Session(engine) as session:
+                for row in session.exec(select(Artifact).where(Artifact.id.in_(gone))).all():
+                    session.delete(row)
+                session.commit()
+    except Exception:
+        logger.debug("refreshing artifacts of presentation %s failed", presentation_id, exc_info=True)
+    return total
+
+
+def _remove(key: str) -> bool:
+    path = _key_path(key)
+    try:
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning("removing artifact %s failed", key, exc_info=True)
+        return False
+    storage = get_storage()
+    if storage.remote and not key.endswith("/"):
+        storage.delete(key)
+    return True
+
+
+def release_presentation_artifacts(presentation_id: int) -> int:
+    """Delete every registered file of a (deleted) presentation; returns bytes freed."""
+    freed = 0
+    with Session(engine) as session:
+        rows = session.exec(select(Artifact).where(Artifact.presentation_id == presentation_id)).all()
+        for row in rows:
+            if _remove(row.key):
+                freed += row.size or 0
+                session.delete(row)
+        session.commit()
+    return freed
+
+
+def usage(owner_id: Optional[int] = None) -> dict:
+    """Registered bytes and files for one owner, or for everything when owner_id is None."""
+    stmt = select(Artifact.kind, func.coalesce(func.sum(Artifact.size), 0), func.count(Artifact.id)).group_by(Artifact.kind)
+    if owner_id is not None:
+        stmt = stmt.where(Artifact.owner_id == owner_id)
+    with Session(engine) as session:
+        rows = session.exec(stmt).all()
+    by_kind = {kind: int(size) for kind, size, _ in rows}
+    return {"bytes": sum(by_kind.values()), "files": sum(int(n) for _, _, n in rows), "by_kind": by_kind}
+
+
+def top_owners(limit: int = 10) -> List[dict]:
+    stmt = (
+        select(Artifact.owner_id, func.sum(Artifact.size).label("bytes"))
+        .where(Artifact.owner_id.is_not(None))
+        .group_by(Artifact.owner_id)
+        .order_by(func.sum(Artifact.size).desc())
+        .limit(limit)
+    )
+    with Session(engine) as session:
+        return [{"owner_id": owner, "bytes": int(size or 0)} for owner, size in session.exec(stmt).all()]
+
+
+def _live_references(session: Session) -> Tuple[set, set]:
+    """(storage keys referenced by the database, ids of live presentations)."""
+    pids = {int(pid) for pid in session.exec(select(Presentation.id)).all()}
+    keys = set()
+    for name in session.exec(select(Presentation.filename)).all():
+        if name:
+            keys.add(name)
+    for pid, result in session.exec(select(ConversionJob.presentation_id, ConversionJob.result)).all():
+        if result and pid in pids and not result.startswith("s3://"):
+            keys.add(result)
+    for column in (User.avatar, Submission.filename, LibraryItem.filename):
+        keys.update(name for name in session.exec(select(column)).all() if name)
+    for file_url, thumb_url in session.exec(select(Message.file_url, Message.thumbnail_url)).all():
+        for url in (file_url, thumb_url):
+            key = key_for_url(url)
+            if key:
+                keys.add(key)
+    return keys, pids
+
+
+def find_orphans(min_age_seconds: Optional[float] = None) -> List[dict]:
+    """Files under UPLOAD_DIR that nothing references, oldest-safe first."""
+    if min_age_seconds is None:
+        min_age_seconds = ARTIFACT_GC_MIN_AGE_HOURS * 3600
+    root = upload_dir()
+    cutoff = time.time() - min_age_seconds
+    with Session(engine) as session:
+        keys, pids = _live_references(session)
+        registered = session.exec(select(Artifact.key, Artifact.kind, Artifact.created_at, Artifact.updated_at)).all()
+    orphans = []
+
+    def consider(path: Path, key: str, kind: str, reason: str):
+        try:
+            size, newest = _tree_stats(path)
+        except OSError:
+            return
+        if newest < cutoff:
+            orphans.append({"key": key, "kind": kind, "bytes": size, "reason": reason})
+
+    if not root.exists():
+        return orphans
+    for f in root.iterdir():
+        if not f.is_file() or f.name.startswith("."):
+            continue
+        if f.name.endswith(_TEMP_SUFFIXES):
+            consider(f, f.name, "temp", "abandoned temporary file")
+            continue
+        m = _WEB_VIDEO_RE.match(f.name)
+        if m:
+            if int(m.group(1)) not in pids:
+                consider(f, f.name, "video", "presentation deleted")
+            continue
+        if f.name not in keys:
+            consider(f, f.name, "avatar" if f.name.startswith("avatar_") else "upload", "not referenced")
+
+    for tree, kind in PRESENTATION_TREES.items():
+        base = root / tree
+        if not base.is_dir():
+            continue
+        for d in base.iterdir():
+            if d.name.isdigit() and int(d.name) not in pids:
+                consider(d, f"{tree}/{d.name}/", kind, "presentation deleted")
+
+    chat_root = root / "chat"
+    if chat_root.is_dir():
+        for f in chat_root.rglob("*"):
+            key = f.relative_to(root).as_posix()
+            if f.is_file() and key not in keys:
+                consider(f, key, "chat", "not referenced by a message")
+
+    derived_root = root / DERIVED_DIR_NAME
+    if derived_root.is_dir():
+        live_hashes = set()
+        for key in keys:
+            if is_raster(key):
+                try:
+                    live_hashes.add(source_hash(root / key))
+                except OSError:
+                    pass
+        for f in derived_root.rglob("*.webp"):
+            if f.name.split("_", 1)[0] not in live_hashes:
+                consider(f, f.relative_to(root).as_posix(), "derived", "source image gone")
+
+    seen = {o["key"] for o in orphans}
+    storage = get_storage()
+    for key, kind, created_at, updated_at in registered:
+        if key in seen or _key_path(key).exists():
+            continue
+        # a row may be written just before its file (conversion in flight, chat
+        # upload, storage lag); it is only stale once it is as old as a file would be
+        recorded = updated_at or created_at
+        if recorded is not None and (datetime.utcnow() - recorded).total_seconds() < min_age_seconds:
+            continue
+        if storage.remote and not key.endswith("/") and storage.exists(key):
+            continue
+        orphans.append({"key": key, "kind": kind, "bytes": 0, "reason": "stale record"})
+    return orphans
+
+
+def collect_garbage(dry_run: bool = ARTIFACT_GC_DRY_RUN, min_age_seconds: Optional[float] = None,
+                    batch_size: int = ARTIFACT_GC_BATCH_SIZE, report_limit: int = 200) -> dict:
+    """Sweep orphaned artifacts in batches; with dry_run only report what would go.
+
+    Registry rows for removed keys are dropped with each batch, so an
+    interrupted sweep leaves the accounting consistent with what is on disk.
+    """
+    started = time.monotonic()
+    orphans = find_orphans(min_age_seconds)
+    report = {
+        "dry_run": bool(dry_run),
+        "candidates": len(orphans),
+        "bytes": sum(o["bytes"] for o in orphans),
+        "by_reason": {},
+        "deleted": 0,
+        "freed": 0,
+        "errors": 0,
+        "items": orphans[:report_limit],
+    }
+    for o in orphans:
+        report["by_reason"][o["reason"]] = report["by_reason"].get(o["reason"], 0) + 1
+    if not dry_run:
+        for i in range(0, len(orphans), max(1, batch_size)):
+            batch = orphans[i:i + max(1, batch_size)]
+            removed = []
+            for o in batch:
+                if o["reason"] == "stale record" or _remove(o["key"]):
+                    removed.append(o["key"])
+                    report["deleted"] += 1
+                    report["freed"] += o["bytes"]
+                else:
+                    report["errors"] += 1
+            if removed:
+                with Session(engine) as session:
+                    for row in session.exec(select(Artifact).where(Artifact.key.in_(removed))).all():
+                        session.delete(row)
+                    session.commit()
+    report["usage"] = usage()
+    report["seconds"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "artifact gc%s: %s candidates, %s bytes; deleted %s (%s bytes), %s errors",
+        " (dry run)" if dry_run else "", report["candidates"], report["bytes"],
+        report["deleted"], report["freed"], report["errors"],
+    )
+    return report
+
+
+_gc_stop = threading.Event()
+_gc_thread: Optional[threading.Thread] = None
+
+
+def _scheduled_sweep(interval_seconds: float) -> bool:
+    """Run one sweep unless another process holds the lock or swept within the interval."""
+    lock_path = upload_dir() / ".artifact-gc.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+") as fh:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+        fh.seek(0)
+        try:
+            last = float(fh.read().strip() or 0)
+        except ValueError:
+            last = 0.0
+        # timers in different workers drift; a sweep just done elsewhere counts
+        if time.time() - last < interval_seconds * 0.9:
+            return False
+        collect_garbage()
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(time.time()))
+        return True
+
+
+def _gc_loop(interval_seconds: float):
+    while not _gc_stop.wait(interval_seconds):
+        try:
+            _scheduled_sweep(interval_seconds)
+        except Exception:
+            logger.exception("artifact gc sweep failed")
+
+
+def start_gc_scheduler(interval_hours: float = ARTIFACT_GC_INTERVAL_HOURS) -> bool:
+    """Run collect_garbage every interval_hours in a daemon thread (first run after one interval)."""
+    global _gc_thread
+    if interval_hours <= 0 or (_gc_thread is not None and _gc_thread.is_alive()):
+        return False
+    _gc_stop.clear()
+    _gc_thread = threading.Thread(target=_gc_loop, args=(interval_hours * 3600,), name="artifact-gc", daemon=True)
+    _gc_thread.start()
+    return True
+
+
+def stop_gc_scheduler():
+    global _gc_thread
+    _gc_stop.set()
+    _gc_thread = None
@@ -0,0 +1,217 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+logger = logging.getLogger("slideshare.assets")
+
+# Static asset pipeline. ``build_assets`` minifies CSS/JS from static/, writes
+# content-hashed copies to static/dist/ with .br/.gz siblings, and records them
+# in static/dist/manifest.json. Templates link assets through ``asset_url``;
+# hashed URLs never change content, so they are cached as immutable and served
+# precompressed. Without a build, templates fall back to the plain files.
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+DIST_DIR_NAME = "dist"
+MANIFEST_NAME = "manifest.json"
+ASSET_EXTS = {".css", ".js", ".svg"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# smaller files are not worth a compressed sibling
+MIN_COMPRESS_BYTES = 512
+
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+_CSS_TOKEN_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+
+
+def minify_css(text: str) -> str:
+    """Strip comments and redundant whitespace; strings are left intact."""
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    parts = []
+    last = 0
+    for m in _CSS_TOKEN_RE.finditer(text):
+        parts.append(_squeeze_css(text[last:m.start()]))
+        if m.group(1):  # string literal
+            parts.append(m.group(1))
+        last = m.end()
+    parts.append(_squeeze_css(text[last:]))
+    return "".join(parts).strip()
+
+
+def _squeeze_css(chunk: str) -> str:
+    chunk = re.sub(r"\s+", " ", chunk)
+    return re.sub(r"\s*([{};,])\s*", r"\1", chunk)
+
+
+def minify_js(text: str) -> str:
+    """rjsmin when installed; otherwise the source is kept (compression still applies)."""
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    return text
+
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    out = {}
+    if len(data) < MIN_COMPRESS_BYTES:
+        return out
+    if brotli is not None:
+        out[".br"] = brotli.compress(data, quality=11)
+    out[".gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+    return {suffix: blob for suffix, blob in out.items() if len(blob) < len(data)}
+
+
+def _write_if_changed(path: Path, data: bytes) -> None:
+    try:
+        if path.read_bytes() == data:
+            return
+    except OSError:
+        pass
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def build_assets(static_dir=STATIC_DIR, out_dir=None) -> dict:
+    """Minify, hash and precompress every CSS/JS/SVG asset; returns the manifest.
+
+    Older hashed files are kept so pages rendered before a deploy still load.
+    """
+    static_dir = Path(static_dir)
+    out_dir = Path(out_dir) if out_dir else static_dir / DIST_DIR_NAME
+    manifest = {}
+    for src in sorted(static_dir.rglob("*")):
+        if not src.is_file() or src.suffix.lower() not in ASSET_EXTS:
+            continue
+        rel = src.relative_to(static_dir)
+        if rel.parts[0] == DIST_DIR_NAME or out_dir in src.parents:
+            continue
+        data = src.read_bytes()
+        if src.suffix.lower() == ".css":
+            data = minify_css(data.decode("utf-8")).encode("utf-8")
+        elif src.suffix.lower() == ".js":
+            data = minify_js(data.decode("utf-8")).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        hashed = rel.with_name(f"{rel.stem}.{digest}{rel.suffix}")
+        dest = out_dir / hashed
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        _write_if_changed(dest, data)
+        for suffix, blob in _compress(data).items():
+            _write_if_changed(dest.with_name(dest.name + suffix), blob)
+        manifest[rel.as_posix()] = f"{DIST_DIR_NAME}/{hashed.as_posix()}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    _write_if_changed(out_dir / MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+_manifest_lock = threading.Lock()
+_manifest_cache = (None, {})
+
+
+def load_manifest(static_dir=STATIC_DIR) -> dict:
+    """The build manifest, re-read only when the file changes (empty without a build)."""
+    global _manifest_cache
+    path = Path(static_dir) / DIST_DIR_NAME / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    with _manifest_lock:
+        if _manifest_cache[0] == (str(path), mtime):
+            return _manifest_cache[1]
+    try:
+        manifest = json.loads(path.read_text())
+    except Exception:
+        logger.warning("unreadable asset manifest %s", path)
+        manifest = {}
+    with _manifest_lock:
+        _manifest_cache = ((str(path), mtime), manifest)
+    return manifest
+
+
+def asset_url(path: str, version: Optional[str] = None) -> str:
+    """URL for a static asset: its hashed build when available, else the source file."""
+    path = path.lstrip("/")
+    built = load_manifest().get(path)
+    if built:
+        return f"/static/{built}"
+    version = version or os.getenv("STATIC_VERSION") or os.getenv("RENDER_GIT_COMMIT")
+    return f"/static/{path}?v={version}" if version else f"/static/{path}"
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                pass
+        if name.strip():
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves .br/.gz siblings of hashed build outputs.
+
+    Files under dist/ are content-addressed, so they get immutable caching;
+    everything else is revalidated with its ETag on each use.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = Path(full_path)
+        if DIST_DIR_NAME not in full_path.parts or full_path.name == MANIFEST_NAME:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            if full_path.suffix.lower() in (".css", ".js"):
+                response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+            return response
+        media_type = mimetypes.guess_type(full_path.name)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        path, stat = full_path, stat_result
+        for encoding, suffix in _ENCODINGS:
+            if encoding not in accepted:
+                continue
+            candidate = full_path.with_name(full_path.name + suffix)
+            try:
+                stat = candidate.stat()
+            except OSError:
+                continue
+            path = candidate
+            headers["Content-Encoding"] = encoding
+            break
+        if path is full_path:
+            stat = stat_result
+        response = FileResponse(path, status_code=status_code, media_type=media_type, headers=headers, stat_result=stat)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
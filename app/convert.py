@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 import subprocess
 from pathlib import Path
 import logging
@@ -100,6 +102,50 @@ def generate_pdf_thumbnails(pdf_path: str, thumbs_dir: str, max_pages: int = 10)
     return out
 
 
+SLIDE_MANIFEST_NAME = "manifest.json"
+
+
+def file_content_hash(path: str, length: int = 16) -> str:
+    """Return a short SHA-256 hex digest of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()[:length]
+
+
+def write_thumbnail_manifest(thumbs_dir: str) -> dict:
+    """Hash every slide_*.png in thumbs_dir and write manifest.json.
+
+    The manifest maps slide file names to content hashes; the web app uses it to
+    build immutable, versioned slide URLs and strong ETags without hashing on
+    each request. Returns the mapping (may be empty).
+    """
+    td = Path(thumbs_dir)
+    slides: dict = {}
+    try:
+        for f in sorted(td.glob("slide_*.png")):
+            try:
+                slides[f.name] = file_content_hash(str(f))
+            except Exception:
+                continue
+        tmp = td / (SLIDE_MANIFEST_NAME + ".tmp")
+        tmp.write_text(json.dumps({"slides": slides}), encoding="utf-8")
+        os.replace(str(tmp), str(td / SLIDE_MANIFEST_NAME))
+    except Exception as e:
+        logger.exception("writing thumbnail manifest failed: %s", e)
+    return slides
+
+
+def read_thumbnail_manifest(thumbs_dir: str) -> dict:
+    """Return the slide-name -> hash mapping from manifest.json (empty if missing)."""
+    try:
+        data = json.loads((Path(thumbs_dir) / SLIDE_MANIFEST_NAME).read_text(encoding="utf-8"))
+        return dict(data.get("slides") or {})
+    except Exception:
+        return {}
+
+
 def generate_video_thumbnail(video_path: str, out_path: str, time_pos: float = 1.0) -> Optional[str]:
     """Use ffmpeg to extract a frame at time_pos seconds and save as PNG."""
     try:
@@ -70,6 +70,19 @@ def create_db_and_tables():
                     conn.exec_driver_sql("ALTER TABLE presentation ADD COLUMN language TEXT")
                 except Exception:
                     pass
+            if 'content_sha256' not in pcols:
+                try:
+                    conn.exec_driver_sql("ALTER TABLE presentation ADD COLUMN content_sha256 TEXT")
+                    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_presentation_content_sha256 ON presentation (content_sha256)")
+                except Exception:
+                    pass
+            # per-artifact publish results on conversion jobs
+            res3 = conn.exec_driver_sql("PRAGMA table_info('conversionjob')").fetchall()
+            if res3 and 'artifacts' not in [r[1] for r in res3]:
+                try:
+                    conn.exec_driver_sql("ALTER TABLE conversionjob ADD COLUMN artifacts TEXT")
+                except Exception:
+                    pass
             # classroom -> space terminology migration bridge (idempotent)
             #
             # The app is being refactored from classroom_id/classroom tables to space_id/space tables.
@@ -0,0 +1,180 @@
+import os
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+# Starlette streams files in 64 KiB reads; larger reads cut per-chunk overhead for
+# big videos. Servers implementing the ASGI pathsend extension skip this entirely.
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", str(1024 * 1024)))
+DOWNLOAD_CACHE_CONTROL = "private, max-age=0, must-revalidate"
+
+# nginx X-Accel-Redirect offload. The proxy opts in per request by sending
+# ``X-Sendfile-Type: X-Accel-Redirect``; files under ACCEL_REDIRECT_ROOT are
+# then handed to the internal ACCEL_REDIRECT_LOCATION instead of being streamed
+# by Python. Direct hits on uvicorn keep streaming the bytes themselves.
+ACCEL_REDIRECT_LOCATION = os.getenv("ACCEL_REDIRECT_LOCATION", "/_protected/uploads/")
+ACCEL_REDIRECT_ROOT = os.getenv("ACCEL_REDIRECT_ROOT") or os.getenv("UPLOAD_DIR", "./uploads")
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse with larger chunks.
+
+    Starlette already handles single and multi-range (multipart/byteranges)
+    requests, ``If-Range`` and 416 responses, and uses ``http.response.pathsend``
+    for zero-copy when the server supports it.
+    """
+
+    chunk_size = FILE_CHUNK_SIZE
+
+
+def file_etag(st: os.stat_result) -> str:
+    """Strong validator from inode, size and nanosecond mtime (quoted)."""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an (unquoted or quoted) ETag."""
+    if not if_none_match:
+        return False
+    etag = etag.strip('"')
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
+
+def accel_redirect_uri(request: Request, path) -> Optional[str]:
+    """Internal nginx URI for path, or None when offload is unavailable."""
+    if not ACCEL_REDIRECT_LOCATION:
+        return None
+    if (request.headers.get("x-sendfile-type") or "").lower() != "x-accel-redirect":
+        return None
+    try:
+        rel = Path(path).resolve().relative_to(Path(ACCEL_REDIRECT_ROOT).resolve())
+    except (OSError, ValueError):
+        return None
+    return ACCEL_REDIRECT_LOCATION.rstrip("/") + "/" + quote(rel.as_posix())
+
+
+def accel_response(request: Request, path, media_type: str, headers: Optional[dict] = None) -> Optional[Response]:
+    """Return an empty response telling nginx to send path itself, if offload applies.
+
+    nginx keeps Content-Type, Content-Disposition and Cache-Control from this
+    response and does its own range, conditional and sendfile handling.
+    """
+    uri = accel_redirect_uri(request, path)
+    if uri is None:
+        return None
+    out = dict(headers or {})
+    # nginx derives validators from the file it serves
+    for key in ("ETag", "Last-Modified", "Accept-Ranges"):
+        out.pop(key, None)
+    out["X-Accel-Redirect"] = uri
+    return Response(status_code=200, media_type=media_type, headers=out)
+
+
+def content_disposition(name: str, inline: bool = False) -> str:
+    kind = "inline" if inline else "attachment"
+    quoted = quote(name)
+    if quoted != name:
+        return f"{kind}; filename*=utf-8''{quoted}"
+    return f'{kind}; filename="{name}"'
+
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        return etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+    return False
+
+
+def serve_file(
+    request: Request,
+    path,
+    *,
+    filename: Optional[str] = None,
+    inline: bool = False,
+    media_type: Optional[str] = None,
+    cache_control: str = DOWNLOAD_CACHE_CONTROL,
+    headers: Optional[dict] = None,
+) -> Response:
+    """Serve a file on disk with conditional, range and multi-range support.
+
+    Attachments default to ``application/octet-stream`` so browsers (iOS Safari
+    included) save rather than render them; inline responses use the guessed
+    media type. Behind nginx the transfer is offloaded via X-Accel-Redirect.
+    Raises 404 if the file is missing.
+    """
+    path = Path(path)
+    try:
+        st = path.stat()
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    name = filename or path.name
+    if media_type is None:
+        guessed = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        media_type = guessed if inline else "application/octet-stream"
+    etag = file_etag(st)
+    out_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if headers:
+        out_headers.update(headers)
+    if request.method in ("GET", "HEAD") and _not_modified(request, etag, st):
+        return Response(status_code=304, headers=out_headers)
+    out_headers.setdefault("Content-Disposition", content_disposition(name, inline))
+    offloaded = accel_response(request, path, media_type, out_headers)
+    if offloaded is not None:
+        return offloaded
+    return RangeFileResponse(path, media_type=media_type, headers=out_headers, stat_result=st)
+
+
+def serve_stored_file(
+    request: Request,
+    key: Optional[str],
+    path,
+    *,
+    filename: Optional[str] = None,
+    inline: bool = False,
+    media_type: Optional[str] = None,
+) -> Response:
+    """Serve an upload from the configured storage backend.
+
+    With remote storage the client is redirected to a short-lived presigned URL
+    when the object exists there, so the bytes never pass through the app;
+    otherwise the local copy is served by ``serve_file``.
+    """
+    from fastapi.responses import RedirectResponse
+    from .storage import get_storage
+
+    storage = get_storage()
+    if key and storage.remote and request.method in ("GET", "HEAD") and storage.exists(key):
+        name = filename or Path(key).name
+        if media_type is None and inline:
+            media_type = mimetypes.guess_type(name)[0]
+        url = storage.presign(key, filename=name, inline=inline, content_type=media_type)
+        if url:
+            return RedirectResponse(url, status_code=302, headers={"Cache-Control": "no-store"})
+    return serve_file(request, path, filename=filename, inline=inline, media_type=media_type)
@@ -0,0 +1,114 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger("slideshare.images")
+
+# Fixed-size WebP derivatives of user images. Avatars are square crops; chat
+# previews keep their aspect ratio inside a bounding box. Files are named by the
+# source's content hash, so re-uploads of the same image share derivatives and
+# a changed image can never be served from a stale cache entry.
+DERIVATIVE_SIZES = {
+    "avatar": (32, 64, 128),
+    "chat": (320, 640),
+}
+DERIVED_DIR_NAME = "derived"
+WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+RASTER_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".avif"}
+# refuse decompression bombs before resizing
+MAX_SOURCE_PIXELS = int(os.getenv("IMAGE_MAX_SOURCE_PIXELS", str(64 * 1024 * 1024)))
+
+_hash_lock = threading.Lock()
+_hash_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_HASH_CACHE_MAX = 4096
+
+
+def is_raster(name: str) -> bool:
+    return Path(name).suffix.lower() in RASTER_EXTS
+
+
+def source_hash(path) -> str:
+    """Content hash of a source image, memoized by (path, mtime, size)."""
+    path = Path(path)
+    st = path.stat()
+    key = (str(path.resolve()), st.st_mtime_ns, st.st_size)
+    with _hash_lock:
+        digest = _hash_cache.get(key)
+        if digest is not None:
+            _hash_cache.move_to_end(key)
+            return digest
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()[:24]
+    with _hash_lock:
+        _hash_cache[key] = digest
+        while len(_hash_cache) > _HASH_CACHE_MAX:
+            _hash_cache.popitem(last=False)
+    return digest
+
+
+def derivative_path(upload_dir, digest: str, kind: str, size: int) -> Path:
+    return Path(upload_dir) / DERIVED_DIR_NAME / digest[:2] / f"{digest}_{kind}{size}.webp"
+
+
+def render_derivative(src, dest, kind: str, size: int) -> bool:
+    """Write one WebP derivative atomically; False if the source cannot be decoded."""
+    if Image is None:
+        return False
+    dest = Path(dest)
+    try:
+        with Image.open(src) as im:
+            if im.width * im.height > MAX_SOURCE_PIXELS:
+                return False
+            im.seek(0)  # first frame of animations
+            im = ImageOps.exif_transpose(im)
+            im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+            if kind == "avatar":
+                im = ImageOps.fit(im, (size, size), method=Image.LANCZOS)
+            else:
+                im.thumbnail((size, size), Image.LANCZOS)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(f"{dest.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+            im.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(tmp, dest)
+        return True
+    except Exception:
+        logger.debug("rendering %s derivative of %s failed", kind, src, exc_info=True)
+        return False
+
+
+def generate_derivatives(upload_dir, rel_path: str, kind: str) -> List[Path]:
+    """Render every size of ``kind`` for an upload; existing files are reused."""
+    sizes = DERIVATIVE_SIZES.get(kind)
+    src = Path(upload_dir) / rel_path
+    if not sizes or not src.is_file() or not is_raster(src.name):
+        return []
+    digest = source_hash(src)
+    out = []
+    for size in sizes:
+        dest = derivative_path(upload_dir, digest, kind, size)
+        if dest.exists() or render_derivative(src, dest, kind, size):
+            out.append(dest)
+    return out
+
+
+def existing_derivative(upload_dir, rel_path: str, kind: str, size: int) -> Optional[Path]:
+    """The derivative for an upload if it has been rendered, else None."""
+    src = Path(upload_dir) / rel_path
+    try:
+        dest = derivative_path(upload_dir, source_hash(src), kind, size)
+    except OSError:
+        return None
+    return dest if dest.exists() else None
@@ -0,0 +1,185 @@
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger("slideshare.ingest")
+
+# Uploads are consumed in one pass: every chunk is hashed, counted and written to
+# disk, and the first INGEST_TEE_MB are kept in memory for type sniffing and text
+# pre-extraction so nothing has to reopen the file before conversion.
+INGEST_TEE_BYTES = int(os.getenv("INGEST_TEE_MB", "8")) * 1024 * 1024
+INGEST_SAMPLE_PAGES = 3
+
+PPTX_MIMETYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+PPTM_MIMETYPE = "application/vnd.ms-powerpoint.presentation.macroEnabled.12"
+
+# extension -> mimetypes the sniffed content may legitimately have
+_EXPECTED_TYPES = {
+    ".pdf": {"application/pdf"},
+    ".pptx": {PPTX_MIMETYPE, "application/zip"},
+    ".pptm": {PPTM_MIMETYPE, PPTX_MIMETYPE, "application/zip"},
+    ".ppt": {"application/vnd.ms-powerpoint"},
+    ".mp4": {"video/mp4", "video/quicktime", "video/x-m4v"},
+    ".m4v": {"video/mp4", "video/quicktime", "video/x-m4v"},
+    ".mov": {"video/mp4", "video/quicktime", "video/x-m4v"},
+    ".webm": {"video/webm"},
+}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadTypeMismatch(ValueError):
+    """The sniffed content does not match the file's extension."""
+
+
+def sniff_mimetype(head: bytes, filename: str = "") -> Optional[str]:
+    """Detect the real type of an upload from its first bytes (None if unknown)."""
+    if head.startswith(b"%PDF-") or b"%PDF-" in head[:1024]:
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        ext = Path(filename).suffix.lower()
+        if b"ppt/" in head[:65536]:
+            return PPTM_MIMETYPE if ext == ".pptm" else PPTX_MIMETYPE
+        return "application/zip"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "application/vnd.ms-powerpoint"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if head[4:8] in (b"moov", b"mdat", b"wide", b"free", b"skip"):
+        # older QuickTime files start with a bare atom instead of ftyp
+        return "video/quicktime"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand == b"qt  ":
+            return "video/quicktime"
+        if brand in (b"M4V ", b"M4VH", b"M4VP"):
+            return "video/x-m4v"
+        return "video/mp4"
+    return None
+
+
+def content_matches_extension(mimetype: Optional[str], filename: str) -> bool:
+    expected = _EXPECTED_TYPES.get(Path(filename).suffix.lower())
+    if expected is None:
+        return True
+    return mimetype in expected
+
+
+class IngestResult:
+    """Outcome of an ingest pass.
+
+    ``sample_text`` is extracted on first access: from the in-memory tee when
+    the whole PDF fit into it, otherwise from the file on disk.
+    """
+
+    def __init__(self, path, size: int, sha256: str, mimetype: Optional[str], head: bytes):
+        self.path = Path(path)
+        self.size = size
+        self.sha256 = sha256
+        self.mimetype = mimetype
+        self._pdf_bytes = head if (mimetype == "application/pdf" and size <= len(head)) else None
+        self._sample_text = None
+
+    @property
+    def sample_text(self) -> str:
+        if self._sample_text is None:
+            self._sample_text = ""
+            if self.mimetype == "application/pdf":
+                self._sample_text = extract_pdf_sample(self._pdf_bytes, self.path)
+            self._pdf_bytes = None
+        return self._sample_text
+
+
+class UploadIngest:
+    """Write an upload to dest_path while hashing, counting and sniffing it.
+
+    ``feed()`` each chunk, then ``finish()``; ``abort()`` removes the partial
+    file. ``UploadTooLarge`` is raised from ``feed()`` past max_bytes.
+    """
+
+    def __init__(self, dest_path, filename: str, max_bytes: int, tee_bytes: int = INGEST_TEE_BYTES):
+        self.dest_path = Path(dest_path)
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.tee_bytes = tee_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._tee = bytearray()
+        self._fh = self.dest_path.open("wb")
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            self.abort()
+            raise UploadTooLarge(self.max_bytes)
+        self._hash.update(chunk)
+        if len(self._tee) < self.tee_bytes:
+            self._tee += chunk[: self.tee_bytes - len(self._tee)]
+        self._fh.write(chunk)
+
+    def abort(self) -> None:
+        try:
+            self._fh.close()
+        except Exception:
+            pass
+        try:
+            self.dest_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def finish(self) -> IngestResult:
+        self._fh.close()
+        head = bytes(self._tee)
+        self._tee = bytearray()
+        return IngestResult(self.dest_path, self.size, self._hash.hexdigest(), sniff_mimetype(head, self.filename), head)
+
+
+def extract_pdf_sample(data: Optional[bytes], path=None, pages: int = INGEST_SAMPLE_PAGES) -> str:
+    """Text of the first pages, from in-memory bytes when available, else the file."""
+    if fitz is None:
+        return ""
+    try:
+        if data is not None:
+            doc = fitz.open(stream=data, filetype="pdf")
+            try:
+                return "\n".join(doc[i].get_text() for i in range(min(len(doc), pages)))
+            finally:
+                doc.close()
+        if path is not None:
+            from .pdf_cache import open_pdf
+            # large PDF: this also warms the document cache for the first renders
+            with open_pdf(path) as doc:
+                return "\n".join(doc[i].get_text() for i in range(min(len(doc), pages)))
+    except Exception:
+        logger.debug("PDF text pre-extraction failed", exc_info=True)
+    return ""
+
+
+def ingest_file(path, filename: str, chunk_size: int = 1024 * 1024) -> IngestResult:
+    """Single read pass over a file that is already on disk (e.g. assembled chunks)."""
+    path = Path(path)
+    digest = hashlib.sha256()
+    head = bytearray()
+    size = 0
+    with path.open("rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest.update(chunk)
+            if len(head) < INGEST_TEE_BYTES:
+                head += chunk[: INGEST_TEE_BYTES - len(head)]
+    head = bytes(head)
+    return IngestResult(path, size, digest.hexdigest(), sniff_mimetype(head, filename), head)
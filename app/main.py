@@ -1,6 +1,7 @@
 from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=Path(__file__).resolve().parents[2] / ".env", override=True)
+from starlette.concurrency import run_in_threadpool
 from starlette.websockets import WebSocket, WebSocketDisconnect
 try:
     import fitz
@@ -17,6 +18,7 @@ import mimetypes
 
 
 import os
+import math
 import time
 import secrets
 from threading import Lock
@@ -75,9 +77,25 @@ import tempfile
 import smtplib
 import ssl
 import httpx
-from datetime import datetime
+from datetime import datetime, timedelta
 from .humanize import humanize_comment_date
 from .ai_client import chat_completion, get_ai_provider
+from .convert import SLIDE_MANIFEST_NAME, file_content_hash, read_thumbnail_manifest, write_thumbnail_manifest
+from .pdf_cache import open_pdf
+from .file_serving import DOWNLOAD_CACHE_CONTROL, accel_response, content_disposition, etag_matches, serve_file, serve_stored_file
+from .zipstream import StoredZip
+from .storage import get_storage, presign_s3_uri
+from . import resumable
+from .ingest import UploadIngest, UploadTooLarge, UploadTypeMismatch, content_matches_extension, ingest_file
+from .images import DERIVATIVE_SIZES, existing_derivative, is_raster, source_hash
+from . import artifacts
+from .assets import PrecompressedStaticFiles, asset_url
+
+try:
+    templates.env.globals['asset_url'] = asset_url
+except Exception:
+    pass
+from .models import UploadSession
 
 # Ensure humanize filter is registered after the function is imported
 try:
@@ -208,7 +226,7 @@ try:
 except Exception:
     pass
 
-from .tasks import enqueue_conversion, convert_presentation, enqueue_ai_summary, enqueue_ai_quiz, enqueue_ai_flashcards, enqueue_ai_mindmap, enqueue_autograde_submission, ai_autograde_submission
+from .tasks import enqueue_conversion, convert_presentation, shutdown_local_executor, enqueue_ai_summary, enqueue_ai_quiz, enqueue_ai_flashcards, enqueue_ai_mindmap, enqueue_autograde_submission, ai_autograde_submission
 from .payments import verify_webhook_signature
 from jose import jwt
 from .auth import SECRET_KEY, ALGORITHM
@@ -217,7 +235,7 @@ from typing import Optional, List, Dict, Set, Any
 from pathlib import Path
 import json
 from sqlmodel import Session, select
-from .tasks import enqueue_email
+from .tasks import enqueue_email, enqueue_image_derivatives
 
 @app.get('/my/teachers', response_class=HTMLResponse)
 def my_teachers(request: Request, current_user: User = Depends(get_current_user)):
@@ -383,12 +401,15 @@ def invitations_respond(request: Request, token: str = Query(...), action: str =
                 m = Membership(user_id=u.id, classroom_id=space_id, space_id=space_id, role='student')
                 session.add(m)
                 # system message in space chat
+                cm = None
                 try:
                     cm = SpaceMessage(space_id=space_id, sender_id=u.id, content=f"[system] {u.username} joined the space.")
                     session.add(cm)
                 except Exception:
                     pass
                 session.commit()
+                if cm is not None:
+                    _publish_space_message(cm, u)
             return HTMLResponse('<p>Thanks — you have been added to the space. You can <a href="/">return to the site</a>.</p>')
         else:
             return HTMLResponse('<p>You declined the invitation. No changes made.</p>')
@@ -425,12 +446,15 @@ def choose_role(request: Request, role: str = Form(...), invite_token: Optional[
                     if not exists:
                         m = Membership(user_id=current_user.id, classroom_id=space_id, space_id=space_id, role='student')
                         session.add(m)
+                        cm = None
                         try:
                             cm = SpaceMessage(space_id=space_id, sender_id=current_user.id, content=f"[system] {current_user.username} joined the space.")
                             session.add(cm)
                         except Exception:
                             pass
                         session.commit()
+                        if cm is not None:
+                            _publish_space_message(cm, current_user)
         except Exception:
             pass
 
@@ -592,116 +616,246 @@ def get_available_category_names() -> List[str]:
 
 
 import asyncio
-# Simple in-memory WebSocket connection manager
-class WebSocketManager:
-    def __init__(self):
-        # Map user_id -> set of WebSocket connections
-        self._conns: Dict[int, Set[WebSocket]] = {}
-        self._lock = asyncio.Lock()
-
-    async def connect(self, user_id: int, websocket: WebSocket):
-        await websocket.accept()
-        async with self._lock:
-            self._conns.setdefault(int(user_id), set()).add(websocket)
-
-    async def disconnect(self, user_id: int, websocket: WebSocket):
-        async with self._lock:
-            conns = self._conns.get(int(user_id))
-            if not conns:
-                return
-            try:
-                conns.discard(websocket)
-            except Exception:
-                pass
-            if not conns:
-                self._conns.pop(int(user_id), None)
-
-    async def send_personal(self, user_id: int, payload: dict):
-        conns = list(self._conns.get(int(user_id), []))
-        for ws in conns:
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                # best-effort: ignore failures
-                try:
-                    await self.disconnect(user_id, ws)
-                except Exception:
-                    pass
-
-    async def broadcast_presence(self, user_id: int, online: bool):
-        # Notify all connected users about user's presence change
-        payload = {"type": "presence", "user_id": int(user_id), "online": bool(online)}
-        # iterate over snapshot of connections
-        for uid, conns in list(self._conns.items()):
-            if uid == int(user_id):
-                continue
-            for ws in list(conns):
-                try:
-                    await ws.send_json(payload)
-                except Exception:
-                    try:
-                        await self.disconnect(uid, ws)
-                    except Exception:
-                        pass
-
-    def is_online(self, user_id: int) -> bool:
-        return bool(self._conns.get(int(user_id)))
+import anyio
+from functools import partial
+from .realtime import (
+    WS_CLOSE_POLICY,
+    WS_SWEEP_INTERVAL,
+    ConnectionLimiter,
+    Heartbeat,
+    LoopLagMonitor,
+    RoomHub,
+    WebSocketManager,
+    close_bus,
+    get_bus,
+    is_closed,
+    process_rss_bytes,
+)
+from .wire import Wire
+from . import sfu
+from .message_sink import close_sink, get_sink
+
+def _presence_audience(user_id: int) -> Set[int]:
+    """Users who see ``user_id`` come and go: followers, followees and space co-members."""
+    with Session(engine) as session:
+        ids = set(session.exec(select(Follow.follower_id).where(Follow.following_id == user_id)).all())
+        ids.update(session.exec(select(Follow.following_id).where(Follow.follower_id == user_id)).all())
+        spaces = select(Membership.space_id).where(Membership.user_id == user_id, Membership.space_id.is_not(None))
+        ids.update(session.exec(select(Membership.user_id).where(Membership.space_id.in_(spaces))).all())
+        classrooms = select(Membership.classroom_id).where(Membership.user_id == user_id, Membership.classroom_id.is_not(None))
+        ids.update(session.exec(select(Membership.user_id).where(Membership.classroom_id.in_(classrooms))).all())
+    ids.discard(user_id)
+    return ids
+
+
+# global manager instance; deliveries go through the realtime bus so users
+# connected to another worker receive them too
+manager = WebSocketManager(audience=_presence_audience)
+space_rooms = RoomHub("space")
+classroom_rooms = RoomHub("classroom")
+loop_monitor = LoopLagMonitor()
+# per-user and per-address socket caps, checked before every accept
+ws_limiter = ConnectionLimiter()
+
+# A meeting whose host has had no video socket on any worker for this long is
+# ended by the sweeper (covers hosts on a worker that died without cleaning up).
+VIDEO_HOST_GRACE_SECONDS = float(os.getenv("VIDEO_HOST_GRACE_SECONDS", "120"))
+# signaling is bursty (trickle ICE to every peer), so it gets a roomier bucket
+VIDEO_MSG_RATE = float(os.getenv("VIDEO_MSG_RATE", "50"))
+VIDEO_MSG_BURST = int(os.getenv("VIDEO_MSG_BURST", "200"))
 
 
-# global manager instance
-manager = WebSocketManager()
+class VideoSignalingState:
+    """Video signaling state.
 
+    Sockets are local to this worker; room membership and meetings live on the
+    realtime bus, so every worker sees the same rooms and messages for a user
+    reach them wherever their socket is.
+    """
 
-class VideoSignalingState:
     def __init__(self):
         self.user_sockets: Dict[int, Set[WebSocket]] = {}
         self.socket_users: Dict[WebSocket, int] = {}
-        self.room_users: Dict[int, Set[int]] = {}
-        self.user_rooms: Dict[int, Set[int]] = {}
-        self.meetings: Dict[int, Dict[str, Any]] = {}
-
-    def register_socket(self, user_id: int, websocket: WebSocket) -> None:
-        self.socket_users[websocket] = int(user_id)
-        self.user_sockets.setdefault(int(user_id), set()).add(websocket)
-
-    def unregister_socket(self, websocket: WebSocket) -> Optional[int]:
+        self.wires: Dict[WebSocket, Wire] = {}
+        self._subs: Dict[int, Any] = {}
+        # forwarders (see app/sfu.py) connected to or running in this worker
+        self.local_forwarders: Set[str] = set()
+
+    @property
+    def bus(self):
+        return get_bus()
+
+    async def register_socket(self, user_id: int, websocket: WebSocket, wire: Optional[Wire] = None) -> None:
+        uid = int(user_id)
+        self.socket_users[websocket] = uid
+        self.wires[websocket] = wire or Wire(websocket)
+        conns = self.user_sockets.setdefault(uid, set())
+        conns.add(websocket)
+        if uid not in self._subs:
+            handler = self._subs[uid] = partial(self._deliver, uid)
+            await self.bus.subscribe(f"video:{uid}", handler)
+
+    async def unregister_socket(self, websocket: WebSocket) -> Optional[int]:
         user_id = self.socket_users.pop(websocket, None)
+        self.wires.pop(websocket, None)
         if user_id is None:
             return None
         conns = self.user_sockets.get(int(user_id))
-        if conns:
+        if conns is not None:
             conns.discard(websocket)
             if not conns:
                 self.user_sockets.pop(int(user_id), None)
+                handler = self._subs.pop(int(user_id), None)
+                if handler is not None:
+                    await self.bus.unsubscribe(f"video:{int(user_id)}", handler)
         return int(user_id)
 
-    def join_room(self, user_id: int, space_id: int) -> None:
-        self.room_users.setdefault(int(space_id), set()).add(int(user_id))
-        self.user_rooms.setdefault(int(user_id), set()).add(int(space_id))
-
-    def leave_room(self, user_id: int, space_id: int) -> None:
-        room_set = self.room_users.get(int(space_id))
-        if room_set:
-            room_set.discard(int(user_id))
-            if not room_set:
-                self.room_users.pop(int(space_id), None)
-        user_set = self.user_rooms.get(int(user_id))
-        if user_set:
-            user_set.discard(int(space_id))
-            if not user_set:
-                self.user_rooms.pop(int(user_id), None)
-
-    def is_meeting_active(self, space_id: int) -> bool:
-        return bool(self.meetings.get(int(space_id)))
-
-    def start_meeting(self, space_id: int, host_id: int) -> None:
-        self.meetings[int(space_id)] = {
-            'host_id': int(host_id),
-            'participants': set([int(host_id)]),
-        }
+    async def send_to_user(self, user_id: sfu.Peer, payload: dict) -> None:
+        """Publish to a user, or to a forwarder given as "sfu:<name>"."""
+        await self.bus.publish(sfu.peer_channel(user_id), payload)
+
+    async def _deliver(self, user_id: int, payload: dict) -> None:
+        for ws in list(self.user_sockets.get(int(user_id), set())):
+            try:
+                await (self.wires.get(ws) or Wire(ws)).send(payload)
+            except Exception:
+                try:
+                    await self.unregister_socket(ws)
+                except Exception:
+                    pass
+
+    async def join_room(self, user_id: int, space_id: int) -> None:
+        await self.bus.sadd(f"video:room:{int(space_id)}", int(user_id))
+        await self.bus.sadd(f"video:user-rooms:{int(user_id)}", int(space_id))
+
+    async def leave_room(self, user_id: int, space_id: int) -> None:
+        await self.bus.srem(f"video:room:{int(space_id)}", int(user_id))
+        await self.bus.srem(f"video:user-rooms:{int(user_id)}", int(space_id))
+
+    async def room_users(self, space_id: int) -> Set[int]:
+        return {int(uid) for uid in await self.bus.smembers(f"video:room:{int(space_id)}")}
 
-    def end_meeting(self, space_id: int) -> None:
-        self.meetings.pop(int(space_id), None)
+    async def user_rooms(self, user_id: int) -> Set[int]:
+        return {int(sid) for sid in await self.bus.smembers(f"video:user-rooms:{int(user_id)}")}
+
+    async def get_meeting(self, space_id: int) -> Optional[Dict[str, Any]]:
+        raw = await self.bus.hget("video:meetings", int(space_id))
+        if not raw:
+            return None
+        meeting = json.loads(raw)
+        meeting['participants'] = {int(uid) for uid in await self.bus.smembers(f"video:participants:{int(space_id)}")}
+        return meeting
+
+    async def is_meeting_active(self, space_id: int) -> bool:
+        return bool(await self.bus.hget("video:meetings", int(space_id)))
+
+    async def start_meeting(self, space_id: int, host_id: int) -> None:
+        meeting = {'host_id': int(host_id), 'started_at': time.time()}
+        await self.bus.hset("video:meetings", int(space_id), json.dumps(meeting))
+        await self.bus.hset("video:host-seen", int(host_id), meeting['started_at'])
+        await self.bus.delete(f"video:participants:{int(space_id)}")
+        await self.bus.sadd(f"video:participants:{int(space_id)}", int(host_id))
+
+    async def add_participant(self, space_id: int, user_id: int) -> None:
+        await self.bus.sadd(f"video:participants:{int(space_id)}", int(user_id))
+
+    async def end_meeting(self, space_id: int) -> None:
+        await self.bus.hdel("video:meetings", int(space_id))
+        await self.bus.hdel(sfu.ROOM_FORWARDER_KEY, int(space_id))
+        await self.bus.delete(f"video:participants:{int(space_id)}")
+
+    async def register_forwarder(self, name: str, capacity: Optional[int] = None, local: bool = True) -> None:
+        info = {'capacity': int(capacity or sfu.VIDEO_SFU_CAPACITY), 'seen': time.time()}
+        await self.bus.hset(sfu.FORWARDERS_KEY, name, json.dumps(info))
+        if local:
+            self.local_forwarders.add(name)
+
+    async def unregister_forwarder(self, name: str) -> None:
+        self.local_forwarders.discard(name)
+        await self.bus.hdel(sfu.FORWARDERS_KEY, name)
+
+    async def forwarders(self) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        for name, raw in (await self.bus.hgetall(sfu.FORWARDERS_KEY)).items():
+            try:
+                found[name] = json.loads(raw)
+            except ValueError:
+                continue
+        return found
+
+    async def room_forwarder(self, space_id: int) -> Optional[str]:
+        """The peer id ("sfu:<name>") forwarding this room, None for a mesh room."""
+        name = await self.bus.hget(sfu.ROOM_FORWARDER_KEY, int(space_id))
+        return sfu.forwarder_peer(name) if name else None
+
+    async def forwarded_rooms(self) -> Dict[int, str]:
+        return {int(sid): name for sid, name in (await self.bus.hgetall(sfu.ROOM_FORWARDER_KEY)).items()}
+
+    async def assign_forwarder(self, space_id: int, exclude: Optional[str] = None) -> Optional[str]:
+        """Hand the room to the least loaded live forwarder with room to spare."""
+        now = time.time()
+        load: Dict[str, int] = {}
+        for name in (await self.forwarded_rooms()).values():
+            load[name] = load.get(name, 0) + 1
+        candidates = []
+        for name, info in (await self.forwarders()).items():
+            if name == exclude:
+                continue
+            live = name in self.local_forwarders or now - float(info.get('seen') or 0) <= VIDEO_HOST_GRACE_SECONDS
+            if live and load.get(name, 0) < int(info.get('capacity') or sfu.VIDEO_SFU_CAPACITY):
+                candidates.append((load.get(name, 0), name))
+        if not candidates:
+            return None
+        name = min(candidates)[1]
+        await self.bus.hset(sfu.ROOM_FORWARDER_KEY, int(space_id), name)
+        return sfu.forwarder_peer(name)
+
+    async def release_room_forwarder(self, space_id: int) -> None:
+        await self.bus.hdel(sfu.ROOM_FORWARDER_KEY, int(space_id))
+
+    async def stale_forwarders(self) -> List[str]:
+        """Refresh forwarders held here; return those no worker has seen lately."""
+        now = time.time()
+        stale = []
+        for name, info in (await self.forwarders()).items():
+            if name in self.local_forwarders:
+                await self.register_forwarder(name, info.get('capacity'))
+            elif now - float(info.get('seen') or 0) > VIDEO_HOST_GRACE_SECONDS:
+                stale.append(name)
+        return stale
+
+    async def sweep_sockets(self) -> Set[int]:
+        """Unregister closed sockets; returns users left with no socket here."""
+        released = set()
+        for ws in [ws for ws in list(self.socket_users) if is_closed(ws)]:
+            user_id = await self.unregister_socket(ws)
+            if user_id is not None and user_id not in self.user_sockets:
+                released.add(user_id)
+        return released
+
+    async def orphaned_meetings(self) -> List[int]:
+        """Mark hosts connected here as seen; return meetings whose host is gone.
+
+        The last-seen stamp lives beside the meeting rather than in it, so a
+        refresh can never resurrect a meeting another worker just ended.
+        """
+        now = time.time()
+        orphaned = []
+        for space_id, raw in (await self.bus.hgetall("video:meetings")).items():
+            try:
+                meeting = json.loads(raw)
+                host_id = int(meeting['host_id'])
+            except (ValueError, KeyError, TypeError):
+                orphaned.append(int(space_id))
+                continue
+            if host_id in self.user_sockets:
+                await self.bus.hset("video:host-seen", host_id, now)
+                continue
+            seen = await self.bus.hget("video:host-seen", host_id)
+            last = max(float(seen or 0), float(meeting.get('started_at') or 0))
+            if now - last > VIDEO_HOST_GRACE_SECONDS:
+                orphaned.append(int(space_id))
+        return orphaned
 
 
 video_state = VideoSignalingState()
@@ -715,7 +869,7 @@ app.add_middleware(
 )
 app.mount(
     "/static",
-    StaticFiles(directory=str(Path(__file__).parent.parent / "static")),
+    PrecompressedStaticFiles(directory=str(Path(__file__).parent.parent / "static")),
     name="static",
 )
 # Serve uploaded files under /media
@@ -829,21 +983,20 @@ def ai_slide_action(presentation_id: int, payload: dict = Body(...), current_use
 
                 if pdf_path and fitz is not None:
                     try:
-                        doc = fitz.open(str(pdf_path))
-                        if slide_id < doc.page_count:
-                            page = doc.load_page(slide_id)
-                            extracted = page.get_text("text").strip()
-                            if extracted and len(extracted) > len(slide_text):
-                                slide_text = extracted
-                            # also render an image for vision fallback
-                            try:
-                                mat = fitz.Matrix(2.0, 2.0)
-                                pix = page.get_pixmap(matrix=mat)
-                                import base64
-                                image_b64 = base64.b64encode(pix.tobytes("png")).decode("utf-8")
-                            except Exception:
-                                image_b64 = None
-                        doc.close()
+                        with open_pdf(pdf_path) as doc:
+                            if slide_id < doc.page_count:
+                                page = doc.load_page(slide_id)
+                                extracted = page.get_text("text").strip()
+                                if extracted and len(extracted) > len(slide_text):
+                                    slide_text = extracted
+                                # also render an image for vision fallback
+                                try:
+                                    mat = fitz.Matrix(2.0, 2.0)
+                                    pix = page.get_pixmap(matrix=mat)
+                                    import base64
+                                    image_b64 = base64.b64encode(pix.tobytes("png")).decode("utf-8")
+                                except Exception:
+                                    image_b64 = None
                     except Exception:
                         pass
         except Exception:
@@ -1871,12 +2024,15 @@ def join_space_by_code(payload: dict = Body(...), current_user: User = Depends(g
         # membership.space_id exists via migration bridge; set classroom_id only if it exists
         m = Membership(user_id=current_user.id, classroom_id=s.id, space_id=s.id, role='student')
         session.add(m)
+        sm = None
         try:
             sm = SpaceMessage(space_id=s.id, sender_id=current_user.id, content=f"[system] {current_user.username} joined the space.")
             session.add(sm)
         except Exception:
             pass
         session.commit()
+        if sm is not None:
+            _publish_space_message(sm, current_user)
     return JSONResponse({"ok": True, "space_id": s.id, "message": "Joined space"})
 
 
@@ -2755,6 +2911,7 @@ def leave_classroom(classroom_id: int, current_user: User = Depends(get_current_
             raise HTTPException(status_code=404, detail='Membership not found')
         session.delete(m)
         session.commit()
+        _forget_ws_membership(current_user.id)
         return JSONResponse({'ok': True})
 
 
@@ -2773,6 +2930,7 @@ def leave_space(space_id: int, current_user: User = Depends(get_current_user)):
             raise HTTPException(status_code=404, detail='Membership not found')
         session.delete(m)
         session.commit()
+        _forget_ws_membership(current_user.id)
         return JSONResponse({'ok': True})
 
 
@@ -2888,6 +3046,7 @@ async def classroom_boot_action(
             if not m:
                 continue
             session.delete(m)
+            _forget_ws_membership(u.id)
             removed.append(uname)
             try:
                 cm = ClassroomMessage(classroom_id=classroom_id, sender_id=current_user.id, content=f"[system] {uname} was removed from the classroom.")
@@ -3441,7 +3600,7 @@ def list_library_files(classroom_id: int, current_user: User = Depends(get_curre
 
 
 @app.get('/classrooms/{classroom_id}/library/download/{item_id}')
-def download_library_item(classroom_id: int, item_id: int, current_user: User = Depends(get_current_user)):
+def download_library_item(request: Request, classroom_id: int, item_id: int, current_user: User = Depends(get_current_user)):
     with Session(engine) as session:
         item = session.get(LibraryItem, item_id)
         if not item or item.classroom_id != classroom_id:
@@ -3453,11 +3612,11 @@ def download_library_item(classroom_id: int, item_id: int, current_user: User =
         disk_path = Path(UPLOAD_DIR) / item.filename
         if not disk_path.exists():
             raise HTTPException(status_code=404, detail='File missing on disk')
-        return FileResponse(str(disk_path), media_type=item.mimetype, filename=Path(item.filename).name)
+        return _serve_upload(request, disk_path, filename=Path(item.filename).name, media_type=item.mimetype)
 
 
 @app.get('/submissions/{submission_id}/download')
-def download_submission(submission_id: int, current_user: User = Depends(get_current_user)):
+def download_submission(request: Request, submission_id: int, current_user: User = Depends(get_current_user)):
             """Serve a submission file to authorized users (student who submitted or classroom teacher/admin)."""
             Submission = __import__("app.models").models.Submission
             Assignment = __import__("app.models").models.Assignment
@@ -3522,7 +3681,7 @@ def download_submission(submission_id: int, current_user: User = Depends(get_cur
                         session.commit()
                 except Exception:
                     session.rollback()
-                return FileResponse(str(disk_path), media_type=s.mimetype or 'application/octet-stream', filename=Path(s.filename).name)
+                return _serve_upload(request, disk_path, filename=Path(s.filename).name, media_type=s.mimetype or 'application/octet-stream')
 
     # Assignment creation endpoint
 @app.post('/classrooms/{classroom_id}/assignments')
@@ -3741,15 +3900,6 @@ async def add_current_user_to_request(request: Request, call_next):
         request.state.cookie_consent = None
         request.state.cookie_consent_parsed = None
     response = await call_next(request)
-    # prevent stale CSS in browsers/CDNs after deploys
-    try:
-        path = (request.url.path or '').lower()
-        if path.endswith('.css'):
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-    except Exception:
-        pass
     # Ensure a CSRF token cookie is present for form POSTs (accessible to JS)
     try:
         if not request.cookies.get('csrf_token'):
@@ -3768,6 +3918,38 @@ def favicon():
 def on_startup():
     create_db_and_tables()
     ensure_conversionjob_log_column()
+    artifacts.start_gc_scheduler()
+
+
+_sweeper_task: Optional[asyncio.Task] = None
+_standin_forwarder: Optional[sfu.StandInForwarder] = None
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    global _sweeper_task, _standin_forwarder
+    # lag is only ever read through /api/realtime/stats, so don't sample it otherwise
+    if REALTIME_STATS_TOKEN:
+        loop_monitor.start()
+    if WS_SWEEP_INTERVAL > 0:
+        _sweeper_task = asyncio.ensure_future(_realtime_sweeper())
+    if sfu.VIDEO_STANDIN_SFU:
+        _standin_forwarder = await sfu.StandInForwarder(get_bus(), sfu.VIDEO_STANDIN_SFU).start()
+        await video_state.register_forwarder(sfu.VIDEO_STANDIN_SFU)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    shutdown_local_executor(wait=False)
+    artifacts.stop_gc_scheduler()
+    loop_monitor.stop()
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+    if _standin_forwarder is not None:
+        await _standin_forwarder.stop()
+        await video_state.unregister_forwarder(_standin_forwarder.name)
+    await close_sink()
+    await close_bus()
 
 
 def ensure_conversionjob_log_column():
@@ -3992,24 +4174,11 @@ def get_presentation_signed_url(presentation_id: int, expires: int = 3600, curre
         ).first()
         if job and getattr(job, 'result', None):
             res = job.result
-            if isinstance(res, str) and res.startswith("s3://") and boto3 is not None:
-                # s3://bucket/key
-                try:
-                    parts = res[len("s3://"):].split("/", 1)
-                    bucket = parts[0]
-                    key = parts[1] if len(parts) > 1 else ""
-                    s3 = boto3.client(
-                        "s3",
-                        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                        region_name=os.getenv("AWS_REGION"),
-                    )
-                    url = s3.generate_presigned_url(
-                        "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=int(expires)
-                    )
+            if isinstance(res, str) and res.startswith("s3://"):
+                # s3://bucket/key, signed with the shared client
+                url = presign_s3_uri(res, int(expires))
+                if url:
                     return JSONResponse({"url": url})
-                except Exception:
-                    pass
             else:
                 # local relative path under UPLOAD_DIR (e.g., "hls/123/index.m3u8" or "123_web.mp4")
                 path = f"/uploads/{res}"
@@ -4225,47 +4394,7 @@ def download_signed(request: Request, p: str = Query(...), e: str = Query(...),
     if not os.path.exists(disk):
         raise HTTPException(status_code=404, detail="file not found")
 
-    file_size = os.path.getsize(disk)
-    range_header = request.headers.get("range")
-    if not range_header:
-        # no range requested — serve full file
-        return FileResponse(disk, media_type=mimetypes.guess_type(disk)[0] or "application/octet-stream")
-
-    # parse range: bytes=start-end
-    try:
-        units, rng = range_header.split("=")
-        if units != "bytes":
-            raise ValueError()
-        start_str, end_str = rng.split("-")
-        start = int(start_str) if start_str else 0
-        end = int(end_str) if end_str else file_size - 1
-        if start >= file_size:
-            raise HTTPException(status_code=416, detail="Range Not Satisfiable")
-        end = min(end, file_size - 1)
-        length = end - start + 1
-    except Exception:
-        raise HTTPException(status_code=400, detail="invalid Range header")
-
-    def iterfile(path, start, length):
-        with open(path, "rb") as f:
-            f.seek(start)
-            remaining = length
-            chunk_size = 1024 * 64
-            while remaining > 0:
-                read_size = min(chunk_size, remaining)
-                data = f.read(read_size)
-                if not data:
-                    break
-                remaining -= len(data)
-                yield data
-
-    headers = {
-        "Content-Range": f"bytes {start}-{end}/{file_size}",
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(length),
-    }
-    media_type = mimetypes.guess_type(disk)[0] or "application/octet-stream"
-    return StreamingResponse(iterfile(disk, start, length), status_code=206, media_type=media_type, headers=headers)
+    return _serve_upload(request, disk, inline=True)
 
 
 @app.post("/api/schools")
@@ -4773,8 +4902,8 @@ def list_presentation_ai_results(presentation_id: int, current_user: User = Depe
 @app.post('/api/presentations/{presentation_id}/convert')
 def trigger_presentation_conversion(presentation_id: int, current_user: User = Depends(get_current_user)):
     """Trigger conversion/preview generation for a presentation.
-    Allows owner or classroom teachers to request conversion. Attempts to enqueue a background job
-    and falls back to synchronous conversion if the queue is unavailable.
+    Allows owner or classroom teachers to request conversion. The job runs on RQ when
+    workers are available, otherwise on the in-process conversion pool.
     """
     PresentationModel = __import__("app.models").models.Presentation
     LibraryItem = __import__("app.models").models.LibraryItem
@@ -4793,18 +4922,11 @@ def trigger_presentation_conversion(presentation_id: int, current_user: User = D
                 raise HTTPException(status_code=403, detail='forbidden')
     if not getattr(p, 'filename', None):
         raise HTTPException(status_code=404, detail='file missing')
-    # attempt to enqueue
     try:
         job_id = enqueue_conversion(presentation_id, p.filename)
-        return JSONResponse({'ok': True, 'job_id': job_id})
+        return JSONResponse({'ok': True, 'job_id': job_id, 'status': 'queued'})
     except Exception:
-        # fallback to synchronous conversion for environments without Redis/workers
-        try:
-            from .tasks import convert_presentation
-            convert_presentation(presentation_id, p.filename)
-            return JSONResponse({'ok': True, 'job_id': None, 'note': 'ran synchronously'})
-        except Exception:
-            raise HTTPException(status_code=500, detail='failed to enqueue or run conversion')
+        raise HTTPException(status_code=500, detail='failed to enqueue conversion')
 
 
     @app.post('/api/cookie_consent')
@@ -5461,20 +5583,111 @@ def contact_post(
     return templates.TemplateResponse('contact.html', {'request': request, 'success': 'Thanks — we received your message.'})
 
 
+# most messages a reconnecting client is sent in one replay frame; beyond
+# that it is told to reload the history instead
+REPLAY_MAX_MESSAGES = int(os.getenv("REPLAY_MAX_MESSAGES", "200"))
+
+# Websocket handshakes check room membership through a short-lived per-worker
+# cache, so a client stuck in a reconnect loop does not cost a query per
+# attempt. Leaving or being removed forgets the entry on the worker that
+# handled it; other workers catch up within WS_MEMBERSHIP_TTL. Misses are kept
+# only briefly so a new member can connect right away.
+WS_MEMBERSHIP_TTL = float(os.getenv("WS_MEMBERSHIP_TTL", "30"))
+WS_MEMBERSHIP_MISS_TTL = float(os.getenv("WS_MEMBERSHIP_MISS_TTL", "5"))
+WS_MEMBERSHIP_CACHE_SIZE = 10000
+_ws_membership_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_ws_membership_lock = Lock()
+
+
+def _ws_membership_role(user_id: int, room_id: int, kind: str) -> Optional[str]:
+    """The member's role ('' when unset), or None when not a member.
+
+    ``kind`` 'space' also matches classroom ids (compat during the transition).
+    """
+    if kind == 'classroom':
+        in_room = Membership.classroom_id == room_id
+    else:
+        in_room = (Membership.space_id == room_id) | (Membership.classroom_id == room_id)
+    with Session(engine) as session:
+        mem = session.exec(select(Membership).where((Membership.user_id == user_id) & in_room)).first()
+        return None if mem is None else (mem.role or '')
+
+
+async def _ws_member_role(user_id: int, room_id: int, kind: str = 'space') -> Optional[str]:
+    key = (int(user_id), kind, int(room_id))
+    now = time.monotonic()
+    with _ws_membership_lock:
+        hit = _ws_membership_cache.get(key)
+        if hit is not None and hit[0] > now:
+            _ws_membership_cache.move_to_end(key)
+            return hit[1]
+    loop = asyncio.get_running_loop()
+    role = await loop.run_in_executor(None, _ws_membership_role, key[0], key[2], kind)
+    ttl = WS_MEMBERSHIP_TTL if role is not None else WS_MEMBERSHIP_MISS_TTL
+    with _ws_membership_lock:
+        _ws_membership_cache[key] = (now + ttl, role)
+        _ws_membership_cache.move_to_end(key)
+        while len(_ws_membership_cache) > WS_MEMBERSHIP_CACHE_SIZE:
+            _ws_membership_cache.popitem(last=False)
+    return role
+
+
+def _forget_ws_membership(user_id: int) -> None:
+    with _ws_membership_lock:
+        for key in [key for key in _ws_membership_cache if key[0] == int(user_id)]:
+            del _ws_membership_cache[key]
+
+
+def _ws_resume_from(websocket: WebSocket) -> Optional[int]:
+    """The ``resume_from`` query parameter: the last message id the client has."""
+    try:
+        return int(websocket.query_params['resume_from'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _dm_messages_after(me_id: int, other_id: int, after_id: int, limit: int) -> list:
+    """Messages of the (me, other) conversation only; never a user's whole inbox."""
+    with Session(engine) as session:
+        cond = ((Message.sender_id == me_id) & (Message.recipient_id == other_id)) | (
+            (Message.sender_id == other_id) & (Message.recipient_id == me_id))
+        rows = session.exec(select(Message).where(cond, Message.id > after_id).order_by(Message.id).limit(limit)).all()
+        return [[m.id, m.sender_id, m.recipient_id, m.content, m.file_url, m.created_at.isoformat()] for m in rows]
+
+
+async def _dm_replay(me_id: int, other_id: int, after_id: int) -> dict:
+    """Direct messages since ``after_id`` as compact ``[id, from, to, content, file, created_at]`` rows."""
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(None, _dm_messages_after, me_id, other_id, after_id, REPLAY_MAX_MESSAGES + 1)
+    more = len(rows) > REPLAY_MAX_MESSAGES
+    rows = rows[:REPLAY_MAX_MESSAGES]
+    return {
+        'type': 'replay',
+        'after': after_id,
+        'seq': rows[-1][0] if rows else after_id,
+        'more': more,
+        'messages': rows,
+    }
+
+
 @app.websocket('/ws/chat/{user_id}')
 async def websocket_chat(websocket: WebSocket, user_id: int):
     """Simple WebSocket chat: client must send a join message first:
     {"type": "join", "user_id": <id>} and then messages of form:
-    {"type": "message", "from": <sender>, "to": <recipient>, "content": "..."}
+    {"type": "message", "to": <recipient>, "content": "..."}
+    The sender is always the cookie's user; a client-supplied "from" is ignored.
+    A frame without an integer "to" gets {"type": "error", ...} back.
     """
-    await websocket.accept()
+    wire = Wire.negotiate(websocket)
+    heartbeat = None
+    connected_user_id = None
+    authenticated = False
     try:
         from .database import engine
         from sqlmodel import Session, select
         from .models import Message as MessageModel, User as UserModel
 
-        # try to identify the connected user from the access_token cookie; fall back to path param
-        connected_user_id = user_id
+        # identify the connected user from the access_token cookie
         try:
             cookie_val = websocket.cookies.get('access_token')
             if cookie_val:
@@ -5488,27 +5701,42 @@ async def websocket_chat(websocket: WebSocket, user_id: int):
                         u = s.exec(select(UserModel).where(UserModel.username == uname)).first()
                         if u:
                             connected_user_id = u.id
+                            authenticated = True
         except Exception:
-            connected_user_id = connected_user_id
+            authenticated = False
+
+        # anonymous sockets are refused: the path id alone proves nothing
+        if not authenticated:
+            await websocket.close(code=1008)
+            return
+        if not ws_limiter.admit(websocket, connected_user_id):
+            await websocket.close(code=WS_CLOSE_POLICY)
+            return
+        await websocket.accept(subprotocol=wire.subprotocol)
 
         # register this connection under the resolved connected_user_id
         try:
-            await manager.connect(connected_user_id, websocket)
+            await manager.connect(connected_user_id, websocket, wire=wire)
         except Exception:
             pass
+        resume_from = _ws_resume_from(websocket)
+        if resume_from is not None:
+            await wire.send(await _dm_replay(connected_user_id, user_id, resume_from))
 
+        heartbeat = Heartbeat(websocket, wire=wire).start()
         while True:
-            msg = await websocket.receive_json()
+            msg = await heartbeat.receive_json()
             # support both {type:'message', from:, to:, content:...} and {action:'message', to:, content:...}
             if msg.get('type') == 'message' or msg.get('action') == 'message':
-                sender_id = int(msg.get('from') or msg.get('sender') or connected_user_id)
-                recipient_id = int(msg.get('to'))
+                sender_id = connected_user_id
+                try:
+                    recipient_id = int(msg.get('to'))
+                except (TypeError, ValueError):
+                    await wire.send({'type': 'error', 'message': '"to" must be a user id'})
+                    continue
                 content = msg.get('content')
-                with Session(engine) as session:
-                    m = MessageModel(sender_id=sender_id, recipient_id=recipient_id, content=content)
-                    session.add(m)
-                    session.commit()
-                    session.refresh(m)
+                # batched write; the payload below only goes out once it is committed
+                m = await get_sink().write(MessageModel(sender_id=sender_id, recipient_id=recipient_id, content=content))
                 payload = {
                     'type': 'message',
                     'message': {
@@ -5525,8 +5753,11 @@ async def websocket_chat(websocket: WebSocket, user_id: int):
     except Exception:
         pass
     finally:
+        ws_limiter.release(websocket)
+        if heartbeat is not None:
+            heartbeat.stop()
         try:
-            await manager.disconnect(user_id, websocket)
+            await manager.disconnect(connected_user_id, websocket)
         except Exception:
             pass
 
@@ -5539,7 +5770,7 @@ async def classroom_websocket(websocket: WebSocket, classroom_id: int):
     Client sends payloads like:
     {"type": "message", "content": "Hello"}
     """
-    await websocket.accept()
+    wire = Wire.negotiate(websocket)
     from sqlmodel import select as _select
 
     # resolve current user from access_token cookie
@@ -5561,28 +5792,22 @@ async def classroom_websocket(websocket: WebSocket, classroom_id: int):
         await websocket.close(code=1008)
         return
 
-    # verify classroom membership
-    with Session(engine) as session:
-        mem = session.exec(
-            _select(Membership).where(
-                (Membership.user_id == current_user.id)
-                & (Membership.classroom_id == classroom_id)
-            )
-        ).first()
-        if not mem:
-            await websocket.close(code=1008)
-            return
+    # verify classroom membership; refusing before accept() answers the handshake with 403
+    if await _ws_member_role(current_user.id, classroom_id, 'classroom') is None:
+        await websocket.close(code=1008)
+        return
+    if not ws_limiter.admit(websocket, current_user.id):
+        await websocket.close(code=WS_CLOSE_POLICY)
+        return
+    await websocket.accept(subprotocol=wire.subprotocol)
 
-    # simple in-memory set of connections per classroom
-    if not hasattr(classroom_websocket, '_room_conns'):
-        classroom_websocket._room_conns = {}
-    room_conns: Dict[int, Set[WebSocket]] = classroom_websocket._room_conns
-    room_set = room_conns.setdefault(int(classroom_id), set())
-    room_set.add(websocket)
+    # fan-out goes through the realtime bus so members on other workers receive it
+    outbox = await classroom_rooms.join(classroom_id, websocket, user_id=current_user.id, wire=wire)
+    heartbeat = Heartbeat(websocket, send=outbox.offer, wire=wire).start()
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await heartbeat.receive_json()
             dtype = data.get('type')
             if dtype == 'typing':
                 payload = {
@@ -5592,17 +5817,7 @@ async def classroom_websocket(websocket: WebSocket, classroom_id: int):
                     'status': data.get('status') or 'start',
                 }
                 # broadcast typing to all connected clients in this classroom
-                dead: list[WebSocket] = []
-                for ws in list(room_conns.get(int(classroom_id), set())):
-                    try:
-                        await ws.send_json(payload)
-                    except Exception:
-                        dead.append(ws)
-                for ws in dead:
-                    try:
-                        room_conns.get(int(classroom_id), set()).discard(ws)
-                    except Exception:
-                        pass
+                await classroom_rooms.broadcast(classroom_id, payload)
                 continue
             if dtype == 'seen':
                 payload = {
@@ -5611,32 +5826,18 @@ async def classroom_websocket(websocket: WebSocket, classroom_id: int):
                     'username': current_user.username,
                     'message_id': data.get('message_id'),
                 }
-                dead: list[WebSocket] = []
-                for ws in list(room_conns.get(int(classroom_id), set())):
-                    try:
-                        await ws.send_json(payload)
-                    except Exception:
-                        dead.append(ws)
-                for ws in dead:
-                    try:
-                        room_conns.get(int(classroom_id), set()).discard(ws)
-                    except Exception:
-                        pass
+                await classroom_rooms.broadcast(classroom_id, payload)
                 continue
             if dtype != 'message':
                 continue
             content = (data.get('content') or '').strip()
             if not content:
                 continue
-            with Session(engine) as session:
-                msg = ClassroomMessage(
-                    classroom_id=classroom_id,
-                    sender_id=current_user.id,
-                    content=content,
-                )
-                session.add(msg)
-                session.commit()
-                session.refresh(msg)
+            msg = await get_sink().write(ClassroomMessage(
+                classroom_id=classroom_id,
+                sender_id=current_user.id,
+                content=content,
+            ))
             payload = {
                 'type': 'message',
                 'message': {
@@ -5649,28 +5850,96 @@ async def classroom_websocket(websocket: WebSocket, classroom_id: int):
                 },
             }
             # broadcast to all connected clients in this classroom
-            dead: list[WebSocket] = []
-            for ws in list(room_conns.get(int(classroom_id), set())):
-                try:
-                    await ws.send_json(payload)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                try:
-                    room_conns.get(int(classroom_id), set()).discard(ws)
-                except Exception:
-                    pass
+            await classroom_rooms.broadcast(classroom_id, payload)
     except WebSocketDisconnect:
         pass
     except Exception:
         pass
     finally:
+        ws_limiter.release(websocket)
+        heartbeat.stop()
         try:
-            room_conns.get(int(classroom_id), set()).discard(websocket)
+            await classroom_rooms.leave(classroom_id, websocket)
         except Exception:
             pass
 
 
+def _space_message_payload(msg: SpaceMessage, user: User) -> dict:
+    return {
+        'type': 'message',
+        'seq': msg.id,
+        'message': {
+            'id': msg.id,
+            'space_id': msg.space_id,
+            'sender_id': msg.sender_id,
+            'sender_name': user.username,
+            'username': user.username,
+            'full_name': user.full_name,
+            'avatar': user.avatar,
+            'site_role': user.site_role,
+            'content': msg.content,
+            'created_at': msg.created_at.isoformat(),
+        },
+    }
+
+
+def _publish_space_message(msg: SpaceMessage, user: User) -> None:
+    """Send a message committed outside the websocket (REST, system notices) to the room.
+
+    Every space message goes through the room so its replay ring stays gap-free.
+    Called from threadpool endpoints.
+    """
+    try:
+        anyio.from_thread.run(space_rooms.broadcast, msg.space_id, _space_message_payload(msg, user))
+    except Exception:
+        logger.debug("could not publish space message %s", getattr(msg, 'id', None), exc_info=True)
+
+
+def _space_messages_after(space_id: int, after_id: int, limit: int) -> list:
+    with Session(engine) as session:
+        rows = session.exec(
+            select(SpaceMessage, User)
+            .join(User, User.id == SpaceMessage.sender_id)
+            .where(SpaceMessage.space_id == space_id, SpaceMessage.id > after_id)
+            .order_by(SpaceMessage.id)
+            .limit(limit)
+        ).all()
+        return [_space_message_payload(msg, user) for msg, user in rows]
+
+
+def _compact_replay(after_id: int, events: list, more: bool) -> dict:
+    """One frame for the missed messages: ``[seq, sender_id, content, created_at]`` rows,
+    with each sender's details listed once."""
+    users = {}
+    rows = []
+    for event in events:
+        m = event['message']
+        users.setdefault(str(m['sender_id']), {
+            'username': m.get('username') or m.get('sender_name'),
+            'full_name': m.get('full_name'),
+            'avatar': m.get('avatar'),
+            'site_role': m.get('site_role'),
+        })
+        rows.append([m['id'], m['sender_id'], m['content'], m['created_at']])
+    return {
+        'type': 'replay',
+        'after': after_id,
+        'seq': rows[-1][0] if rows else after_id,
+        'more': more,
+        'users': users,
+        'messages': rows,
+    }
+
+
+async def _space_replay(space_id: int, after_id: int) -> dict:
+    events = space_rooms.replay(space_id, after_id)
+    if events is None:
+        loop = asyncio.get_running_loop()
+        events = await loop.run_in_executor(None, _space_messages_after, space_id, after_id, REPLAY_MAX_MESSAGES + 1)
+    more = len(events) > REPLAY_MAX_MESSAGES
+    return _compact_replay(after_id, events[:REPLAY_MAX_MESSAGES], more)
+
+
 @app.websocket('/ws/spaces/{space_id}')
 async def space_websocket(websocket: WebSocket, space_id: int):
     """Group chat WebSocket for a specific space.
@@ -5678,8 +5947,11 @@ async def space_websocket(websocket: WebSocket, space_id: int):
     All connected space members receive broadcast messages.
     Client sends payloads like:
     {"type": "message", "content": "Hello"}
+
+    Connecting with ``?resume_from=<last message id>`` first sends a
+    ``replay`` frame with the messages posted since.
     """
-    await websocket.accept()
+    wire = Wire.negotiate(websocket)
     from sqlmodel import select as _select
 
     # resolve current user from access_token cookie
@@ -5701,31 +5973,32 @@ async def space_websocket(websocket: WebSocket, space_id: int):
         await websocket.close(code=1008)
         return
 
-    # verify space membership (compat: accept classroom_id during transition)
-    with Session(engine) as session:
-        mem = session.exec(
-            _select(Membership).where(
-                (Membership.user_id == current_user.id)
-                & (
-                    (Membership.space_id == space_id)
-                    | (Membership.classroom_id == space_id)
-                )
-            )
-        ).first()
-        if not mem:
-            await websocket.close(code=1008)
-            return
-
-    # simple in-memory set of connections per space
-    if not hasattr(space_websocket, '_room_conns'):
-        space_websocket._room_conns = {}
-    room_conns: Dict[int, Set[WebSocket]] = space_websocket._room_conns
-    room_set = room_conns.setdefault(int(space_id), set())
-    room_set.add(websocket)
+    # verify space membership (compat: accept classroom_id during transition);
+    # refusing before accept() answers the handshake with 403
+    if await _ws_member_role(current_user.id, space_id) is None:
+        await websocket.close(code=1008)
+        return
+    if not ws_limiter.admit(websocket, current_user.id):
+        await websocket.close(code=WS_CLOSE_POLICY)
+        return
+    await websocket.accept(subprotocol=wire.subprotocol)
+
+    # fan-out goes through the realtime bus so members on other workers receive it
+    resume_from = _ws_resume_from(websocket)
+    outbox = await space_rooms.join(space_id, websocket, user_id=current_user.id,
+                                    paused=resume_from is not None, wire=wire)
+    if resume_from is not None:
+        # live messages queue behind the replay; the client skips ids it already has
+        try:
+            await wire.send(await _space_replay(space_id, resume_from))
+        except Exception:
+            logger.debug("space replay failed", exc_info=True)
+        outbox.start()
+    heartbeat = Heartbeat(websocket, send=outbox.offer, wire=wire).start()
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await heartbeat.receive_json()
             dtype = data.get('type')
             if dtype == 'typing':
                 payload = {
@@ -5734,17 +6007,7 @@ async def space_websocket(websocket: WebSocket, space_id: int):
                     'username': current_user.username,
                     'status': data.get('status') or 'start',
                 }
-                dead: list[WebSocket] = []
-                for ws in list(room_conns.get(int(space_id), set())):
-                    try:
-                        await ws.send_json(payload)
-                    except Exception:
-                        dead.append(ws)
-                for ws in dead:
-                    try:
-                        room_conns.get(int(space_id), set()).discard(ws)
-                    except Exception:
-                        pass
+                await space_rooms.broadcast(space_id, payload, exclude_user_id=current_user.id)
                 continue
             if dtype == 'seen':
                 payload = {
@@ -5753,61 +6016,28 @@ async def space_websocket(websocket: WebSocket, space_id: int):
                     'username': current_user.username,
                     'message_id': data.get('message_id'),
                 }
-                dead: list[WebSocket] = []
-                for ws in list(room_conns.get(int(space_id), set())):
-                    try:
-                        await ws.send_json(payload)
-                    except Exception:
-                        dead.append(ws)
-                for ws in dead:
-                    try:
-                        room_conns.get(int(space_id), set()).discard(ws)
-                    except Exception:
-                        pass
+                await space_rooms.broadcast(space_id, payload)
                 continue
             if dtype != 'message':
                 continue
             content = (data.get('content') or '').strip()
             if not content:
                 continue
-            with Session(engine) as session:
-                msg = SpaceMessage(
-                    space_id=space_id,
-                    sender_id=current_user.id,
-                    content=content,
-                )
-                session.add(msg)
-                session.commit()
-                session.refresh(msg)
-            payload = {
-                'type': 'message',
-                'message': {
-                    'id': msg.id,
-                    'space_id': space_id,
-                    'sender_id': current_user.id,
-                    'sender_name': current_user.username,
-                    'content': msg.content,
-                    'created_at': msg.created_at.isoformat(),
-                },
-            }
-            dead: list[WebSocket] = []
-            for ws in list(room_conns.get(int(space_id), set())):
-                try:
-                    await ws.send_json(payload)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                try:
-                    room_conns.get(int(space_id), set()).discard(ws)
-                except Exception:
-                    pass
+            msg = await get_sink().write(SpaceMessage(
+                space_id=space_id,
+                sender_id=current_user.id,
+                content=content,
+            ))
+            await space_rooms.broadcast(space_id, _space_message_payload(msg, current_user))
     except WebSocketDisconnect:
         pass
     except Exception:
         pass
     finally:
+        ws_limiter.release(websocket)
+        heartbeat.stop()
         try:
-            room_conns.get(int(space_id), set()).discard(websocket)
+            await space_rooms.leave(space_id, websocket)
         except Exception:
             pass
 
@@ -5860,51 +6090,156 @@ def _video_get_ws_user(websocket: WebSocket) -> Optional[User]:
         return None
 
 
-async def _video_send_to_user(user_id: int, payload: dict) -> None:
-    conns = list(video_state.user_sockets.get(int(user_id), set()))
-    for ws in conns:
-        try:
-            await ws.send_json(payload)
-        except Exception:
-            try:
-                video_state.unregister_socket(ws)
-            except Exception:
-                pass
+async def _video_send_to_user(user_id: sfu.Peer, payload: dict) -> None:
+    await video_state.send_to_user(user_id, payload)
 
 
 async def _video_broadcast_room(space_id: int, payload: dict, exclude_user_id: Optional[int] = None) -> None:
-    user_ids = list(video_state.room_users.get(int(space_id), set()))
+    user_ids = list(await video_state.room_users(space_id))
     for uid in user_ids:
         if exclude_user_id is not None and int(uid) == int(exclude_user_id):
             continue
         await _video_send_to_user(uid, payload)
 
 
+def _video_wants_forwarder(room_size: int) -> bool:
+    return sfu.VIDEO_TOPOLOGY == 'sfu' or (sfu.VIDEO_TOPOLOGY == 'auto' and room_size > sfu.VIDEO_MESH_MAX)
+
+
+def _video_topology(space_id: int, forwarder: Optional[str], room_size: int) -> dict:
+    """How participants of a room connect: to each other, or all to ``forwarder``.
+
+    A mesh room has no cap: past VIDEO_MESH_MAX it is only still a mesh because
+    no forwarder could take it, so it keeps admitting people with a warning.
+    """
+    topology = {
+        "space_id": space_id,
+        "topology": "sfu" if forwarder else "mesh",
+        "forwarder": forwarder,
+        "max_participants": sfu.VIDEO_MAX_PARTICIPANTS if forwarder else None,
+        "max_layer": sfu.layer_cap(room_size),
+        "layers": sfu.SIMULCAST_LAYERS if forwarder else [],
+    }
+    if not forwarder and room_size > sfu.VIDEO_MESH_MAX:
+        topology["warning"] = "mesh-oversized"
+    return topology
+
+
+async def _video_forwarder_sync(space_id: int, forwarder: Optional[str], joined=(), left=()) -> None:
+    """Tell a room's forwarder who came and went, and the layer cap for the new size."""
+    if not forwarder:
+        return
+    size = len(await video_state.room_users(space_id))
+    cap = sfu.layer_cap(size)
+    for uid in joined:
+        await _video_send_to_user(forwarder, {
+            "event": "participant-joined",
+            "payload": {"space_id": space_id, "user_id": int(uid), "max_layer": cap},
+        })
+    for uid in left:
+        await _video_send_to_user(forwarder, {
+            "event": "participant-left",
+            "payload": {"space_id": space_id, "user_id": int(uid)},
+        })
+    await _video_send_to_user(forwarder, {
+        "event": "room-config",
+        "payload": {"space_id": space_id, "participants": size, "max_layer": cap},
+    })
+
+
+async def _video_reassign_rooms(name: str) -> None:
+    """Move rooms off a forwarder that went away; rooms nobody can take fall back to mesh."""
+    for space_id, current in (await video_state.forwarded_rooms()).items():
+        if current != name:
+            continue
+        await video_state.release_room_forwarder(space_id)
+        forwarder = await video_state.assign_forwarder(space_id, exclude=name)
+        users = await video_state.room_users(space_id)
+        await _video_broadcast_room(space_id, {
+            "event": "topology",
+            "payload": _video_topology(space_id, forwarder, len(users)),
+        })
+        await _video_forwarder_sync(space_id, forwarder, joined=users)
+
+
+async def _video_forwarder_session(websocket: WebSocket, wire: Wire, name: str) -> None:
+    """Signaling for a forwarder process (see app/sfu.py): it relays to and from users."""
+    token = websocket.headers.get('x-sfu-token') or ''
+    if not name or not sfu.VIDEO_SFU_TOKEN or not hmac.compare_digest(token, sfu.VIDEO_SFU_TOKEN):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept(subprotocol=wire.subprotocol)
+    peer = sfu.forwarder_peer(name)
+    channel = sfu.peer_channel(peer)
+
+    async def deliver(payload: dict) -> None:
+        try:
+            await wire.send(payload)
+        except Exception:
+            pass
+
+    try:
+        capacity = int(websocket.query_params.get('capacity') or 0) or None
+    except ValueError:
+        capacity = None
+    await video_state.bus.subscribe(channel, deliver)
+    await video_state.register_forwarder(name, capacity)
+    # forwarders relay signaling for whole rooms, so they are not rate limited
+    heartbeat = Heartbeat(websocket, wire=wire, rate=0).start()
+    try:
+        while True:
+            data = await heartbeat.receive_json()
+            event = data.get('event') or data.get('type')
+            payload = data.get('payload') or {}
+            if event in ['offer', 'answer', 'ice-candidate']:
+                target_id = sfu.parse_peer(payload.get('target_id'))
+                if not isinstance(target_id, int):
+                    continue
+                await _video_send_to_user(target_id, {"event": event, "payload": dict(payload, sender_id=peer)})
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.debug("forwarder %s session failed", name, exc_info=True)
+    finally:
+        heartbeat.stop()
+        await video_state.bus.unsubscribe(channel, deliver)
+        await video_state.unregister_forwarder(name)
+        await _video_reassign_rooms(name)
+
+
 @app.get('/api/video/config')
 def video_config(current_user: User = Depends(get_current_user)):
     return {"iceServers": _video_get_ice_servers()}
 
 
 @app.get('/api/spaces/{space_id}/meeting')
-def space_meeting_status(space_id: int, current_user: User = Depends(get_current_user)):
+async def space_meeting_status(space_id: int, current_user: User = Depends(get_current_user)):
     return {
         "space_id": int(space_id),
-        "active": video_state.is_meeting_active(space_id),
+        "active": await video_state.is_meeting_active(space_id),
     }
 
 
 @app.websocket('/ws/video')
 async def video_signaling(websocket: WebSocket):
-    await websocket.accept()
+    wire = Wire.negotiate(websocket)
+    if websocket.query_params.get('sfu') is not None:
+        await _video_forwarder_session(websocket, wire, websocket.query_params.get('sfu'))
+        return
     current_user = _video_get_ws_user(websocket)
     if not current_user:
         await websocket.close(code=1008)
         return
-    video_state.register_socket(current_user.id, websocket)
+    if not ws_limiter.admit(websocket, current_user.id):
+        await websocket.close(code=WS_CLOSE_POLICY)
+        return
+    await websocket.accept(subprotocol=wire.subprotocol)
+    await video_state.register_socket(current_user.id, websocket, wire)
+    heartbeat = Heartbeat(websocket, wire=wire, rate=VIDEO_MSG_RATE, burst=VIDEO_MSG_BURST).start()
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await heartbeat.receive_json()
             event = data.get('event') or data.get('type')
             payload = data.get('payload') or {}
 
@@ -5912,34 +6247,47 @@ async def video_signaling(websocket: WebSocket):
                 room_id = payload.get('room_id')
                 space_id = _video_parse_space_id(room_id)
                 if not space_id:
-                    await websocket.send_json({"event": "error", "payload": {"message": "Invalid room"}})
+                    await wire.send({"event": "error", "payload": {"message": "Invalid room"}})
                     continue
 
-                with Session(engine) as session:
-                    mem = session.exec(
-                        select(Membership).where(
-                            (Membership.user_id == current_user.id)
-                            & ((Membership.space_id == space_id) | (Membership.classroom_id == space_id))
-                        )
-                    ).first()
-                if not mem:
-                    await websocket.send_json({"event": "error", "payload": {"message": "Not a member of this space"}})
+                role = await _ws_member_role(current_user.id, space_id)
+                if role is None:
+                    await wire.send({"event": "error", "payload": {"message": "Not a member of this space"}})
                     continue
 
-                if not video_state.is_meeting_active(space_id):
-                    if mem.role not in ['teacher', 'admin']:
-                        await websocket.send_json({"event": "meeting-inactive", "payload": {"space_id": space_id}})
+                if not await video_state.is_meeting_active(space_id):
+                    if role not in ['teacher', 'admin']:
+                        await wire.send({"event": "meeting-inactive", "payload": {"space_id": space_id}})
+                        continue
+                    await video_state.start_meeting(space_id, current_user.id)
+
+                users = await video_state.room_users(space_id)
+                forwarder = await video_state.room_forwarder(space_id)
+                if current_user.id not in users:
+                    if forwarder is None and _video_wants_forwarder(len(users) + 1):
+                        forwarder = await video_state.assign_forwarder(space_id)
+                        if forwarder is not None and users:
+                            # the mesh is outgrown: everyone renegotiates with the forwarder
+                            await _video_broadcast_room(space_id, {
+                                "event": "topology",
+                                "payload": _video_topology(space_id, forwarder, len(users) + 1),
+                            })
+                            await _video_forwarder_sync(space_id, forwarder, joined=users)
+                        elif forwarder is None:
+                            logger.warning("video room %s outgrew the mesh but no forwarder is free", space_id)
+                    cap = _video_topology(space_id, forwarder, len(users))["max_participants"]
+                    if cap is not None and len(users) >= cap:
+                        await wire.send({"event": "room-full", "payload": {"space_id": space_id, "max_participants": cap}})
                         continue
-                    video_state.start_meeting(space_id, current_user.id)
 
-                video_state.join_room(current_user.id, space_id)
-                if video_state.meetings.get(space_id):
-                    video_state.meetings[space_id]['participants'].add(current_user.id)
+                await video_state.join_room(current_user.id, space_id)
+                await video_state.add_participant(space_id, current_user.id)
+                await _video_forwarder_sync(space_id, forwarder, joined=[current_user.id])
 
-                existing_users = [uid for uid in video_state.room_users.get(space_id, set()) if uid != current_user.id]
-                await websocket.send_json({
+                existing_users = [uid for uid in await video_state.room_users(space_id) if uid != current_user.id]
+                await wire.send({
                     "event": "room-users",
-                    "payload": {"space_id": space_id, "users": existing_users},
+                    "payload": dict(_video_topology(space_id, forwarder, len(existing_users) + 1), users=existing_users),
                 })
                 await _video_broadcast_room(space_id, {
                     "event": "user-joined",
@@ -5952,22 +6300,12 @@ async def video_signaling(websocket: WebSocket):
                 space_id = _video_parse_space_id(room_id)
                 if not space_id:
                     continue
-                video_state.leave_room(current_user.id, space_id)
-                await _video_broadcast_room(space_id, {
-                    "event": "user-left",
-                    "payload": {"space_id": space_id, "user_id": current_user.id},
-                })
-                meeting = video_state.meetings.get(space_id)
-                if meeting and meeting.get('host_id') == current_user.id:
-                    video_state.end_meeting(space_id)
-                    await _video_broadcast_room(space_id, {
-                        "event": "meeting-ended",
-                        "payload": {"space_id": space_id},
-                    })
+                await _video_leave(current_user.id, space_id)
                 continue
 
             if event in ['offer', 'answer', 'ice-candidate']:
-                target_id = payload.get('target_id')
+                # target_id is a user, or the room's forwarder ("sfu:<name>")
+                target_id = sfu.parse_peer(payload.get('target_id'))
                 if not target_id:
                     continue
                 forward_payload = dict(payload)
@@ -5976,15 +6314,37 @@ async def video_signaling(websocket: WebSocket):
                     "sender_username": current_user.username,
                 })
                 forward = {"event": event, "payload": forward_payload}
-                await _video_send_to_user(int(target_id), forward)
+                await _video_send_to_user(target_id, forward)
                 continue
 
-            if event == 'call-user':
-                target_id = payload.get('target_id')
-                if not target_id:
+            if event == 'select-layer':
+                # a subscriber asks for another simulcast layer of one publisher;
+                # the room's size caps what it gets
+                space_id = _video_parse_space_id(payload.get('room_id'))
+                publisher_id = sfu.parse_peer(payload.get('publisher_id'))
+                forwarder = await video_state.room_forwarder(space_id) if space_id else None
+                if not forwarder or not isinstance(publisher_id, int):
                     continue
-                await _video_send_to_user(int(target_id), {
-                    "event": "incoming-call",
+                users = await video_state.room_users(space_id)
+                if current_user.id not in users:
+                    continue
+                await _video_send_to_user(forwarder, {
+                    "event": "select-layer",
+                    "payload": {
+                        "space_id": space_id,
+                        "subscriber_id": current_user.id,
+                        "publisher_id": publisher_id,
+                        "layer": sfu.clamp_layer(payload.get('layer'), len(users)),
+                    },
+                })
+                continue
+
+            if event == 'call-user':
+                target_id = payload.get('target_id')
+                if not target_id:
+                    continue
+                await _video_send_to_user(int(target_id), {
+                    "event": "incoming-call",
                     "payload": {
                         "call_id": payload.get('call_id'),
                         "from_id": current_user.id,
@@ -6014,21 +6374,110 @@ async def video_signaling(websocket: WebSocket):
     except Exception:
         pass
     finally:
-        user_id = video_state.unregister_socket(websocket)
+        ws_limiter.release(websocket)
+        heartbeat.stop()
+        user_id = await video_state.unregister_socket(websocket)
         if user_id is not None:
-            for space_id in list(video_state.user_rooms.get(int(user_id), set())):
-                video_state.leave_room(int(user_id), int(space_id))
-                await _video_broadcast_room(int(space_id), {
-                    "event": "user-left",
-                    "payload": {"space_id": int(space_id), "user_id": int(user_id)},
-                })
-                meeting = video_state.meetings.get(int(space_id))
-                if meeting and meeting.get('host_id') == int(user_id):
-                    video_state.end_meeting(int(space_id))
-                    await _video_broadcast_room(int(space_id), {
-                        "event": "meeting-ended",
-                        "payload": {"space_id": int(space_id)},
-                    })
+            await _video_release_user(user_id)
+
+
+async def _video_leave(user_id: int, space_id: int) -> None:
+    """Take a user out of a room; the host leaving ends the meeting."""
+    forwarder = await video_state.room_forwarder(space_id)
+    await video_state.leave_room(int(user_id), int(space_id))
+    await _video_broadcast_room(int(space_id), {
+        "event": "user-left",
+        "payload": {"space_id": int(space_id), "user_id": int(user_id)},
+    })
+    meeting = await video_state.get_meeting(int(space_id))
+    if meeting and meeting.get('host_id') == int(user_id):
+        await _video_end_meeting(int(space_id))
+    else:
+        await _video_forwarder_sync(int(space_id), forwarder, left=[user_id])
+
+
+async def _video_end_meeting(space_id: int, clear_room: bool = False) -> None:
+    forwarder = await video_state.room_forwarder(space_id)
+    await video_state.end_meeting(space_id)
+    await _video_broadcast_room(space_id, {
+        "event": "meeting-ended",
+        "payload": {"space_id": int(space_id)},
+    })
+    if clear_room:
+        for uid in await video_state.room_users(space_id):
+            await video_state.leave_room(uid, space_id)
+    if forwarder:
+        await _video_send_to_user(forwarder, {"event": "room-closed", "payload": {"space_id": int(space_id)}})
+
+
+async def _video_release_user(user_id: int) -> None:
+    """Take a disconnected user out of their rooms, ending meetings they hosted."""
+    for space_id in list(await video_state.user_rooms(int(user_id))):
+        await _video_leave(int(user_id), int(space_id))
+
+
+async def sweep_realtime() -> dict:
+    """One pass over this worker's connection maps and the shared meetings.
+
+    Handlers clean up after themselves; this catches what they missed (a
+    socket that died mid-send, a host whose worker crashed).
+    """
+    released = await video_state.sweep_sockets()
+    for user_id in released:
+        await _video_release_user(user_id)
+    ended = await video_state.orphaned_meetings()
+    for space_id in ended:
+        logger.info("ending video meeting %s: host gone", space_id)
+        await _video_end_meeting(space_id, clear_room=True)
+    lost = await video_state.stale_forwarders()
+    for name in lost:
+        logger.info("video forwarder %s gone; reassigning its rooms", name)
+        await video_state.unregister_forwarder(name)
+        await _video_reassign_rooms(name)
+    return {
+        'chat': await manager.sweep(),
+        'spaces': await space_rooms.sweep(),
+        'classrooms': await classroom_rooms.sweep(),
+        'video': len(released),
+        'meetings_ended': len(ended),
+        'forwarders_lost': len(lost),
+        'admission': ws_limiter.sweep(),
+    }
+
+
+async def _realtime_sweeper() -> None:
+    while True:
+        await asyncio.sleep(WS_SWEEP_INTERVAL)
+        try:
+            swept = await sweep_realtime()
+            if any(swept.values()):
+                logger.info("realtime sweep: %s", swept)
+        except Exception:
+            logger.warning("realtime sweep failed", exc_info=True)
+
+
+def _save_chat_upload(user_id: int, file: UploadFile) -> tuple:
+    """Store a chat attachment; returns (file_url, thumbnail_url).
+
+    Image previews are WebP derivatives rendered by a background task; the
+    thumbnail URL serves the original until the derivative exists.
+    """
+    name = Path(file.filename or "file").name
+    # a fresh key per upload, so two attachments with the same name never
+    # overwrite each other; the original name only travels in the URL's query
+    rel_path = f"chat/{int(user_id)}/{uuid.uuid4().hex}{Path(name).suffix.lower()}"
+    dest = Path(UPLOAD_DIR) / rel_path
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with dest.open('wb') as f:
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
+    # store a web-accessible path (served at /uploads/...)
+    file_url = f"/uploads/{rel_path}?name={quote(name)}"
+    artifacts.record_artifact(rel_path, "chat", user_id)
+    thumbnail_url = None
+    if is_raster(name):
+        enqueue_image_derivatives(rel_path, "chat")
+        thumbnail_url = image_url(rel_path, "chat", 320)
+    return file_url, thumbnail_url
 
 
 @app.post('/api/chat/send')
@@ -6041,30 +6490,9 @@ def api_chat_send(to: int = Body(...), content: str = Body('', embed=True), file
     from pathlib import Path
 
     file_url = None
+    thumbnail_url = None
     if file is not None:
-        upload_dir = Path(UPLOAD_DIR) / 'chat' / str(current.id)
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        dest = upload_dir / file.filename
-        with dest.open('wb') as f:
-            shutil.copyfileobj(file.file, f)
-        # store a web-accessible path (served at /uploads/...)
-        file_url = f"/uploads/chat/{current.id}/{quote(file.filename)}"
-        # generate thumbnail for images if Pillow is available
-        thumbnail_url = None
-        if Image is not None:
-            try:
-                img = Image.open(dest)
-                img.thumbnail((300, 300))
-                thumb_dir = upload_dir / 'thumbs'
-                thumb_dir.mkdir(parents=True, exist_ok=True)
-                thumb_name = f"thumb_{file.filename}"
-                thumb_path = thumb_dir / thumb_name
-                img.save(thumb_path)
-                thumbnail_url = f"/uploads/chat/{current.id}/thumbs/{quote(thumb_name)}"
-            except Exception:
-                thumbnail_url = None
-        else:
-            thumbnail_url = None
+        file_url, thumbnail_url = _save_chat_upload(current.id, file)
 
     with Session(engine) as session:
         # Allow any authenticated user to send chat messages; tighten this
@@ -6408,26 +6836,7 @@ async def api_post_message(other_id: int, request: Request, file: UploadFile | N
     file_url = None
     thumbnail_url = None
     if file is not None:
-        upload_dir = Path(UPLOAD_DIR) / 'chat' / str(current.id)
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        dest = upload_dir / file.filename
-        with dest.open('wb') as f:
-            shutil.copyfileobj(file.file, f)
-        # store a web-accessible path (served at /uploads/...)
-        file_url = f"/uploads/chat/{current.id}/{quote(file.filename)}"
-        # generate thumbnail for images when Pillow is available
-        if Image is not None:
-            try:
-                img = Image.open(dest)
-                img.thumbnail((300, 300))
-                thumb_dir = upload_dir / 'thumbs'
-                thumb_dir.mkdir(parents=True, exist_ok=True)
-                thumb_name = f"thumb_{file.filename}"
-                thumb_path = thumb_dir / thumb_name
-                img.save(thumb_path)
-                thumbnail_url = f"/uploads/chat/{current.id}/thumbs/{quote(thumb_name)}"
-            except Exception:
-                thumbnail_url = None
+        file_url, thumbnail_url = await run_in_threadpool(_save_chat_upload, current.id, file)
 
     with Session(engine) as session:
         # Optionally enforce that the sender follows the recipient; for now
@@ -6528,9 +6937,57 @@ def api_resolve_username(username: str = Query(None)):
         return JSONResponse({'id': u.id, 'username': u.username})
 
 
+# /api/realtime/stats is only served when this is set, to requests sending it
+# as X-Stats-Token (scripts/ws_benchmark.py reads it during load tests). The
+# event-loop lag monitor only runs when it is set.
+REALTIME_STATS_TOKEN = os.getenv("REALTIME_STATS_TOKEN", "")
+
+
+@app.get('/api/realtime/stats')
+async def realtime_stats(request: Request):
+    """Socket counts, room backlog, event-loop lag and memory of this worker."""
+    supplied = request.headers.get('x-stats-token', '')
+    if not REALTIME_STATS_TOKEN or not secrets.compare_digest(supplied, REALTIME_STATS_TOKEN):
+        raise HTTPException(status_code=404, detail='Not Found')
+    return JSONResponse({
+        'pid': os.getpid(),
+        'bus': get_bus().name,
+        'chat': manager.stats(),
+        'spaces': space_rooms.stats(),
+        'classrooms': classroom_rooms.stats(),
+        'video': {'users': len(video_state.user_sockets), 'sockets': len(video_state.socket_users)},
+        'admission': ws_limiter.stats(),
+        'loop_lag': loop_monitor.snapshot(),
+        'rss_bytes': process_rss_bytes(),
+    })
+
+
+ONLINE_BULK_MAX_IDS = 500
+
+
+@app.get('/api/online')
+async def api_online_bulk(ids: str = '', current: User = Depends(get_current_user)):
+    """Presence for many users at once: ``/api/online?ids=1,2,3`` -> ``{"online": [1, 3]}``.
+
+    Only users in the caller's presence audience (and the caller) are reported;
+    other ids are dropped, as if offline.
+    """
+    try:
+        wanted = {int(part) for part in ids.split(',') if part.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail='ids must be comma-separated integers')
+    if len(wanted) > ONLINE_BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f'at most {ONLINE_BULK_MAX_IDS} ids per request')
+    if wanted:
+        visible = await run_in_threadpool(_presence_audience, current.id)
+        wanted &= visible | {current.id}
+    online = await manager.online(wanted) if wanted else set()
+    return JSONResponse({'online': sorted(online)})
+
+
 @app.get('/api/online/{user_id}')
-def api_online(user_id: int):
-    return JSONResponse({'online': manager.is_online(user_id)})
+async def api_online(user_id: int):
+    return JSONResponse({'online': bool(await manager.online([user_id]))})
 
 
 @app.post('/api/register')
@@ -6719,6 +7176,191 @@ def upload_get(
     )
 
 
+PRESENTATION_UPLOAD_EXTS = {".pdf", ".ppt", ".pptx", ".pptm", ".mp4", ".mov", ".m4v", ".webm"}
+CONVERTIBLE_UPLOAD_EXTS = {".ppt", ".pptx", ".pptm", ".mp4", ".mov", ".m4v", ".webm"}
+
+
+def _suggest_ai_metadata(save_path: Path, title: str, description: str, ingest=None):
+    """Best-effort AI title/description when the provided ones are missing or short.
+
+    With an IngestResult the sample text comes from the ingest tee; otherwise
+    a PDF is opened to read its first pages.
+    """
+    ai_title = None
+    ai_description = None
+    try:
+        needs_title = len(title.strip()) < 6
+        needs_desc = len(description.strip()) < 12
+        if needs_title or needs_desc:
+            sample_text = ingest.sample_text if ingest is not None else ""
+            if ingest is None and save_path.suffix.lower() == ".pdf" and fitz is not None:
+                try:
+                    with open_pdf(save_path) as doc:
+                        sample_text = "\n".join([doc[i].get_text() for i in range(min(len(doc), 3))])
+                except Exception:
+                    sample_text = ""
+            prompt = (
+                "Generate a clean title and a 1-2 sentence description for this presentation. "
+                "Return JSON with keys 'title' and 'description' only.\n\n"
+                f"Original title: {title}\n"
+                f"Existing description: {description}\n"
+                f"Extracted text: {sample_text[:2000]}"
+            )
+            ai_raw = chat_completion(
+                [{"role": "user", "content": prompt}],
+                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini") if get_ai_provider() == "openai" else os.getenv("OLLAMA_MODEL", "qwen2.5:3b"),
+                max_tokens=220,
+                temperature=0.4,
+            )
+            try:
+                parsed = json.loads(ai_raw.strip())
+                ai_title = (parsed.get("title") or "").strip() or None
+                ai_description = (parsed.get("description") or "").strip() or None
+            except Exception:
+                # fallback: split first line as title, rest as description
+                parts = [p.strip() for p in ai_raw.split("\n") if p.strip()]
+                if parts:
+                    ai_title = parts[0][:120]
+                    if len(parts) > 1:
+                        ai_description = " ".join(parts[1:])[:400]
+    except Exception:
+        pass
+    return ai_title, ai_description
+
+
+def _create_presentation_from_upload(
+    current_user: User,
+    unique_name: str,
+    original_filename: str,
+    content_type: Optional[str] = None,
+    title: Optional[str] = None,
+    description: Optional[str] = None,
+    tags: Optional[str] = None,
+    category: Optional[str] = None,
+    privacy: str = "public",
+    allow_download: bool = True,
+    ingest=None,
+) -> dict:
+    """Create the Presentation for a file already saved under UPLOAD_DIR.
+
+    Shared by the upload form, the upload API and resumable uploads. ``ingest``
+    is the IngestResult from the write pass (size, hash, sniffed type, text).
+    Returns ``{"id", "title", "filename", "conversion_status"}``. Blocking (remote
+    storage put, AI metadata, DB): async handlers call it via run_in_threadpool.
+    """
+    save_path = Path(UPLOAD_DIR) / unique_name
+    file_ext = save_path.suffix.lower()
+    title_clean = (title or "").strip() or Path(original_filename).stem
+    desc_clean = (description or "").strip()
+    ai_title, ai_description = _suggest_ai_metadata(save_path, title_clean, desc_clean, ingest=ingest)
+    storage = get_storage()
+    if storage.remote:
+        # the local file stays as this node's working copy for conversion
+        try:
+            storage.put_file(save_path, unique_name, content_type=(ingest.mimetype if ingest else None) or content_type)
+        except Exception:
+            logger.exception("Failed to store upload %s in %s storage", unique_name, storage.name)
+
+    p = Presentation(
+        title=title_clean,
+        description=desc_clean,
+        filename=unique_name,
+        mimetype=(ingest.mimetype if ingest else None) or content_type or "application/octet-stream",
+        file_size=ingest.size if ingest else None,
+        content_sha256=ingest.sha256 if ingest else None,
+        owner_id=current_user.id,
+        privacy=privacy if privacy in {"public", "private"} else "public",
+        allow_download=bool(allow_download),
+        ai_title=ai_title,
+        ai_description=ai_description,
+    )
+    with Session(engine) as session:
+        # handle category (auto-classify when missing)
+        if category:
+            cat_name = category.strip()
+            cat = session.exec(
+                select(Category).where(Category.name == cat_name)
+            ).first()
+            if not cat:
+                cat = Category(name=cat_name)
+                session.add(cat)
+                session.commit()
+                session.refresh(cat)
+            p.category_id = cat.id
+        else:
+            # try to auto-classify from title
+            try:
+                auto_cat = auto_classify_category(session, title_clean)
+                if auto_cat:
+                    p.category_id = auto_cat.id
+            except Exception:
+                pass
+
+        session.add(p)
+        session.commit()
+        session.refresh(p)
+        result = {"id": p.id, "title": p.title, "filename": p.filename, "conversion_status": None}
+        artifacts.record_artifact(unique_name, "upload", current_user.id, p.id, size=p.file_size)
+
+        # Ensure stale preview artifacts from previous deployments/IDs are cleared.
+        _reset_presentation_preview_artifacts(p.id)
+
+        # handle tags (comma-separated)
+        if tags:
+            tag_names = [t.strip() for t in tags.split(",") if t.strip()]
+            for tn in tag_names:
+                tag = session.exec(select(Tag).where(Tag.name == tn)).first()
+                if not tag:
+                    tag = Tag(name=tn)
+                    session.add(tag)
+                    session.commit()
+                    session.refresh(tag)
+                link = PresentationTag(presentation_id=result["id"], tag_id=tag.id)
+                session.add(link)
+            session.commit()
+
+        # conversion/preview/transcode generation runs in the background (RQ or in-process pool)
+        if file_ext in CONVERTIBLE_UPLOAD_EXTS:
+            try:
+                enqueue_conversion(result["id"], unique_name)
+                result["conversion_status"] = "queued"
+            except Exception:
+                logger.exception("Failed to enqueue conversion for %s", result["id"])
+                result["conversion_status"] = "failed"
+
+        # record activity
+        try:
+            act = Activity(
+                user_id=current_user.id, verb="uploaded_presentation", target_id=result["id"]
+            )
+            session.add(act)
+            session.commit()
+        except Exception:
+            pass
+
+        # notify followers that a new presentation was uploaded
+        try:
+            followers = session.exec(
+                select(Follow.follower_id).where(Follow.following_id == current_user.id)
+            ).all()
+            for row in followers:
+                fid = row[0] if isinstance(row, (list, tuple)) else row
+                if not fid:
+                    continue
+                n = Notification(
+                    recipient_id=int(fid),
+                    actor_id=current_user.id,
+                    verb='new_upload',
+                    target_type='presentation',
+                    target_id=result["id"],
+                )
+                session.add(n)
+            session.commit()
+        except Exception:
+            session.rollback()
+    return result
+
+
 @app.post("/upload")
 async def upload_post(
     request: Request,
@@ -6761,14 +7403,11 @@ async def upload_post(
 
     # Ensure description is a string
     desc_clean = (description or "").strip()
-    ai_title = None
-    ai_description = None
 
     try:
         # Allowed extensions for presentations (include common video types)
-        allowed_exts = {".pdf", ".ppt", ".pptx", ".pptm", ".mp4", ".mov", ".m4v", ".webm"}
         file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in allowed_exts:
+        if file_ext not in PRESENTATION_UPLOAD_EXTS:
             return render_error("Unsupported file type")
 
         unique_name = f"{uuid.uuid4().hex}{file_ext}"
@@ -6776,175 +7415,39 @@ async def upload_post(
         # Stream upload with size limit (larger default to support high-quality videos)
         max_mb = int(os.getenv("UPLOAD_MAX_MB", str(int(MAX_UPLOAD_BYTES / (1024*1024)))))
         max_bytes = max_mb * 1024 * 1024
-        size = 0
-        with save_path.open("wb") as buffer:
+        # one pass: hash, size and type sniffing happen while the bytes hit disk
+        ingest = UploadIngest(save_path, file.filename, max_bytes)
+        try:
             while True:
-                chunk = await file.read(1024 * 64)
+                chunk = await file.read(1024 * 1024)
                 if not chunk:
                     break
-                size += len(chunk)
-                if size > max_bytes:
-                    buffer.close()
-                    try:
-                        save_path.unlink()
-                    except Exception:
-                        pass
-                    with Session(engine) as session:
-                        categories = session.exec(select(Category)).all()
-                    return templates.TemplateResponse(
-                        "upload.html",
-                        {
-                            "request": request,
-                            "error": f"File exceeds maximum size of {max_mb} MB",
-                            "categories": categories,
-                        },
-                    )
-                buffer.write(chunk)
-
-        # AI auto title/description (best-effort) when missing or short
-        try:
-            needs_title = len(title_clean.strip()) < 6
-            needs_desc = len(desc_clean.strip()) < 12
-            if needs_title or needs_desc:
-                sample_text = ""
-                if file_ext == ".pdf" and fitz is not None:
-                    try:
-                        doc = fitz.open(str(save_path))
-                        sample_text = "\n".join([doc[i].get_text() for i in range(min(len(doc), 3))])
-                        doc.close()
-                    except Exception:
-                        sample_text = ""
-                prompt = (
-                    "Generate a clean title and a 1-2 sentence description for this presentation. "
-                    "Return JSON with keys 'title' and 'description' only.\n\n"
-                    f"Original title: {title_clean}\n"
-                    f"Existing description: {desc_clean}\n"
-                    f"Extracted text: {sample_text[:2000]}"
-                )
-                ai_raw = chat_completion(
-                    [{"role": "user", "content": prompt}],
-                    model=os.getenv("OPENAI_MODEL", "gpt-4o-mini") if get_ai_provider() == "openai" else os.getenv("OLLAMA_MODEL", "qwen2.5:3b"),
-                    max_tokens=220,
-                    temperature=0.4,
-                )
-                try:
-                    parsed = json.loads(ai_raw.strip())
-                    ai_title = (parsed.get("title") or "").strip() or None
-                    ai_description = (parsed.get("description") or "").strip() or None
-                except Exception:
-                    # fallback: split first line as title, rest as description
-                    parts = [p.strip() for p in ai_raw.split("\n") if p.strip()]
-                    if parts:
-                        ai_title = parts[0][:120]
-                        if len(parts) > 1:
-                            ai_description = " ".join(parts[1:])[:400]
+                ingest.feed(chunk)
+        except UploadTooLarge:
+            return render_error(f"File exceeds maximum size of {max_mb} MB")
         except Exception:
-            pass
-
-        # normalise advanced settings
-        privacy_val = privacy if privacy in {"public", "private"} else "public"
-        allow_download_val = bool(allow_download)
+            ingest.abort()
+            raise
+        ingested = ingest.finish()
+        if not content_matches_extension(ingested.mimetype, file.filename):
+            save_path.unlink(missing_ok=True)
+            return render_error("Unsupported file type")
 
-        p = Presentation(
+        created = await run_in_threadpool(
+            _create_presentation_from_upload,
+            current_user,
+            unique_name,
+            file.filename,
+            content_type=file.content_type,
             title=title_clean,
             description=desc_clean,
-            filename=unique_name,
-            mimetype=file.content_type or "application/octet-stream",
-            owner_id=current_user.id,
-            privacy=privacy_val,
-            allow_download=allow_download_val,
-            ai_title=ai_title,
-            ai_description=ai_description,
+            tags=tags,
+            category=category,
+            privacy=privacy,
+            allow_download=bool(allow_download),
+            ingest=ingested,
         )
-        with Session(engine) as session:
-            # handle category (auto-classify when missing)
-            if category:
-                cat_name = category.strip()
-                cat = session.exec(
-                    select(Category).where(Category.name == cat_name)
-                ).first()
-                if not cat:
-                    cat = Category(name=cat_name)
-                    session.add(cat)
-                    session.commit()
-                    session.refresh(cat)
-                p.category_id = cat.id
-            else:
-                # try to auto-classify from title
-                try:
-                    auto_cat = auto_classify_category(session, title_clean)
-                    if auto_cat:
-                        p.category_id = auto_cat.id
-                except Exception:
-                    pass
-
-            session.add(p)
-            session.commit()
-            session.refresh(p)
-
-            # Ensure stale preview artifacts from previous deployments/IDs are cleared.
-            _reset_presentation_preview_artifacts(p.id)
-
-            # handle tags (comma-separated)
-            if tags:
-                tag_names = [t.strip() for t in tags.split(",") if t.strip()]
-                for tn in tag_names:
-                    tag = session.exec(select(Tag).where(Tag.name == tn)).first()
-                    if not tag:
-                        tag = Tag(name=tn)
-                        session.add(tag)
-                        session.commit()
-                        session.refresh(tag)
-                    link = PresentationTag(presentation_id=p.id, tag_id=tag.id)
-                    session.add(link)
-                session.commit()
-
-            # conversion/preview/transcode generation: always try to enqueue (with synchronous fallback)
-            if file_ext in {".ppt", ".pptx", ".pptm", ".mp4", ".mov", ".m4v", ".webm"}:
-                try:
-                    from .tasks import enqueue_conversion
-
-                    enqueue_conversion(p.id, unique_name)
-                except Exception:
-                    # fall back to running conversion inline if queue/Redis is unavailable
-                    try:
-                        from .tasks import convert_presentation
-
-                        convert_presentation(p.id, unique_name)
-                    except Exception:
-                        pass
-
-            # record activity
-            try:
-                act = Activity(
-                    user_id=current_user.id, verb="uploaded_presentation", target_id=p.id
-                )
-                session.add(act)
-                session.commit()
-            except Exception:
-                pass
-            presentation_id = p.id
-
-            # notify followers that a new presentation was uploaded
-            try:
-                followers = session.exec(
-                    select(Follow.follower_id).where(Follow.following_id == current_user.id)
-                ).all()
-                for row in followers:
-                    fid = row[0] if isinstance(row, (list, tuple)) else row
-                    if not fid:
-                        continue
-                    n = Notification(
-                        recipient_id=int(fid),
-                        actor_id=current_user.id,
-                        verb='new_upload',
-                        target_type='presentation',
-                        target_id=p.id,
-                    )
-                    session.add(n)
-                session.commit()
-            except Exception:
-                session.rollback()
+        presentation_id = created["id"]
 
         return RedirectResponse(
             url=f"/presentations/{presentation_id}?just_uploaded=1",
@@ -6976,159 +7479,296 @@ async def api_upload(
     except Exception:
         pass
 
-    allowed_exts = {".pdf", ".ppt", ".pptx", ".pptm", ".mp4", ".mov", ".m4v", ".webm"}
     file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in allowed_exts:
+    if file_ext not in PRESENTATION_UPLOAD_EXTS:
         return JSONResponse({"error": "Unsupported file type"}, status_code=400)
 
     max_mb = int(os.getenv("UPLOAD_MAX_MB", "50"))
     max_bytes = max_mb * 1024 * 1024
-    size = 0
     unique_name = f"{uuid.uuid4().hex}{file_ext}"
     save_path = Path(UPLOAD_DIR) / unique_name
 
-    with save_path.open("wb") as buffer:
+    ingest = UploadIngest(save_path, file.filename, max_bytes)
+    try:
         while True:
-            chunk = await file.read(1024 * 64)
+            chunk = await file.read(1024 * 1024)
             if not chunk:
                 break
-            size += len(chunk)
-            if size > max_bytes:
-                buffer.close()
-                try:
-                    save_path.unlink()
-                except Exception:
-                    pass
-                return JSONResponse(
-                    {"error": f"File exceeds maximum size of {max_mb} MB"},
-                    status_code=400,
-                )
-            buffer.write(chunk)
+            ingest.feed(chunk)
+    except UploadTooLarge:
+        return JSONResponse(
+            {"error": f"File exceeds maximum size of {max_mb} MB"},
+            status_code=400,
+        )
+    except Exception:
+        ingest.abort()
+        raise
+    ingested = ingest.finish()
+    if not content_matches_extension(ingested.mimetype, file.filename):
+        save_path.unlink(missing_ok=True)
+        return JSONResponse({"error": "File content does not match its type"}, status_code=400)
+
+    created = await run_in_threadpool(
+        _create_presentation_from_upload,
+        current_user,
+        unique_name,
+        file.filename,
+        content_type=file.content_type,
+        title=title,
+        description=description,
+        tags=tags,
+        category=category,
+        ingest=ingested,
+    )
+    return {
+        "id": created["id"],
+        "title": created["title"],
+        "download_url": f"/download/{created['filename']}",
+        "view_url": f"/presentations/{created['id']}",
+        "conversion_status": created["conversion_status"],
+    }
 
-    ai_title = None
-    ai_description = None
+
+def _resumable_headers(us: UploadSession) -> dict:
+    headers = {
+        "Tus-Resumable": resumable.TUS_VERSION,
+        "Upload-Offset": str(us.offset),
+        "Upload-Length": str(us.size),
+        "Cache-Control": "no-store",
+    }
+    ranges = resumable.load_ranges(us.received)
+    if ranges:
+        # lets parallel clients see which chunks are still missing after a drop
+        headers["Upload-Received"] = ",".join(f"{a}-{b}" for a, b in ranges)
+    if us.presentation_id:
+        headers["X-Presentation-Id"] = str(us.presentation_id)
+    return headers
+
+
+def _get_upload_session(session: Session, upload_id: str, current_user: User) -> UploadSession:
+    us = session.exec(select(UploadSession).where(UploadSession.upload_id == upload_id)).first()
+    if not us or us.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return us
+
+
+def _expire_upload_sessions() -> None:
+    """Drop unfinished uploads (and their staging files) past the TTL."""
+    cutoff = datetime.utcnow() - timedelta(hours=resumable.UPLOAD_SESSION_TTL_HOURS)
     try:
-        needs_title = not title or len((title or "").strip()) < 6
-        needs_desc = not description or len((description or "").strip()) < 12
-        if needs_title or needs_desc:
-            sample_text = ""
-            if file_ext == ".pdf" and fitz is not None:
-                try:
-                    doc = fitz.open(str(save_path))
-                    sample_text = "\n".join([doc[i].get_text() for i in range(min(len(doc), 3))])
-                    doc.close()
-                except Exception:
-                    sample_text = ""
-            prompt = (
-                "Generate a clean title and a 1-2 sentence description for this presentation. "
-                "Return JSON with keys 'title' and 'description' only.\n\n"
-                f"Original title: {title or ''}\n"
-                f"Existing description: {description or ''}\n"
-                f"Extracted text: {sample_text[:2000]}"
-            )
-            ai_raw = chat_completion(
-                [{"role": "user", "content": prompt}],
-                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini") if get_ai_provider() == "openai" else os.getenv("OLLAMA_MODEL", "qwen2.5:3b"),
-                max_tokens=220,
-                temperature=0.4,
-            )
-            try:
-                parsed = json.loads(ai_raw.strip())
-                ai_title = (parsed.get("title") or "").strip() or None
-                ai_description = (parsed.get("description") or "").strip() or None
-            except Exception:
-                parts = [p.strip() for p in ai_raw.split("\n") if p.strip()]
-                if parts:
-                    ai_title = parts[0][:120]
-                    if len(parts) > 1:
-                        ai_description = " ".join(parts[1:])[:400]
+        with Session(engine) as session:
+            stale = session.exec(
+                select(UploadSession).where(
+                    (UploadSession.status == "uploading") & (UploadSession.updated_at < cutoff)
+                )
+            ).all()
+            for us in stale:
+                resumable.discard_staging_file(us.upload_id)
+                resumable.forget_upload_lock(us.upload_id)
+                session.delete(us)
+            session.commit()
     except Exception:
-        pass
+        logger.exception("Failed to expire upload sessions")
 
-    with Session(engine) as session:
-        p = Presentation(
-            title=title or Path(file.filename).stem,
-            description=description,
-            filename=unique_name,
-            mimetype=file.content_type,
-            owner_id=current_user.id if current_user else None,
-            privacy="public",
-            allow_download=True,
-            ai_title=ai_title,
-            ai_description=ai_description,
-        )
 
-        # optional category
-        if category:
-            cat_name = category.strip()
-            cat = session.exec(select(Category).where(Category.name == cat_name)).first()
-            if not cat:
-                cat = Category(name=cat_name)
-                session.add(cat)
-                session.commit()
-                session.refresh(cat)
-            p.category_id = cat.id
+@app.options("/api/uploads/resumable")
+def resumable_upload_options():
+    return Response(status_code=204, headers={
+        "Tus-Resumable": resumable.TUS_VERSION,
+        "Tus-Version": resumable.TUS_VERSION,
+        "Tus-Extension": "creation,termination",
+        "Tus-Max-Size": str(MAX_UPLOAD_BYTES),
+    })
 
-        session.add(p)
+
+@app.post("/api/uploads/resumable")
+def create_resumable_upload(request: Request, current_user: User = Depends(get_current_user)):
+    """Start a resumable upload (tus creation).
+
+    Expects ``Upload-Length`` and ``Upload-Metadata`` with at least ``filename``;
+    optional keys are title, description, tags, category, privacy,
+    allow_download and filetype. Chunks are then sent with PATCH.
+    """
+    if getattr(current_user, 'site_role', None) == 'passerby' or request.cookies.get('user_role') == 'passerby':
+        raise HTTPException(status_code=403, detail="Passerby users cannot upload")
+    try:
+        size = int(request.headers.get("upload-length", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Length header required")
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Upload-Length must be positive")
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    meta = resumable.parse_upload_metadata(request.headers.get("upload-metadata"))
+    filename = Path(meta.get("filename") or "").name
+    if not filename or Path(filename).suffix.lower() not in PRESENTATION_UPLOAD_EXTS:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+
+    _expire_upload_sessions()
+    upload_id = uuid.uuid4().hex
+    resumable.create_staging_file(upload_id, size)
+    with Session(engine) as session:
+        us = UploadSession(
+            upload_id=upload_id,
+            owner_id=current_user.id,
+            filename=filename,
+            size=size,
+            received="[]",
+            upload_metadata=json.dumps(meta),
+        )
+        session.add(us)
         session.commit()
-        session.refresh(p)
+        session.refresh(us)
+        headers = _resumable_headers(us)
+    location = f"/api/uploads/resumable/{upload_id}"
+    headers["Location"] = location
+    headers["Upload-Chunk-Size"] = str(resumable.RESUMABLE_CHUNK_SIZE)
+    return JSONResponse(
+        {"upload_id": upload_id, "location": location, "chunk_size": resumable.RESUMABLE_CHUNK_SIZE},
+        status_code=201,
+        headers=headers,
+    )
 
-        # Ensure stale preview artifacts from previous deployments/IDs are cleared.
-        _reset_presentation_preview_artifacts(p.id)
 
-        # optional tags
-        if tags:
-            tag_names = [t.strip() for t in tags.split(",") if t.strip()]
-            for tn in tag_names:
-                tag = session.exec(select(Tag).where(Tag.name == tn)).first()
-                if not tag:
-                    tag = Tag(name=tn)
-                    session.add(tag)
-                    session.commit()
-                    session.refresh(tag)
-                link = PresentationTag(presentation_id=p.id, tag_id=tag.id)
-                session.add(link)
-            session.commit()
+@app.api_route("/api/uploads/resumable/{upload_id}", methods=["HEAD", "GET"])
+def resumable_upload_status(upload_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    with Session(engine) as session:
+        us = _get_upload_session(session, upload_id, current_user)
+        headers = _resumable_headers(us)
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=headers)
+        return JSONResponse({
+            "upload_id": us.upload_id,
+            "offset": us.offset,
+            "size": us.size,
+            "received": resumable.load_ranges(us.received),
+            "status": us.status,
+            "presentation_id": us.presentation_id,
+        }, headers=headers)
 
-        # conversion/preview generation for API uploads: always enqueue Redis/RQ job and attempt sync fallback
-        if file_ext in {".ppt", ".pptx", ".pptm"}:
-            try:
-                from .tasks import enqueue_conversion, convert_presentation
-                enqueue_conversion(p.id, unique_name)  # Always enqueue in Redis/RQ
-            except Exception:
-                pass  # If Redis/RQ is unavailable, ignore
-            # Synchronous fallback: try to convert immediately so previews show up
-            try:
-                convert_presentation(p.id, unique_name)
-            except Exception:
-                pass
-        try:
-            followers = session.exec(
-                select(Follow.follower_id).where(Follow.following_id == current_user.id)
-            ).all()
-            for row in followers:
-                fid = row[0] if isinstance(row, (list, tuple)) else row
-                if not fid:
-                    continue
-                n = Notification(
-                    recipient_id=int(fid),
-                    actor_id=current_user.id,
-                    verb='new_upload',
-                    target_type='presentation',
-                    target_id=p.id,
-                )
-                session.add(n)
-            session.commit()
-        except Exception:
-            session.rollback()
 
+@app.patch("/api/uploads/resumable/{upload_id}")
+async def resumable_upload_patch(upload_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Write one chunk at ``Upload-Offset``.
 
-    return {
-        "id": p.id,
-        "title": p.title,
-        "download_url": f"/download/{p.filename}",
-        "view_url": f"/presentations/{p.id}",
-    }
+    Sequential clients send the current offset (any chunk size). Parallel
+    clients may send chunks out of order as long as each starts on a multiple
+    of the advertised chunk size. The last chunk assembles the file and creates
+    the presentation.
+    """
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Offset header required")
+    with Session(engine) as session:
+        us = _get_upload_session(session, upload_id, current_user)
+        if us.status != "uploading":
+            raise HTTPException(status_code=409, detail=f"Upload is {us.status}")
+        size = us.size
+        aligned = offset % resumable.RESUMABLE_CHUNK_SIZE == 0
+        if offset < 0 or offset >= size or (offset != us.offset and not aligned):
+            return JSONResponse(
+                {"error": "Offset mismatch", "offset": us.offset},
+                status_code=409,
+                headers=_resumable_headers(us),
+            )
+    try:
+        written = await resumable.write_chunk(upload_id, offset, request.stream(), size - offset)
+    except ValueError:
+        raise HTTPException(status_code=413, detail="Chunk exceeds Upload-Length")
+
+    complete = False
+    with resumable.upload_lock(upload_id):
+        with Session(engine) as session:
+            us = _get_upload_session(session, upload_id, current_user)
+            if written:
+                ranges = resumable.add_range(resumable.load_ranges(us.received), offset, offset + written)
+                us.received = json.dumps(ranges)
+                us.offset = resumable.contiguous_offset(ranges)
+                us.updated_at = datetime.utcnow()
+            if us.offset >= us.size and us.status == "uploading":
+                # claim assembly so a concurrent final chunk does not repeat it
+                us.status = "assembling"
+                complete = True
+            session.add(us)
+            session.commit()
+            session.refresh(us)
+            headers = _resumable_headers(us)
+            meta = json.loads(us.upload_metadata or "{}")
+            filename = us.filename
+    if not complete:
+        return Response(status_code=204, headers=headers)
+
+    unique_name = f"{uuid.uuid4().hex}{Path(filename).suffix.lower()}"
+    try:
+        ingested = await run_in_threadpool(_assemble_resumable_upload, upload_id, unique_name, filename)
+        created = await run_in_threadpool(
+            _create_presentation_from_upload,
+            current_user,
+            unique_name,
+            filename,
+            content_type=meta.get("filetype") or mimetypes.guess_type(filename)[0],
+            title=meta.get("title"),
+            description=meta.get("description"),
+            tags=meta.get("tags"),
+            category=meta.get("category"),
+            privacy=meta.get("privacy") or "public",
+            allow_download=(meta.get("allow_download", "true") or "").lower() not in ("0", "false", "no", "off"),
+            ingest=ingested,
+        )
+    except Exception as exc:
+        mismatch = isinstance(exc, UploadTypeMismatch)
+        if not mismatch:
+            logger.exception("Failed to assemble resumable upload %s", upload_id)
+        with Session(engine) as session:
+            us = _get_upload_session(session, upload_id, current_user)
+            us.status = "failed"
+            session.add(us)
+            session.commit()
+        if mismatch:
+            raise HTTPException(status_code=415, detail="File content does not match its type")
+        raise HTTPException(status_code=500, detail="Upload assembly failed")
+    with Session(engine) as session:
+        us = _get_upload_session(session, upload_id, current_user)
+        us.status = "complete"
+        us.presentation_id = created["id"]
+        us.updated_at = datetime.utcnow()
+        session.add(us)
+        session.commit()
+        session.refresh(us)
+        headers = _resumable_headers(us)
+    resumable.forget_upload_lock(upload_id)
+    return JSONResponse({
+        "id": created["id"],
+        "title": created["title"],
+        "download_url": f"/download/{created['filename']}",
+        "view_url": f"/presentations/{created['id']}",
+        "conversion_status": created["conversion_status"],
+    }, headers=headers)
+
+
+def _assemble_resumable_upload(upload_id: str, unique_name: str, filename: str):
+    """Move the finished staging file into UPLOAD_DIR and ingest it (blocking)."""
+    dest = Path(UPLOAD_DIR) / unique_name
+    resumable.move_to_uploads(upload_id, dest)
+    # chunks may have arrived out of order, so ingest reads the assembled file once
+    ingested = ingest_file(dest, filename)
+    if not content_matches_extension(ingested.mimetype, filename):
+        dest.unlink(missing_ok=True)
+        raise UploadTypeMismatch(filename)
+    return ingested
+
+
+@app.delete("/api/uploads/resumable/{upload_id}")
+def resumable_upload_delete(upload_id: str, current_user: User = Depends(get_current_user)):
+    with Session(engine) as session:
+        us = _get_upload_session(session, upload_id, current_user)
+        if us.status in ("uploading", "failed"):
+            resumable.discard_staging_file(upload_id)
+        session.delete(us)
+        session.commit()
+    resumable.forget_upload_lock(upload_id)
+    return Response(status_code=204, headers={"Tus-Resumable": resumable.TUS_VERSION})
 
 
 def _ai_transform_text(content: str, mode: str) -> str:
@@ -7253,7 +7893,8 @@ def view_presentation(request: Request, presentation_id: int):
             if r.task_type == "mindmap" and not ai_mindmap and not _is_ai_error(r.result):
                 ai_mindmap = r.result
 
-        # Always attempt conversion for new presentations (enqueue + sync fallback)
+        # Queue conversion for presentations that have no job yet; enqueue_conversion
+        # hands it to RQ or the in-process pool and never converts on this request
         viewer_url = None
         conversion_status = None
         original_url = None
@@ -7270,17 +7911,15 @@ def view_presentation(request: Request, presentation_id: int):
                 viewer_url = f"/download/{p.filename}?inline=1"
                 conversion_status = "ready"
             elif ext in {".ppt", ".pptx", ".pptm"}:
-                # Always try to enqueue and convert if not already done
+                # enqueue only when no job exists yet (queued, running or finished)
                 if not job:
                     try:
                         enqueue_conversion(p.id, p.filename)
                         conversion_status = "queued"
                     except Exception:
                         conversion_status = "failed"
-                # synchronous fallback removed from inside DB session to avoid
-                # potential SQLite locking when worker functions open their own
-                # sessions. A best-effort conversion will be attempted after
-                # the session closes.
+                # the page shows the job status; slides appear once the RQ
+                # worker or local pool finishes
                 if not viewer_url:
                     conversion_status = job.status if job else "queued"
             elif ext in ('.mp4', '.mov', '.m4v', '.webm'):
@@ -7355,18 +7994,12 @@ def view_presentation(request: Request, presentation_id: int):
         ai_summary=getattr(p, 'ai_summary', None),
     )
 
-    # Best-effort synchronous conversion (moved outside DB session to avoid locks)
+    # Use a converted PDF if the background conversion has already produced one
+    # (conversion itself is queued above and never runs on the request thread).
     try:
         if p.filename:
             ext = Path(p.filename).suffix.lower()
             if ext in {'.ppt', '.pptx', '.pptm'} and not viewer_url:
-                try:
-                    from .tasks import convert_presentation
-                    convert_presentation(p.id, p.filename)
-                except Exception:
-                    # conversion failed or not available; continue gracefully
-                    pass
-                # check for a converted PDF result after attempting conversion
                 with Session(engine) as _s:
                     latest_job = _s.exec(
                         select(ConversionJob)
@@ -7745,33 +8378,14 @@ def presentation_preview(
                         conversion_status = "ready"
                 if not viewer_url:
                     conversion_status = job.status if job else "queued"
-                    # Try to enqueue background conversion; fallback to
-                    # synchronous conversion so newly uploaded presentations
-                    # behave the same as older ones.
+                    # Queue a background conversion if none exists yet; the
+                    # client polls conversion_status until the PDF is ready.
                     if not job:
                         try:
                             enqueue_conversion(p.id, p.filename)
                             conversion_status = "queued"
                         except Exception:
                             conversion_status = "failed"
-                    # synchronous fallback attempt
-                    try:
-                        from .tasks import convert_presentation
-
-                        convert_presentation(p.id, p.filename)
-                        with Session(engine) as _s:
-                            latest_job = _s.exec(
-                                select(ConversionJob)
-                                .where(ConversionJob.presentation_id == presentation_id)
-                                .order_by(ConversionJob.created_at.desc())
-                            ).first()
-                            if latest_job and latest_job.result:
-                                conv_path = Path(UPLOAD_DIR) / latest_job.result
-                                if conv_path.exists():
-                                    viewer_url = f"/presentations/{presentation_id}/converted_pdf?inline=1"
-                                    conversion_status = "ready"
-                    except Exception:
-                        pass
             else:
                 conversion_status = "unsupported"
 
@@ -7846,95 +8460,30 @@ def list_thumbnails(presentation_id: int):
         logger.exception("Redis check error: %s", e)
 
     thumbs_dir = Path(UPLOAD_DIR) / "thumbs" / str(presentation_id)
-    # If thumbs dir is missing or present but empty, attempt generation/enqueue
-    if not thumbs_dir.exists() or (thumbs_dir.exists() and not any(thumbs_dir.glob('slide_*.png'))):
-        # attempt to enqueue generation of thumbnails when possible
-        try:
-            from .tasks import enqueue_conversion
-            with Session(engine) as session:
-                p = session.get(Presentation, presentation_id)
-                if p and getattr(p, 'filename', None):
-                    src = Path(UPLOAD_DIR) / p.filename
-                    if src.exists():
-                        try:
-                            enqueue_conversion(presentation_id, p.filename)
-                            return {"thumbnails": [], "status": "queued"}
-                        except Exception:
-                            # fall back to synchronous conversion if queueing fails
-                            try:
-                                from .tasks import convert_presentation
-                                convert_presentation(presentation_id, p.filename)
-                                # after sync conversion, proceed to collect thumbnails below
-                            except Exception:
-                                return {"thumbnails": [], "status": "queued"}
-        except Exception:
-            # if RQ/Redis isn't available, try synchronous generation
-            try:
-                from .tasks import convert_presentation
-                with Session(engine) as session:
-                    p = session.get(Presentation, presentation_id)
-                    if p and getattr(p, 'filename', None):
-                        src = Path(UPLOAD_DIR) / p.filename
-                        if src.exists():
-                            convert_presentation(presentation_id, p.filename)
-                            # after conversion, proceed to collect thumbnails below
-            except Exception:
-                pass
-        # attempt to generate thumbnails from an available PDF (on-demand) using
-        # the shared `generate_pdf_thumbnails` helper which includes fallbacks.
+    # Thumbnails are produced by the background conversion (RQ or the in-process
+    # pool); queue one if needed and let the client poll rather than rendering here.
+    if not thumbs_dir.exists() or not any(thumbs_dir.glob('slide_*.png')):
         try:
-            from .convert import generate_pdf_thumbnails
             with Session(engine) as session:
                 p = session.get(Presentation, presentation_id)
-                pdf_path = None
-                if p and getattr(p, 'filename', None):
-                    src = Path(UPLOAD_DIR) / p.filename
-                    if src.exists() and src.suffix.lower() == '.pdf':
-                        pdf_path = src
-                if not pdf_path:
-                    # fallback to converted PDF result if available
-                    job = session.exec(
-                        select(ConversionJob)
-                        .where(ConversionJob.presentation_id == presentation_id)
-                        .order_by(ConversionJob.created_at.desc())
-                    ).first()
-                    if job and job.result:
-                        conv = Path(UPLOAD_DIR) / job.result
-                        if conv.exists():
-                            pdf_path = conv
-                if pdf_path:
-                    try:
-                        thumbs_dir.mkdir(parents=True, exist_ok=True)
-                        thumbs = generate_pdf_thumbnails(str(pdf_path), str(thumbs_dir), max_pages=10)
-                        if thumbs:
-                            # Cache URLs in Redis for fast retrieval by the UI
-                            try:
-                                redis_url = os.getenv('REDIS_URL')
-                                if _redis and redis_url:
-                                    rc = _redis.from_url(redis_url)
-                                    key = f"presentation:{presentation_id}:thumbnails"
-                                    urls = [f"/media/thumbs/{presentation_id}/slide_{i}.png" for i in range(len(thumbs))]
-                                    try:
-                                        rc.set(key, json.dumps(urls))
-                                        rc.expire(key, 7 * 24 * 3600)
-                                    except Exception:
-                                        pass
-                            except Exception:
-                                pass
-                    except Exception:
-                        # on-demand generation failed; ignore and fall back
-                        pass
+                filename = getattr(p, 'filename', None) if p else None
+                job = session.exec(
+                    select(ConversionJob)
+                    .where(ConversionJob.presentation_id == presentation_id)
+                    .order_by(ConversionJob.created_at.desc())
+                ).first()
+            if job and job.status in ("queued", "started"):
+                return {"thumbnails": [], "status": "queued"}
+            if filename and (Path(UPLOAD_DIR) / filename).exists():
+                enqueue_conversion(presentation_id, filename)
+                return {"thumbnails": [], "status": "queued"}
         except Exception:
-            pass
-
-        # if thumbnails still don't exist (or dir empty), return empty
-        files_present = thumbs_dir.exists() and any(thumbs_dir.glob('slide_*.png'))
-        if not files_present:
-            return {"thumbnails": []}
+            logger.exception("Failed to enqueue thumbnail generation for %s", presentation_id)
+        return {"thumbnails": []}
 
     files = sorted(thumbs_dir.glob("slide_*.png"))
-    # return URLs relative to server
-    urls = [f"/media/thumbs/{presentation_id}/slide_{i}.png" for i in range(len(files))]
+    # return content-versioned slide URLs so browsers can cache them indefinitely
+    urls = [slide_url(presentation_id, i) for i in range(len(files))]
     logger.debug("Returning %d thumbnail urls for presentation %s", len(urls), presentation_id)
     return {"thumbnails": urls}
 
@@ -8013,6 +8562,8 @@ def debug_run_convert(presentation_id: int):
         result['ok'] = False
         result['error'] = str(e)
 
+    if result.get('generated'):
+        write_thumbnail_manifest(str(thumbs_dir))
     # list files in thumbs_dir
     result['thumbs_dir'] = str(thumbs_dir)
     result['files'] = [str(p.name) for p in sorted(thumbs_dir.glob('slide_*.png'))]
@@ -8034,8 +8585,111 @@ def debug_run_convert(presentation_id: int):
     return JSONResponse(result)
 
 
+SLIDE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+SLIDE_REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+_slide_cache_lock = Lock()
+_slide_manifests: Dict[int, tuple] = {}
+_slide_etags: OrderedDict = OrderedDict()
+SLIDE_ETAG_CACHE_MAX = int(os.getenv('SLIDE_ETAG_CACHE_MAX', '4096'))
+
+
+def _slide_manifest(presentation_id: int) -> dict:
+    """Return the slide hash manifest written at conversion time (cached by mtime)."""
+    manifest_path = Path(UPLOAD_DIR) / "thumbs" / str(presentation_id) / SLIDE_MANIFEST_NAME
+    try:
+        mtime = manifest_path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    with _slide_cache_lock:
+        cached = _slide_manifests.get(int(presentation_id))
+        if cached and cached[0] == mtime:
+            return cached[1]
+    slides = read_thumbnail_manifest(str(manifest_path.parent))
+    with _slide_cache_lock:
+        _slide_manifests[int(presentation_id)] = (mtime, slides)
+    return slides
+
+
+def slide_version(presentation_id: int, index: int) -> Optional[str]:
+    return _slide_manifest(presentation_id).get(f"slide_{int(index)}.png")
+
+
+def slide_url(presentation_id: Any, index: int = 0) -> str:
+    """Versioned slide URL; the version changes whenever the slide content does."""
+    url = f"/presentations/{presentation_id}/slide/{int(index)}"
+    try:
+        version = slide_version(int(presentation_id), index)
+    except Exception:
+        version = None
+    return f"{url}?v={version}" if version else url
+
+
+try:
+    templates.env.filters['slide_url'] = slide_url
+except Exception:
+    pass
+
+
+def _slide_etag(path: Path, st: os.stat_result) -> str:
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    with _slide_cache_lock:
+        etag = _slide_etags.get(key)
+        if etag:
+            _slide_etags.move_to_end(key)
+            return etag
+    etag = file_content_hash(str(path))
+    with _slide_cache_lock:
+        _slide_etags[key] = etag
+        while len(_slide_etags) > SLIDE_ETAG_CACHE_MAX:
+            _slide_etags.popitem(last=False)
+    return etag
+
+
+def _slide_response(request: Request, path: Path, version: Optional[str], media_type: str = 'image/png'):
+    """Serve a slide PNG with a strong ETag, 304 handling and long-lived caching.
+
+    URLs carrying the current content version (``?v=``) are immutable; bare URLs
+    must revalidate, which is a cheap 304 once the browser holds the image.
+    """
+    st = path.stat()
+    etag = _slide_etag(path, st)
+    requested = request.query_params.get('v')
+    cache_control = SLIDE_CACHE_CONTROL if (requested and version and requested == version) else SLIDE_REVALIDATE_CACHE_CONTROL
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    offloaded = accel_response(request, path, media_type, headers)
+    if offloaded is not None:
+        return offloaded
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+def _presentation_pdf_path(presentation_id: int) -> Optional[Path]:
+    """Locate a renderable PDF: the converted PDF if present, else a PDF upload."""
+    try:
+        with Session(engine) as session:
+            job = session.exec(
+                select(ConversionJob)
+                .where(ConversionJob.presentation_id == presentation_id)
+                .order_by(ConversionJob.created_at.desc())
+            ).first()
+            if job and job.result:
+                cand = Path(UPLOAD_DIR) / job.result
+                if cand.exists() and cand.suffix.lower() == '.pdf':
+                    return cand
+            p = session.get(Presentation, presentation_id)
+            if p and getattr(p, 'filename', None):
+                src = Path(UPLOAD_DIR) / p.filename
+                if src.exists() and src.suffix.lower() == '.pdf':
+                    return src
+    except Exception:
+        pass
+    return None
+
+
 @app.get("/presentations/{presentation_id}/slide/{index}")
 def get_slide_image(
+    request: Request,
     presentation_id: int,
     index: int,
     hd: bool = Query(False),
@@ -8047,68 +8701,24 @@ def get_slide_image(
     target_dir = (thumbs_hd_dir / quality_bucket) if hd else thumbs_dir
     path = target_dir / f"slide_{index}.png"
     fallback_path = thumbs_dir / f"slide_{index}.png"
+    # The base slide's content hash versions both standard and HD renders. Stale
+    # renders are removed at conversion time, so the fast path needs no DB access.
+    version = slide_version(presentation_id, index)
 
-    # Guard against stale thumbnails (e.g., reused presentation IDs across deploys).
-    try:
-        with Session(engine) as session:
-            p = session.get(Presentation, presentation_id)
-            src_mtime = None
-            if p and getattr(p, "filename", None):
-                src = Path(UPLOAD_DIR) / p.filename
-                if src.exists():
-                    src_mtime = src.stat().st_mtime
+    if path.exists():
+        return _slide_response(request, path, version)
 
-        if src_mtime is not None:
-            try:
-                if path.exists() and path.stat().st_mtime < src_mtime:
-                    path.unlink(missing_ok=True)
-            except Exception:
-                pass
-            try:
-                if fallback_path.exists() and fallback_path.stat().st_mtime < src_mtime:
-                    fallback_path.unlink(missing_ok=True)
-            except Exception:
-                pass
-    except Exception:
-        pass
+    # Attempt to generate the requested slide on-demand from an available PDF.
+    # Prefer a converted PDF (from ConversionJob.result), then the original upload.
+    pdf_path = _presentation_pdf_path(presentation_id)
 
-    if not path.exists():
-        # Attempt to generate the requested slide on-demand from an available PDF.
-        # Prefer a converted PDF (from ConversionJob.result), then the original upload.
-        pdf_path = None
+    # Try to render a PNG for the requested page if we found a PDF
+    if pdf_path:
+        target_dir.mkdir(parents=True, exist_ok=True)
         try:
-            # check converted PDF
-            with Session(engine) as session:
-                job = session.exec(
-                    select(ConversionJob)
-                    .where(ConversionJob.presentation_id == presentation_id)
-                    .order_by(ConversionJob.created_at.desc())
-                ).first()
-                if job and job.result:
-                    cand = Path(UPLOAD_DIR) / job.result
-                    if cand.exists():
-                        pdf_path = cand
-        except Exception:
-            pdf_path = None
-
-        # fallback to original presentation file
-        if not pdf_path:
-            try:
-                with Session(engine) as session:
-                    p = session.get(Presentation, presentation_id)
-                    if p and getattr(p, 'filename', None):
-                        src = Path(UPLOAD_DIR) / p.filename
-                        if src.exists() and src.suffix.lower() == '.pdf':
-                            pdf_path = src
-            except Exception:
-                pdf_path = None
-
-        # Try to render a PNG for the requested page if we found a PDF
-        if pdf_path:
-            target_dir.mkdir(parents=True, exist_ok=True)
-            try:
-                if fitz is not None:
-                    doc = fitz.open(str(pdf_path))
+            if fitz is not None:
+                rendered = False
+                with open_pdf(pdf_path) as doc:
                     if index < doc.page_count:
                         # Use quality-aware HD scale so high zoom requests can be generated crisply.
                         base_hd_scale = float(os.getenv('HD_SLIDE_SCALE', '3.0'))
@@ -8120,31 +8730,200 @@ def get_slide_image(
                         mat = fitz.Matrix(scale, scale)
                         page = doc.load_page(index)
                         pix = page.get_pixmap(matrix=mat)
-                        out_path = path
-                        pix.save(str(out_path))
-                        doc.close()
-                        return FileResponse(out_path, media_type='image/png', filename=out_path.name)
-                # Fallback: try ImageMagick `convert` to generate a PNG for the page
-                try:
-                    pattern = str(target_dir / 'slide_%d.png')
-                    render_size = f"x{min(6000, int(2500 * quality))}" if hd else 'x2000'
-                    subprocess.run(['convert', str(pdf_path), '-thumbnail', render_size, pattern], check=True)
-                    if path.exists():
-                        return FileResponse(path, media_type='image/png', filename=path.name)
-                except Exception:
-                    pass
+                        pix.save(str(path))
+                        rendered = True
+                if rendered:
+                    if not hd:
+                        version = write_thumbnail_manifest(str(thumbs_dir)).get(path.name)
+                    return _slide_response(request, path, version)
+            # Fallback: ImageMagick `convert` for just the requested page
+            try:
+                render_size = f"x{min(6000, int(2500 * quality))}" if hd else 'x2000'
+                subprocess.run(['convert', f"{pdf_path}[{index}]", '-thumbnail', render_size, str(path)], check=True)
+                if path.exists():
+                    if not hd:
+                        version = write_thumbnail_manifest(str(thumbs_dir)).get(path.name)
+                    return _slide_response(request, path, version)
             except Exception:
                 pass
+        except Exception:
+            pass
+
+    if hd and fallback_path.exists():
+        # a stand-in under the HD URL must not be cached as if it were the HD
+        # render, or the browser keeps it after the real one becomes available
+        return _slide_response(request, fallback_path, None)
+
+    raise HTTPException(status_code=404, detail='Slide not found')
+
+
+# Deep-zoom (DZI) tiles: each page is exposed as a tile pyramid whose full-resolution
+# level matches the old 12x HD cap. Tiles are rendered lazily via a clipped pixmap and
+# cached on disk, so zooming only fetches the tiles covering the viewport.
+TILE_SIZE = int(os.getenv('SLIDE_TILE_SIZE', '512'))
+TILE_MAX_SCALE = float(os.getenv('SLIDE_TILE_MAX_SCALE', '12.0'))
+
+
+def _tiles_dir(presentation_id: int, index: int) -> Path:
+    return Path(UPLOAD_DIR) / "thumbs_hd" / str(presentation_id) / "tiles" / str(index)
+
+
+def _tile_pyramid(width: int, height: int) -> int:
+    """Return the DZI max level for an image of width x height pixels."""
+    return max(0, int(math.ceil(math.log2(max(width, height, 1)))))
+
+
+@app.get("/presentations/{presentation_id}/slide/{index}/tiles.dzi")
+def get_slide_tiles_descriptor(request: Request, presentation_id: int, index: int):
+    tiles_dir = _tiles_dir(presentation_id, index)
+    path = tiles_dir / "tiles.dzi"
+    version = slide_version(presentation_id, index)
+    if path.exists():
+        return _slide_response(request, path, version, media_type='application/xml')
+    pdf_path = _presentation_pdf_path(presentation_id)
+    if not pdf_path or fitz is None or index < 0:
+        raise HTTPException(status_code=404, detail='Tiles not available')
+    with open_pdf(pdf_path) as doc:
+        if index >= doc.page_count:
+            raise HTTPException(status_code=404, detail='Slide not found')
+        rect = doc.load_page(index).rect
+    width = int(math.ceil(rect.width * TILE_MAX_SCALE))
+    height = int(math.ceil(rect.height * TILE_MAX_SCALE))
+    tiles_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tiles_dir / f"tiles.dzi.{uuid.uuid4().hex}.tmp"
+    tmp.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{TILE_SIZE}" Overlap="0" Format="png">'
+        f'<Size Width="{width}" Height="{height}"/></Image>\n',
+        encoding='utf-8',
+    )
+    os.replace(str(tmp), str(path))
+    return _slide_response(request, path, version, media_type='application/xml')
+
+
+@app.get("/presentations/{presentation_id}/slide/{index}/tiles_files/{level}/{tile}")
+def get_slide_tile(request: Request, presentation_id: int, index: int, level: int, tile: str):
+    m = re.fullmatch(r'(\d+)_(\d+)\.png', tile)
+    if not m or level < 0 or index < 0:
+        raise HTTPException(status_code=404, detail='Tile not found')
+    col, row = int(m.group(1)), int(m.group(2))
+    tiles_dir = _tiles_dir(presentation_id, index)
+    path = tiles_dir / str(level) / f"{col}_{row}.png"
+    version = slide_version(presentation_id, index)
+    if path.exists():
+        return _slide_response(request, path, version)
+
+    pdf_path = _presentation_pdf_path(presentation_id)
+    if not pdf_path or fitz is None:
+        raise HTTPException(status_code=404, detail='Tile not found')
+    with open_pdf(pdf_path) as doc:
+        if index >= doc.page_count:
+            raise HTTPException(status_code=404, detail='Slide not found')
+        page = doc.load_page(index)
+        rect = page.rect
+        width = int(math.ceil(rect.width * TILE_MAX_SCALE))
+        height = int(math.ceil(rect.height * TILE_MAX_SCALE))
+        max_level = _tile_pyramid(width, height)
+        if level > max_level:
+            raise HTTPException(status_code=404, detail='Tile not found')
+        factor = 2 ** (max_level - level)
+        level_w = int(math.ceil(width / factor))
+        level_h = int(math.ceil(height / factor))
+        x0, y0 = col * TILE_SIZE, row * TILE_SIZE
+        if x0 >= level_w or y0 >= level_h:
+            raise HTTPException(status_code=404, detail='Tile not found')
+        x1, y1 = min(x0 + TILE_SIZE, level_w), min(y0 + TILE_SIZE, level_h)
+        scale = TILE_MAX_SCALE / factor
+        clip = fitz.Rect(
+            rect.x0 + x0 / scale,
+            rect.y0 + y0 / scale,
+            rect.x0 + x1 / scale,
+            rect.y0 + y1 / scale,
+        )
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.tmp")
+        pix.save(str(tmp), output='png')
+    os.replace(str(tmp), str(path))
+    return _slide_response(request, path, version)
+
+
+def _serve_upload(request: Request, path, **kwargs):
+    """serve_stored_file for a path under UPLOAD_DIR (its storage key is the relative path)."""
+    try:
+        key = Path(path).resolve().relative_to(Path(UPLOAD_DIR).resolve()).as_posix()
+    except ValueError:
+        key = None
+    return serve_stored_file(request, key, path, **kwargs)
+
 
-        if hd and fallback_path.exists():
-            return FileResponse(fallback_path, media_type='image/png', filename=fallback_path.name)
+def _derivative_size(kind: str, size: int) -> int:
+    """Smallest rendered size that covers the requested one."""
+    sizes = DERIVATIVE_SIZES[kind]
+    return next((s for s in sizes if s >= int(size)), sizes[-1])
 
-        raise HTTPException(status_code=404, detail='Slide not found')
-    return FileResponse(path, media_type="image/png", filename=path.name)
+
+def image_url(rel_path: Optional[str], kind: str, size: int) -> str:
+    """Size-parameterized URL for an uploaded image, versioned by content hash.
+
+    Non-raster images (SVG) and uploads that are missing locally point at the
+    original file instead.
+    """
+    if not rel_path:
+        return ""
+    rel_path = str(rel_path)
+    if rel_path.startswith(("http://", "https://", "/")):
+        return rel_path
+    if not is_raster(rel_path):
+        return f"/media/{quote(rel_path)}"
+    size = _derivative_size(kind, size)
+    url = f"/images/{kind}/{size}/{quote(rel_path)}"
+    try:
+        return f"{url}?v={source_hash(Path(UPLOAD_DIR) / rel_path)}"
+    except OSError:
+        return url
+
+
+def avatar_url(name: Optional[str], size: int = 64) -> str:
+    return image_url(name, "avatar", size)
+
+
+try:
+    templates.env.filters['avatar_url'] = avatar_url
+except Exception:
+    pass
+
+
+@app.get("/images/{kind}/{size}/{rel_path:path}")
+def get_image_derivative(request: Request, kind: str, size: int, rel_path: str):
+    """Serve a WebP avatar/chat derivative, scheduling it on first request.
+
+    Until the worker has rendered it, the original is served via redirect so
+    nothing is resized on the request path.
+    """
+    if kind not in DERIVATIVE_SIZES or size not in DERIVATIVE_SIZES[kind]:
+        raise HTTPException(status_code=404, detail="Not found")
+    if any(part in ("", "..") for part in rel_path.split("/")):
+        raise HTTPException(status_code=404, detail="Not found")
+    src = Path(UPLOAD_DIR) / rel_path
+    if not src.exists() and not get_storage().exists(rel_path):
+        raise HTTPException(status_code=404, detail="Not found")
+    original = RedirectResponse(f"/media/{quote(rel_path)}", status_code=302, headers={"Cache-Control": "no-store"})
+    if not is_raster(rel_path) or not src.exists():
+        if is_raster(rel_path):
+            enqueue_image_derivatives(rel_path, kind)
+        return original
+    derived = existing_derivative(UPLOAD_DIR, rel_path, kind, size)
+    if derived is None:
+        enqueue_image_derivatives(rel_path, kind)
+        return original
+    requested = request.query_params.get("v")
+    cache_control = SLIDE_CACHE_CONTROL if requested and derived.name.startswith(requested + "_") else SLIDE_REVALIDATE_CACHE_CONTROL
+    return serve_file(request, derived, inline=True, media_type="image/webp", cache_control=cache_control)
 
 
 @app.api_route("/presentations/{presentation_id}/converted_pdf", methods=["GET", "HEAD"])
-def get_converted_pdf(presentation_id: int, inline: bool = Query(False)):
+def get_converted_pdf(request: Request, presentation_id: int, inline: bool = Query(False)):
     with Session(engine) as session:
         job = session.exec(
             select(ConversionJob)
@@ -8166,18 +8945,7 @@ def get_converted_pdf(presentation_id: int, inline: bool = Query(False)):
         if not pdf_path or not pdf_path.exists():
             raise HTTPException(status_code=404, detail="Converted PDF not found")
 
-    if inline:
-        return FileResponse(
-            pdf_path,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"inline; filename=\"{pdf_path.name}\""},
-        )
-
-    return FileResponse(
-        str(pdf_path),
-        media_type="application/octet-stream",
-        headers={"Content-Disposition": f"attachment; filename=\"{pdf_path.name}\""},
-    )
+    return _serve_upload(request, pdf_path, inline=inline)
 
 
 @app.post("/presentations/{presentation_id}/enqueue_conversion")
@@ -8227,11 +8995,25 @@ def download_presentation_variant(
             files = sorted(thumbs_dir.glob("slide_*.png"))
             if not files:
                 raise HTTPException(status_code=404, detail="Slides not available")
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-            tmp.close()
-            with zipfile.ZipFile(tmp.name, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                for f in files:
-                    zf.write(f, arcname=f.name)
+            # PNGs are already compressed: stream a STORED archive straight from
+            # the slide files, with an exact Content-Length and no temp file.
+            try:
+                archive = StoredZip((str(f), f.name) for f in files)
+            except (OSError, ValueError):
+                raise HTTPException(status_code=404, detail="Slides not available")
+            manifest = read_thumbnail_manifest(str(thumbs_dir))
+            digest = hashlib.sha256()
+            for f in files:
+                st = f.stat()
+                digest.update(f"{f.name}:{manifest.get(f.name) or f'{st.st_size}-{st.st_mtime_ns}'};".encode())
+            etag = digest.hexdigest()[:32]
+            zip_name = f"presentation_{presentation_id}_slides.zip"
+            zip_headers = {
+                "ETag": f'"{etag}"',
+                "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+            }
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=zip_headers)
             # increment downloads
             try:
                 p.downloads = int(getattr(p, "downloads", 0) or 0) + 1
@@ -8239,12 +9021,9 @@ def download_presentation_variant(
                 session.commit()
             except Exception:
                 session.rollback()
-            zip_name = f"presentation_{presentation_id}_slides.zip"
-            return FileResponse(
-                tmp.name,
-                media_type="application/octet-stream",
-                headers={"Content-Disposition": f"attachment; filename=\"{zip_name}\""},
-            )
+            zip_headers["Content-Length"] = str(len(archive))
+            zip_headers["Content-Disposition"] = content_disposition(zip_name)
+            return StreamingResponse(iter(archive), media_type="application/zip", headers=zip_headers)
 
         if kind == "pdf":
             pdf_path = None
@@ -8268,18 +9047,13 @@ def download_presentation_variant(
                 session.commit()
             except Exception:
                 session.rollback()
-            safe_pdf = Path(pdf_path).name
-            return FileResponse(
-                str(pdf_path),
-                media_type="application/octet-stream",
-                headers={"Content-Disposition": f"attachment; filename=\"{safe_pdf}\""},
-            )
+            return _serve_upload(request, pdf_path)
 
         # default: original
         if not p.filename:
             raise HTTPException(status_code=404, detail="File not found")
         original_path = Path(UPLOAD_DIR) / p.filename
-        if not original_path.exists():
+        if not original_path.exists() and not get_storage().exists(p.filename):
             raise HTTPException(status_code=404, detail="File not found")
         try:
             p.downloads = int(getattr(p, "downloads", 0) or 0) + 1
@@ -8287,12 +9061,7 @@ def download_presentation_variant(
             session.commit()
         except Exception:
             session.rollback()
-        safe_name = Path(p.filename).name
-        return FileResponse(
-            str(original_path),
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename=\"{safe_name}\""},
-        )
+        return _serve_upload(request, original_path, filename=Path(p.filename).name)
 
 
 @app.api_route("/download/{filename}", methods=["GET", "HEAD", "OPTIONS"])
@@ -8302,7 +9071,7 @@ def download_file(request: Request, filename: str, inline: bool = Query(False)):
     if request.method == "OPTIONS":
         return PlainTextResponse("ok", status_code=200)
 
-    if not path.exists():
+    if not path.exists() and not get_storage().exists(filename):
         # If the original file is missing, fall back to a static placeholder
         # for inline previews (used by featured cards) instead of noisy 404s.
         if inline:
@@ -8315,8 +9084,6 @@ def download_file(request: Request, filename: str, inline: bool = Query(False)):
         # For non-inline downloads, return a quiet 404 without extra logging.
         raise HTTPException(status_code=404, detail="Not found")
 
-    guessed_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
-
     # Look up the owning presentation (if any) to enforce privacy/download rules.
     from .models import Presentation as PresentationModel
     current_user = get_current_user_optional(request)
@@ -8338,8 +9105,10 @@ def download_file(request: Request, filename: str, inline: bool = Query(False)):
         if not inline and not allow_dl and (not current_user or current_user.id != owner_id):
             raise HTTPException(status_code=403, detail="Downloads are disabled for this file")
 
-        # count downloads for non-inline requests
-        if not inline:
+        # count downloads for non-inline requests; follow-up range requests of
+        # the same download (resumes, seeks) are not counted again
+        range_header = request.headers.get("range") or ""
+        if not inline and request.method == "GET" and (not range_header or range_header.replace(" ", "").startswith("bytes=0-")):
             try:
                 with Session(engine) as _s:
                     p_upd = _s.get(PresentationModel, pres.id)
@@ -8350,70 +9119,9 @@ def download_file(request: Request, filename: str, inline: bool = Query(False)):
             except Exception:
                 pass
 
-    # Support HTTP Range requests for efficient video streaming
-    range_header = request.headers.get("range")
-    if range_header:
-        try:
-            size = path.stat().st_size
-            m = re.match(r"bytes=(\d+)-(\d*)", range_header)
-            if m:
-                start = int(m.group(1))
-                end = int(m.group(2)) if m.group(2) else size - 1
-                if end >= size:
-                    end = size - 1
-                if start >= size:
-                    # Invalid range
-                    return PlainTextResponse(status_code=416, content="Requested Range Not Satisfiable")
-                length = end - start + 1
-
-                def file_stream(p: Path, _start: int, _length: int, chunk_size: int = 8192):
-                    with open(p, "rb") as fh:
-                        fh.seek(_start)
-                        remaining = _length
-                        while remaining > 0:
-                            read_size = min(chunk_size, remaining)
-                            chunk = fh.read(read_size)
-                            if not chunk:
-                                break
-                            remaining -= len(chunk)
-                            yield chunk
-
-                headers = {
-                    "Content-Range": f"bytes {start}-{end}/{size}",
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(length),
-                }
-                # include disposition for inline vs attachment
-                if inline:
-                    headers["Content-Disposition"] = f'inline; filename="{filename}"'
-                else:
-                    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-
-                return StreamingResponse(
-                    file_stream(path, start, length),
-                    status_code=206,
-                    media_type=guessed_type if inline else "application/octet-stream",
-                    headers=headers,
-                )
-        except Exception:
-            # Fall through to full-file response on any error parsing/serving ranges
-            pass
-
-    # For inline view, use the real media type and explicit inline disposition.
-    if inline:
-        return FileResponse(
-            path,
-            media_type=guessed_type,
-            headers={"Content-Disposition": f"inline; filename=\"{filename}\""},
-        )
-
-    # Force downloads across browsers (including iOS Safari) by always using
-    # attachment disposition and a generic binary media type.
-    return FileResponse(
-        path,
-        media_type="application/octet-stream",
-        headers={"Content-Disposition": f"attachment; filename=\"{filename}\""},
-    )
+    # Ranges (including multi-range and If-Range) and conditional requests are
+    # handled by the shared file server, which streams in large chunks.
+    return _serve_upload(request, path, filename=filename, inline=inline)
 
 
 @app.post("/presentations/{presentation_id}/comment")
@@ -8575,6 +9283,12 @@ def delete_presentation(
     except Exception:
         logger.exception("Failed to delete thumbnails directory", extra={"presentation_id": presentation_id})
 
+    # HD renders, HLS ladders, web MP4s and anything else registered for it
+    try:
+        artifacts.release_presentation_artifacts(presentation_id)
+    except Exception:
+        logger.exception("Failed to release presentation artifacts", extra={"presentation_id": presentation_id})
+
     return RedirectResponse(url="/upload?scope=mine", status_code=status.HTTP_302_FOUND)
 
 
@@ -8626,6 +9340,8 @@ def follow_user(username: str, current_user: User = Depends(get_current_user)):
                 & (Follow.following_id == target.id)
             )
         ).first()
+        manager.invalidate_audience(current_user.id)
+        manager.invalidate_audience(target.id)
         if existing:
             session.delete(existing)
             session.commit()
@@ -9057,6 +9773,11 @@ def admin_import_page(request: Request, current_user: User = Depends(get_current
     return templates.TemplateResponse('admin_import.html', {'request': request, 'current_user': current_user})
 
 
+def _ws_chat_follows(follower_id: int, following_id: int) -> bool:
+    with Session(engine) as session:
+        return session.exec(select(Follow.id).where((Follow.follower_id == follower_id) & (Follow.following_id == following_id))).first() is not None
+
+
 @app.websocket("/ws/chat/{other_id}")
 async def websocket_chat(websocket: WebSocket, other_id: int):
     # authenticate user from cookie (access_token)
@@ -9084,40 +9805,32 @@ async def websocket_chat(websocket: WebSocket, other_id: int):
             await websocket.close(code=1008)
             return
     me_id = user.id
-    await manager.connect(me_id, websocket)
+    wire = Wire.negotiate(websocket)
+    if not ws_limiter.admit(websocket, me_id):
+        await websocket.close(code=WS_CLOSE_POLICY)
+        return
+    await manager.connect(me_id, websocket, wire=wire)
+    heartbeat = Heartbeat(websocket, wire=wire)
     try:
-        # broadcast presence to other connected users
-        await manager.broadcast_presence(me_id, True)
+        resume_from = _ws_resume_from(websocket)
+        if resume_from is not None:
+            await wire.send(await _dm_replay(me_id, other_id, resume_from))
+        heartbeat.start()
         while True:
-            data = await websocket.receive_text()
-            try:
-                obj = json.loads(data)
-            except Exception:
-                continue
+            obj = await heartbeat.receive_json()
             # expected obj: { action: 'message'|'typing'|'read', content: '...', to: <user_id> }
             if obj.get("action") == "message":
                 to_id = int(obj.get("to"))
                 content = obj.get("content", "")
-                # persist message
-                with Session(engine) as session:
-                    # allow message creation when the sender (me_id) follows
-                    # the recipient (to_id). Mutual follow is no longer
-                    # required for WebSocket chat messages.
-                    follows = session.exec(select(Follow).where((Follow.follower_id == me_id) & (Follow.following_id == to_id))).first()
-                    if not follows:
-                        # ignore/skip message if sender does not follow recipient
-                        continue
-                    msg = Message(sender_id=me_id, recipient_id=to_id, content=content)
-                    session.add(msg)
-                    session.commit()
-                    session.refresh(msg)
-                    # create notification for recipient about new mutual chat message
-                    try:
-                        n = Notification(recipient_id=to_id, actor_id=me_id, verb="message", target_type="message", target_id=msg.id)
-                        session.add(n)
-                        session.commit()
-                    except Exception:
-                        session.rollback()
+                # allow message creation when the sender (me_id) follows
+                # the recipient (to_id). Mutual follow is no longer
+                # required for WebSocket chat messages.
+                if not await asyncio.get_running_loop().run_in_executor(None, _ws_chat_follows, me_id, to_id):
+                    # ignore/skip message if sender does not follow recipient
+                    continue
+                # persist message and the recipient's notification in the next batch
+                n = Notification(recipient_id=to_id, actor_id=me_id, verb="message", target_type="message")
+                msg = await get_sink().write(Message(sender_id=me_id, recipient_id=to_id, content=content), notifications=[n])
                 out = {
                     "type": "message",
                     "id": msg.id,
@@ -9158,10 +9871,8 @@ async def websocket_chat(websocket: WebSocket, other_id: int):
     except WebSocketDisconnect:
         pass
     finally:
-        try:
-            await manager.broadcast_presence(me_id, False)
-        except Exception:
-            pass
+        ws_limiter.release(websocket)
+        heartbeat.stop()
         await manager.disconnect(me_id, websocket)
 
 
@@ -9275,8 +9986,8 @@ def mark_messages_read(other_id: int, current_user: User = Depends(get_current_u
 
 
 @app.get('/api/online/{user_id}')
-def api_online(user_id: int):
-    return JSONResponse({"online": manager.is_online(user_id)})
+async def api_online(user_id: int):
+    return JSONResponse({"online": bool(await manager.online([user_id]))})
 
 
 @app.get('/api/classrooms/{classroom_id}/chat/messages')
@@ -9495,6 +10206,7 @@ def space_chat_post(
         session.add(msg)
         session.commit()
         session.refresh(msg)
+        _publish_space_message(msg, current_user)
 
         out = {
             "id": msg.id,
@@ -9611,6 +10323,12 @@ def api_me(current_user: User = Depends(get_current_user)):
     return JSONResponse({'id': current_user.id, 'username': current_user.username})
 
 
+@app.get('/api/me/storage')
+def api_me_storage(current_user: User = Depends(get_current_user)):
+    """Bytes stored for the current user (uploads, conversions, previews, chat files)."""
+    return JSONResponse(artifacts.usage(current_user.id))
+
+
 ## NOTE: POST /api/messages/{other_id} is handled earlier by api_post_message,
 ## which supports both JSON and multipart form data (for file attachments) and
 ## sends real-time WebSocket notifications. This legacy JSON-only handler has
@@ -9624,6 +10342,11 @@ def edit_profile_get(request: Request, current_user: User = Depends(get_current_
     )
 
 
+# Avatars are small by nature; anything bigger than this is refused before it
+# reaches the derivative pipeline.
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(5 * 1024 * 1024)))
+
+
 @app.post("/me/edit")
 async def edit_profile_post(
     request: Request,
@@ -9638,17 +10361,19 @@ async def edit_profile_post(
     if avatar and getattr(avatar, "filename", ""):
         av_ext = Path(avatar.filename).suffix.lower()
         content_type = getattr(avatar, "content_type", "") or ""
-        allowed_exts = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".avif"}
+        allowed_exts = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif"}
         mime_map = {
             "image/png": ".png",
             "image/jpeg": ".jpg",
             "image/gif": ".gif",
             "image/webp": ".webp",
-            "image/svg+xml": ".svg",
             "image/avif": ".avif",
         }
-        # Accept when extension is known OR when content-type is any image/*
-        if not (av_ext in allowed_exts or content_type.startswith("image/")):
+        # Accept when extension is known OR when content-type is any image/*.
+        # SVG is refused outright: it can carry script and is served as-is,
+        # with no raster derivative to fall back on.
+        is_svg = av_ext == ".svg" or content_type.startswith("image/svg")
+        if is_svg or not (av_ext in allowed_exts or content_type.startswith("image/")):
             return templates.TemplateResponse(
                 "edit_profile.html",
                 {
@@ -9662,8 +10387,25 @@ async def edit_profile_post(
             av_ext = mime_map.get(content_type, ".png")
         avatar_name = f"avatar_{current_user.id}_{uuid.uuid4().hex}{av_ext}"
         save_path = Path(UPLOAD_DIR) / avatar_name
+        total = 0
         with save_path.open("wb") as buffer:
-            shutil.copyfileobj(avatar.file, buffer)
+            while chunk := avatar.file.read(1024 * 64):
+                total += len(chunk)
+                if total > AVATAR_MAX_BYTES:
+                    break
+                buffer.write(chunk)
+        if total > AVATAR_MAX_BYTES:
+            save_path.unlink(missing_ok=True)
+            return templates.TemplateResponse(
+                "edit_profile.html",
+                {
+                    "request": request,
+                    "error": "Avatar is too large",
+                    "user_obj": current_user,
+                },
+            )
+        enqueue_image_derivatives(avatar_name, "avatar")
+        artifacts.record_artifact(avatar_name, "avatar", current_user.id)
         with Session(engine) as session:
             u = session.get(User, current_user.id)
             u.avatar = avatar_name
@@ -10319,6 +11061,8 @@ def follow_user(request: Request, user_id: int, current_user: User = Depends(get
             f = Follow(follower_id=current_user.id, following_id=user_id)
             session.add(f)
             session.commit()
+            manager.invalidate_audience(current_user.id)
+            manager.invalidate_audience(user_id)
             # create notification for the followed user
             try:
                 if user_id != current_user.id:
@@ -10352,6 +11096,8 @@ def unfollow_user(request: Request, user_id: int, current_user: User = Depends(g
         if item:
             session.delete(item)
             session.commit()
+            manager.invalidate_audience(current_user.id)
+            manager.invalidate_audience(user_id)
         followers = session.exec(select(Follow).where(Follow.following_id == user_id)).all()
         follower_count = len(followers)
     accept = request.headers.get('accept', '')
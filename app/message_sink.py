@@ -0,0 +1,140 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from sqlmodel import Session, SQLModel
+
+logger = logging.getLogger("slideshare.message_sink")
+
+# Write-behind persistence for chat messages. Websocket handlers hand rows to
+# the sink and await the result; the sink collects rows for up to
+# MESSAGE_SINK_INTERVAL_MS (or MESSAGE_SINK_MAX_BATCH rows) and writes them in
+# one transaction on a single writer thread, off the event loop. Ids come back
+# from one multi-row INSERT, and the awaiting handler resumes only after the
+# commit, so anything it broadcasts is already durable.
+MESSAGE_SINK_INTERVAL_MS = float(os.getenv("MESSAGE_SINK_INTERVAL_MS", "5"))
+MESSAGE_SINK_MAX_BATCH = int(os.getenv("MESSAGE_SINK_MAX_BATCH", "200"))
+
+
+class MessageSink:
+    """Batches message inserts (plus the notifications that point at them)."""
+
+    def __init__(self, engine=None, interval_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self._engine = engine
+        self.interval = (MESSAGE_SINK_INTERVAL_MS if interval_ms is None else interval_ms) / 1000.0
+        self.max_batch = max_batch or MESSAGE_SINK_MAX_BATCH
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-sink")
+        self._queue: List[tuple] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from .database import engine
+            return engine
+        return self._engine
+
+    async def write(self, row: SQLModel, notifications=()) -> SQLModel:
+        """Persist ``row`` with the next batch and return it with its id set.
+
+        Each notification without a ``target_id`` is pointed at the row.
+        Raises whatever the database raised for this row.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # first use, or a new loop (tests): start a fresh batcher there
+            self._loop, self._wake, self._task, self._queue = loop, asyncio.Event(), None, []
+        future = loop.create_future()
+        self._queue.append((row, list(notifications), future))
+        if len(self._queue) >= self.max_batch:
+            self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            if len(self._queue) < self.max_batch and self.interval > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            try:
+                errors = await loop.run_in_executor(self._executor, self._commit, batch)
+            except Exception as exc:
+                errors = [exc] * len(batch)
+            self.batches += 1
+            for (row, _, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(row)
+                else:
+                    future.set_exception(error)
+
+    def _commit(self, batch) -> list:
+        """Write a batch in one transaction; on failure retry rows one by one."""
+        linked = []
+        try:
+            with Session(self.engine, expire_on_commit=False) as session:
+                session.add_all([row for row, _, _ in batch])
+                session.flush()
+                for row, notifications, _ in batch:
+                    for notification in notifications:
+                        if notification.target_id is None:
+                            notification.target_id = row.id
+                            linked.append(notification)
+                        session.add(notification)
+                session.commit()
+            return [None] * len(batch)
+        except Exception as exc:
+            # the transaction rolled back: forget ids that were never committed
+            for row, notifications, _ in batch:
+                row.id = None
+                for notification in notifications:
+                    notification.id = None
+            for notification in linked:
+                notification.target_id = None
+            if len(batch) == 1:
+                logger.warning("message write failed: %s", exc)
+                return [exc]
+            logger.warning("message batch of %d failed, retrying individually: %s", len(batch), exc)
+            return [self._commit([item])[0] for item in batch]
+
+    async def close(self) -> None:
+        """Flush what is queued and stop the writer thread."""
+        if self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop():
+            self._wake.set()
+            await self._task
+        self._executor.shutdown(wait=True)
+
+
+_sink: Optional[MessageSink] = None
+
+
+def get_sink() -> MessageSink:
+    global _sink
+    if _sink is None:
+        _sink = MessageSink()
+    return _sink
+
+
+def set_sink(sink: Optional[MessageSink]) -> None:
+    """Swap the process-wide sink (tests)."""
+    global _sink
+    _sink = sink
+
+
+async def close_sink() -> None:
+    global _sink
+    sink, _sink = _sink, None
+    if sink is not None:
+        await sink.close()
@@ -55,6 +55,7 @@ class Presentation(SQLModel, table=True):
     file_size: Optional[int] = None
     language: Optional[str] = None
     mimetype: Optional[str] = None
+    content_sha256: Optional[str] = Field(default=None, index=True)
     owner_id: Optional[int] = Field(default=None, foreign_key="user.id")
     category_id: Optional[int] = Field(default=None, foreign_key="category.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -123,6 +124,7 @@ class ConversionJob(SQLModel, table=True):
     status: Optional[str] = None
     result: Optional[str] = None
     log: Optional[str] = None
+    artifacts: Optional[str] = None  # JSON: {storage key: {"ok", "attempts", "bytes", "error"}}
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -343,3 +345,36 @@ class ConsentLog(SQLModel, table=True):
     ip: Optional[str] = None
     ua: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UploadSession(SQLModel, table=True):
+    """Resumable (tus-style) upload in progress; bytes live in the staging dir."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    upload_id: str = Field(index=True, unique=True)
+    owner_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    filename: str
+    size: int
+    offset: int = 0  # contiguous bytes received from the start of the file
+    received: Optional[str] = None  # JSON list of [start, end) byte ranges written
+    upload_metadata: Optional[str] = None  # JSON: title, description, tags, ...
+    status: str = Field(default="uploading")  # uploading|complete|failed
+    presentation_id: Optional[int] = Field(default=None, foreign_key="presentation.id")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class Artifact(SQLModel, table=True):
+    """A stored file (or directory tree, key ending in "/") under UPLOAD_DIR.
+
+    Rows are the source of per-user storage usage and are reconciled by the
+    artifact GC sweep; presentation_id has no foreign key so rows can outlive
+    a deleted presentation until the sweep removes its files.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    key: str = Field(index=True, unique=True)
+    kind: str  # upload|pdf|thumbs|thumbs_hd|hls|video|avatar|chat
+    owner_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
+    presentation_id: Optional[int] = Field(default=None, index=True)
+    size: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,140 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger("slideshare.pdf_cache")
+
+PDF_CACHE_MAX_DOCS = int(os.getenv("PDF_CACHE_MAX_DOCS", "16"))
+# approximate budget: an open document is charged its file size
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+class _CachedDocument:
+    __slots__ = ("doc", "size", "lock", "refs", "evicted")
+
+    def __init__(self, doc, size: int):
+        self.doc = doc
+        self.size = size
+        # fitz documents are not safe for concurrent use; callers hold this while rendering
+        self.lock = threading.Lock()
+        self.refs = 0
+        self.evicted = False
+
+
+class PdfDocumentCache:
+    """LRU cache of open PyMuPDF documents keyed by (path, mtime).
+
+    Reopening a PDF re-parses its xref table, which dominates the cost of
+    rendering a single page or pulling a few pages of text. Entries are bounded
+    by count and approximate bytes; a document evicted while in use is closed
+    once its last borrower releases it.
+    """
+
+    def __init__(self, max_docs: int = PDF_CACHE_MAX_DOCS, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.max_docs = max(1, int(max_docs))
+        self.max_bytes = max(1, int(max_bytes))
+        self._entries: "OrderedDict[tuple, _CachedDocument]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def open(self, path):
+        """Yield an open fitz.Document for path, holding its lock for the block."""
+        if fitz is None:
+            raise RuntimeError("PyMuPDF is not installed")
+        resolved = str(Path(path).resolve())
+        st = os.stat(resolved)
+        key = (resolved, st.st_mtime_ns)
+        entry = self._acquire(key)
+        if entry is None:
+            entry = self._insert(key, _CachedDocument(fitz.open(resolved), st.st_size))
+        try:
+            with entry.lock:
+                yield entry.doc
+        finally:
+            self._release(entry)
+
+    def invalidate(self, path) -> None:
+        """Drop every cached handle for path (e.g. after a conversion rewrites it)."""
+        resolved = str(Path(path).resolve())
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == resolved]:
+                self._evict_locked(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._evict_locked(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._entries), "bytes": self._bytes}
+
+    def _acquire(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.refs += 1
+            return entry
+
+    def _insert(self, key, entry: _CachedDocument) -> _CachedDocument:
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # another thread opened the same document first; keep theirs
+                existing.refs += 1
+                self._entries.move_to_end(key)
+                self._close(entry)
+                return existing
+            # a newer mtime supersedes older handles for the same file
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._evict_locked(stale)
+            entry.refs += 1
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_docs or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                if oldest == key:
+                    break
+                self._evict_locked(oldest)
+            return entry
+
+    def _release(self, entry: _CachedDocument) -> None:
+        with self._lock:
+            entry.refs -= 1
+            close_now = entry.evicted and entry.refs <= 0
+        if close_now:
+            self._close(entry)
+
+    def _evict_locked(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        entry.evicted = True
+        if entry.refs <= 0:
+            self._close(entry)
+
+    @staticmethod
+    def _close(entry: _CachedDocument) -> None:
+        try:
+            entry.doc.close()
+        except Exception:
+            logger.debug("closing cached PDF failed", exc_info=True)
+
+
+pdf_cache = PdfDocumentCache()
+
+
+def open_pdf(path):
+    """Borrow a cached fitz.Document: ``with open_pdf(p) as doc: ...``."""
+    return pdf_cache.open(path)
@@ -0,0 +1,1085 @@
+import os
+import json
+import uuid
+import asyncio
+import time
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from functools import partial
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
+
+from .wire import Wire
+
+try:
+    import redis as _redis_sync
+    import redis.asyncio as aioredis
+except ImportError:
+    _redis_sync = None
+    aioredis = None
+
+logger = logging.getLogger("slideshare.realtime")
+
+# Realtime fan-out across workers. Sockets only exist on the worker that
+# accepted them, so every delivery is published on a bus channel ("user:7",
+# "space:3", ...) and each worker forwards it to the sockets it holds. Presence
+# and the little shared state video signaling needs also live on the bus.
+# REALTIME_BACKEND=memory|redis; the default is redis when REDIS_URL is set.
+REALTIME_BACKEND = os.getenv("REALTIME_BACKEND", "").lower()
+REALTIME_KEY_PREFIX = os.getenv("REALTIME_KEY_PREFIX", "rt:")
+# a worker that stops refreshing its liveness key is treated as gone
+REALTIME_NODE_TTL = int(os.getenv("REALTIME_NODE_TTL", "30"))
+
+# Room fan-out writes through a bounded queue per socket, drained by its own
+# writer task, so one slow client never delays the rest of the room. A socket
+# whose backlog exceeds WS_OUTBOX_MAX is closed; typing/seen events are
+# coalesced per sender and dropped first once the backlog passes
+# WS_OUTBOX_EPHEMERAL_MAX.
+WS_OUTBOX_MAX = int(os.getenv("WS_OUTBOX_MAX", "256"))
+WS_OUTBOX_EPHEMERAL_MAX = int(os.getenv("WS_OUTBOX_EPHEMERAL_MAX", "32"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+EPHEMERAL_TYPES = {"typing", "seen"}
+# 1013 "try again later": the client fell too far behind
+WS_CLOSE_BACKLOG = 1013
+
+# Every socket gets a server ping each WS_PING_INTERVAL seconds; clients answer
+# with a pong, so a socket that sends nothing for WS_IDLE_TIMEOUT is dead and
+# gets closed. WS_SWEEP_INTERVAL is how often the connection maps are checked
+# for sockets whose handler never cleaned up.
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "25"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "75"))
+WS_SWEEP_INTERVAL = float(os.getenv("WS_SWEEP_INTERVAL", "30"))
+# 1001 "going away": no frames from the client within the idle timeout
+WS_CLOSE_IDLE = 1001
+PING = {"type": "ping", "event": "ping"}
+
+# Admission control, per worker. A user may hold WS_MAX_SOCKETS_PER_USER
+# sockets and a client address WS_MAX_SOCKETS_PER_IP (0 = no cap); handlers
+# check before accepting, so a refused handshake costs no socket state. Each
+# socket's inbound messages draw from a token bucket refilled at WS_MSG_RATE
+# per second up to WS_MSG_BURST: messages past it are dropped, and a socket
+# that keeps sending into an empty bucket is closed with 1008.
+#
+# The per-address cap is off by default. Behind a proxy every socket has the
+# proxy's address unless uvicorn trusts its X-Forwarded-For (FORWARDED_ALLOW_IPS),
+# and even then a whole school behind one NAT shares an address: only set it
+# with a limit well above the largest class that connects from one network.
+WS_MAX_SOCKETS_PER_USER = int(os.getenv("WS_MAX_SOCKETS_PER_USER", "8"))
+WS_MAX_SOCKETS_PER_IP = int(os.getenv("WS_MAX_SOCKETS_PER_IP", "0"))
+WS_MSG_RATE = float(os.getenv("WS_MSG_RATE", "10"))
+WS_MSG_BURST = int(os.getenv("WS_MSG_BURST", "30"))
+# 1008 "policy violation": refused at the handshake, or flooding
+WS_CLOSE_POLICY = 1008
+
+# Room events carrying a "seq" (the message id, monotonic per room) are kept in
+# a ring of the last REPLAY_BUFFER_SIZE per room, so a client reconnecting with
+# ``resume_from`` gets what it missed without a database query. A room stays
+# subscribed for REPLAY_GRACE_SECONDS after its last socket leaves so the ring
+# survives a reconnect.
+REPLAY_BUFFER_SIZE = int(os.getenv("REPLAY_BUFFER_SIZE", "500"))
+REPLAY_GRACE_SECONDS = float(os.getenv("REPLAY_GRACE_SECONDS", "60"))
+
+# Presence changes are collected for PRESENCE_FLUSH_INTERVAL seconds and then
+# sent as one diff per interested user, so a tab that reconnects within the
+# window produces no event at all. Who is interested in a user is resolved by
+# the manager's ``audience`` callable and cached for PRESENCE_AUDIENCE_TTL.
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "2"))
+PRESENCE_AUDIENCE_TTL = float(os.getenv("PRESENCE_AUDIENCE_TTL", "60"))
+PRESENCE_AUDIENCE_CACHE_SIZE = int(os.getenv("PRESENCE_AUDIENCE_CACHE_SIZE", "5000"))
+# users last announced online, shared by all workers so the diff is against
+# what watchers were actually told, whichever worker told them
+PRESENCE_ANNOUNCED_KEY = "presence:announced"
+
+Callback = Callable[[dict], Awaitable[None]]
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{int(user_id)}"
+
+
+class RealtimeBus(ABC):
+    """Channel publish/subscribe plus shared sets, hashes and presence."""
+
+    name = "base"
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex[:12]
+        self._handlers: Dict[str, Set[Callback]] = {}
+
+    async def subscribe(self, channel: str, callback: Callback) -> None:
+        handlers = self._handlers.get(channel)
+        if handlers is None:
+            handlers = self._handlers[channel] = set()
+            handlers.add(callback)
+            await self._listen(channel)
+        else:
+            handlers.add(callback)
+
+    async def unsubscribe(self, channel: str, callback: Callback) -> None:
+        handlers = self._handlers.get(channel)
+        if not handlers:
+            return
+        handlers.discard(callback)
+        if not handlers:
+            self._handlers.pop(channel, None)
+            await self._unlisten(channel)
+
+    def has_subscribers(self, channel: str) -> bool:
+        return bool(self._handlers.get(channel))
+
+    async def _dispatch(self, channel: str, message: dict) -> None:
+        for callback in list(self._handlers.get(channel, ())):
+            try:
+                await callback(message)
+            except Exception:
+                logger.debug("realtime handler for %s failed", channel, exc_info=True)
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict) -> None:
+        ...
+
+    async def _listen(self, channel: str) -> None:
+        pass
+
+    async def _unlisten(self, channel: str) -> None:
+        pass
+
+    # shared state; members and values are strings
+    @abstractmethod
+    async def sadd(self, key: str, *members) -> None:
+        ...
+
+    @abstractmethod
+    async def srem(self, key: str, *members) -> None:
+        ...
+
+    @abstractmethod
+    async def smembers(self, key: str) -> Set[str]:
+        ...
+
+    @abstractmethod
+    async def hset(self, key: str, field, value: str) -> None:
+        ...
+
+    @abstractmethod
+    async def hget(self, key: str, field) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def hdel(self, key: str, field) -> None:
+        ...
+
+    @abstractmethod
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    # presence: a worker joins a user on their first local socket, leaves on the last
+    @abstractmethod
+    async def presence_join(self, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def presence_leave(self, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def online(self, user_ids: Iterable[int]) -> Set[int]:
+        ...
+
+    async def close(self) -> None:
+        self._handlers.clear()
+
+
+class MemoryBus(RealtimeBus):
+    """Single-process bus: publish calls the local subscribers directly."""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._sets: Dict[str, Set[str]] = {}
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._presence: Dict[int, int] = {}
+
+    async def publish(self, channel: str, message: dict) -> None:
+        await self._dispatch(channel, message)
+
+    async def sadd(self, key, *members):
+        self._sets.setdefault(key, set()).update(str(m) for m in members)
+
+    async def srem(self, key, *members):
+        values = self._sets.get(key)
+        if values is None:
+            return
+        values.difference_update(str(m) for m in members)
+        if not values:
+            self._sets.pop(key, None)
+
+    async def smembers(self, key):
+        return set(self._sets.get(key, ()))
+
+    async def hset(self, key, field, value):
+        self._hashes.setdefault(key, {})[str(field)] = value
+
+    async def hget(self, key, field):
+        return self._hashes.get(key, {}).get(str(field))
+
+    async def hdel(self, key, field):
+        values = self._hashes.get(key)
+        if values is not None:
+            values.pop(str(field), None)
+            if not values:
+                self._hashes.pop(key, None)
+
+    async def hgetall(self, key):
+        return dict(self._hashes.get(key, {}))
+
+    async def delete(self, key):
+        self._sets.pop(key, None)
+        self._hashes.pop(key, None)
+
+    async def presence_join(self, user_id):
+        self._presence[int(user_id)] = self._presence.get(int(user_id), 0) + 1
+
+    async def presence_leave(self, user_id):
+        left = self._presence.get(int(user_id), 0) - 1
+        if left > 0:
+            self._presence[int(user_id)] = left
+        else:
+            self._presence.pop(int(user_id), None)
+
+    async def online(self, user_ids):
+        return {int(uid) for uid in user_ids if self._presence.get(int(uid))}
+
+
+class RedisBus(RealtimeBus):
+    """Redis pub/sub fan-out. One subscriber connection per worker listens to
+    the channels of the sockets that worker holds; a heartbeat key marks the
+    worker alive so presence left behind by a crashed worker expires."""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = REALTIME_KEY_PREFIX):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+        self._pubsub = None
+        self._ready: Optional[asyncio.Future] = None
+        self._tasks = []
+
+    def _key(self, *parts) -> str:
+        return self.prefix + ":".join(str(p) for p in parts)
+
+    async def _ensure(self):
+        if self._ready is None:
+            self._ready = asyncio.ensure_future(self._start())
+        try:
+            await asyncio.shield(self._ready)
+        except Exception:
+            self._ready = None
+            raise
+        return self._client
+
+    async def _start(self):
+        client = aioredis.from_url(self.url, decode_responses=True)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        # a channel of our own keeps the subscriber connection open before any socket joins
+        await pubsub.subscribe(self._key("node", self.node_id))
+        await client.set(self._key("alive", self.node_id), "1", ex=REALTIME_NODE_TTL)
+        self._client, self._pubsub = client, pubsub
+        self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._heartbeat_loop())]
+
+    async def _read_loop(self):
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    channel = item["channel"][len(self.prefix):]
+                    try:
+                        message = json.loads(item["data"])
+                    except ValueError:
+                        continue
+                    await self._dispatch(channel, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("realtime subscriber failed; reconnecting", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(max(1, REALTIME_NODE_TTL // 3))
+            try:
+                await self._client.set(self._key("alive", self.node_id), "1", ex=REALTIME_NODE_TTL)
+            except Exception:
+                logger.debug("realtime heartbeat failed", exc_info=True)
+
+    async def publish(self, channel, message):
+        try:
+            client = await self._ensure()
+            await client.publish(self._key(channel), json.dumps(message, default=str))
+        except Exception:
+            logger.warning("publishing to %s failed", channel, exc_info=True)
+
+    async def _listen(self, channel):
+        await self._ensure()
+        await self._pubsub.subscribe(self._key(channel))
+
+    async def _unlisten(self, channel):
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self._key(channel))
+
+    async def sadd(self, key, *members):
+        if members:
+            await (await self._ensure()).sadd(self._key(key), *[str(m) for m in members])
+
+    async def srem(self, key, *members):
+        if members:
+            await (await self._ensure()).srem(self._key(key), *[str(m) for m in members])
+
+    async def smembers(self, key):
+        return set(await (await self._ensure()).smembers(self._key(key)))
+
+    async def hset(self, key, field, value):
+        await (await self._ensure()).hset(self._key(key), str(field), value)
+
+    async def hget(self, key, field):
+        return await (await self._ensure()).hget(self._key(key), str(field))
+
+    async def hdel(self, key, field):
+        await (await self._ensure()).hdel(self._key(key), str(field))
+
+    async def hgetall(self, key):
+        return await (await self._ensure()).hgetall(self._key(key))
+
+    async def delete(self, key):
+        await (await self._ensure()).delete(self._key(key))
+
+    async def presence_join(self, user_id):
+        client = await self._ensure()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._key("presence", int(user_id)), self.node_id)
+            pipe.sadd(self._key("node-users", self.node_id), int(user_id))
+            await pipe.execute()
+
+    async def presence_leave(self, user_id):
+        client = await self._ensure()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.srem(self._key("presence", int(user_id)), self.node_id)
+            pipe.srem(self._key("node-users", self.node_id), int(user_id))
+            await pipe.execute()
+
+    async def online(self, user_ids):
+        ids = [int(uid) for uid in user_ids]
+        if not ids:
+            return set()
+        client = await self._ensure()
+        async with client.pipeline(transaction=False) as pipe:
+            for uid in ids:
+                pipe.smembers(self._key("presence", uid))
+            node_sets = await pipe.execute()
+        nodes = sorted(set().union(*node_sets))
+        if not nodes:
+            return set()
+        alive = await client.mget([self._key("alive", n) for n in nodes])
+        live_nodes = {n for n, flag in zip(nodes, alive) if flag} | {self.node_id}
+        return {uid for uid, members in zip(ids, node_sets) if members & live_nodes}
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        client, pubsub = self._client, self._pubsub
+        self._client = self._pubsub = self._ready = None
+        if client is not None:
+            try:
+                users = await client.smembers(self._key("node-users", self.node_id))
+                async with client.pipeline(transaction=False) as pipe:
+                    for uid in users:
+                        pipe.srem(self._key("presence", uid), self.node_id)
+                    pipe.delete(self._key("node-users", self.node_id), self._key("alive", self.node_id))
+                    await pipe.execute()
+                await pubsub.aclose()
+                await client.aclose()
+            except Exception:
+                logger.debug("closing realtime bus failed", exc_info=True)
+        await super().close()
+
+
+_bus: Optional[RealtimeBus] = None
+
+
+def get_bus() -> RealtimeBus:
+    """The process-wide bus; Redis when configured and reachable, else in-memory."""
+    global _bus
+    if _bus is None:
+        url = os.getenv("REDIS_URL")
+        backend = REALTIME_BACKEND or ("redis" if url else "memory")
+        if backend == "redis" and url and aioredis is not None:
+            try:
+                _redis_sync.from_url(url, socket_connect_timeout=2).ping()
+                _bus = RedisBus(url)
+            except Exception:
+                logger.warning("realtime bus: redis at REDIS_URL unreachable; using in-memory bus")
+        if _bus is None:
+            _bus = MemoryBus()
+    return _bus
+
+
+def set_bus(bus: Optional[RealtimeBus]) -> None:
+    """Swap the process-wide bus (tests, or an app factory)."""
+    global _bus
+    _bus = bus
+
+
+async def close_bus() -> None:
+    global _bus
+    bus, _bus = _bus, None
+    if bus is not None:
+        await bus.close()
+
+
+async def accept_websocket(websocket: WebSocket, wire: Optional[Wire] = None) -> None:
+    """Accept unless the handler already did, with the subprotocol ``wire`` negotiated."""
+    if websocket.client_state == WebSocketState.CONNECTING:
+        await websocket.accept(subprotocol=wire.subprotocol if wire is not None else None)
+
+
+def is_closed(websocket: WebSocket) -> bool:
+    return (websocket.client_state == WebSocketState.DISCONNECTED
+            or websocket.application_state == WebSocketState.DISCONNECTED)
+
+
+def client_address(websocket: WebSocket) -> Optional[str]:
+    client = websocket.client
+    return client.host if client else None
+
+
+class TokenBucket:
+    """``take`` succeeds while tokens last; they refill at ``rate`` per second up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._stamp = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ConnectionLimiter:
+    """Caps the sockets this worker holds per user and per client address.
+
+    ``admit`` before accepting, ``release`` when the socket is done (safe to
+    call twice, or for a socket that was never admitted).
+    """
+
+    def __init__(self, per_user: Optional[int] = None, per_ip: Optional[int] = None):
+        self.per_user = WS_MAX_SOCKETS_PER_USER if per_user is None else per_user
+        self.per_ip = WS_MAX_SOCKETS_PER_IP if per_ip is None else per_ip
+        self._held: Dict[WebSocket, tuple] = {}
+        self._users: Dict[int, int] = {}
+        self._ips: Dict[str, int] = {}
+        self.refused = 0
+
+    def admit(self, websocket: WebSocket, user_id: Optional[int] = None) -> bool:
+        """Count the socket against its user (when authenticated) and address; False when over a cap."""
+        if websocket in self._held:
+            return True
+        uid = int(user_id) if user_id is not None else None
+        ip = client_address(websocket)
+        if (uid is not None and self.per_user and self._users.get(uid, 0) >= self.per_user) or (
+                ip is not None and self.per_ip and self._ips.get(ip, 0) >= self.per_ip):
+            self.refused += 1
+            logger.info("refusing websocket for user %s from %s: too many sockets", uid, ip)
+            return False
+        self._held[websocket] = (uid, ip)
+        if uid is not None:
+            self._users[uid] = self._users.get(uid, 0) + 1
+        if ip is not None:
+            self._ips[ip] = self._ips.get(ip, 0) + 1
+        return True
+
+    def release(self, websocket: WebSocket) -> None:
+        held = self._held.pop(websocket, None)
+        if held is None:
+            return
+        for counts, key in ((self._users, held[0]), (self._ips, held[1])):
+            if key is None:
+                continue
+            left = counts.get(key, 0) - 1
+            if left > 0:
+                counts[key] = left
+            else:
+                counts.pop(key, None)
+
+    def sweep(self) -> int:
+        """Release closed sockets a handler never released; returns how many."""
+        dead = [ws for ws in list(self._held) if is_closed(ws)]
+        for ws in dead:
+            self.release(ws)
+        return len(dead)
+
+    def stats(self) -> dict:
+        return {"sockets": len(self._held), "users": len(self._users), "addresses": len(self._ips),
+                "refused": self.refused}
+
+
+def _is_pong(data) -> bool:
+    return isinstance(data, dict) and (data.get("type") == "pong" or data.get("event") == "pong")
+
+
+class Heartbeat:
+    """Server pings and an idle timeout for one websocket.
+
+    Handlers read through ``receive_json``: frames are decoded by the socket's
+    ``Wire``, client pongs and undecodable frames are skipped, and a read that
+    waits longer than ``idle_timeout`` closes the socket and raises
+    ``WebSocketDisconnect``, so the handler's usual cleanup runs. ``send``
+    replaces ``wire.send`` for pings (a room socket passes its ``Outbox.offer``
+    to keep a single writer). Messages are rate limited per ``rate``/``burst``
+    (``rate=0`` turns that off).
+    """
+
+    def __init__(self, websocket: WebSocket, send: Optional[Callable[[dict], object]] = None,
+                 ping_interval: Optional[float] = None, idle_timeout: Optional[float] = None,
+                 wire: Optional[Wire] = None, rate: Optional[float] = None, burst: Optional[int] = None):
+        self.websocket = websocket
+        self.wire = wire or Wire(websocket)
+        self._send = send
+        self.ping_interval = WS_PING_INTERVAL if ping_interval is None else ping_interval
+        self.idle_timeout = WS_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        rate = WS_MSG_RATE if rate is None else rate
+        self.bucket = TokenBucket(rate, WS_MSG_BURST if burst is None else burst) if rate > 0 else None
+        self.throttled = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "Heartbeat":
+        if self.ping_interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.ping_interval)
+                if self._send is not None:
+                    result = self._send(PING)
+                    if asyncio.iscoroutine(result):
+                        await result
+                else:
+                    await asyncio.wait_for(self.wire.send(PING), WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # the socket is gone; the reader finds out on its next receive
+            logger.debug("websocket ping failed", exc_info=True)
+
+    async def _receive(self, read):
+        timeout = self.idle_timeout if self.idle_timeout > 0 else None
+        try:
+            return await asyncio.wait_for(read(), timeout)
+        except asyncio.TimeoutError:
+            logger.info("closing websocket idle for %ss", self.idle_timeout)
+            await self._close(WS_CLOSE_IDLE)
+
+    async def _close(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+        raise WebSocketDisconnect(code=code)
+
+    async def receive_json(self) -> dict:
+        dropped = 0
+        while True:
+            data = await self._receive(self.wire.receive)
+            if not isinstance(data, dict) or _is_pong(data):
+                continue
+            if self.bucket is None or self.bucket.take():
+                return data
+            self.throttled += 1
+            dropped += 1
+            if dropped > self.bucket.burst:
+                logger.info("closing websocket flooding past %s messages/s", self.bucket.rate)
+                await self._close(WS_CLOSE_POLICY)
+
+
+class WebSocketManager:
+    """Per-user sockets held by this worker.
+
+    ``send_personal`` publishes on the user's channel, so it reaches the user
+    on whichever worker holds their sockets; this worker subscribes to a user's
+    channel while it holds at least one of their sockets.
+
+    A user's first connection and last disconnection on this worker queue a
+    presence change; changes are flushed as ``{"type": "presence", "changes":
+    {"<id>": true|false}}`` to the online users returned by ``audience(user_id)``.
+    """
+
+    def __init__(self, bus: Optional[RealtimeBus] = None,
+                 audience: Optional[Callable[[int], Iterable[int]]] = None):
+        self._bus = bus
+        self._conns: Dict[int, Set[WebSocket]] = {}
+        self._wires: Dict[WebSocket, Wire] = {}
+        self._subs: Dict[int, Callback] = {}
+        self._lock = asyncio.Lock()
+        self.audience = audience
+        self.presence_interval = PRESENCE_FLUSH_INTERVAL
+        self._audience_cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._presence_pending: Set[int] = set()
+        self._presence_task: Optional[asyncio.Task] = None
+
+    @property
+    def bus(self) -> RealtimeBus:
+        return self._bus or get_bus()
+
+    async def connect(self, user_id: int, websocket: WebSocket, wire: Optional[Wire] = None):
+        await accept_websocket(websocket, wire)
+        uid = int(user_id)
+        async with self._lock:
+            conns = self._conns.setdefault(uid, set())
+            first = not conns
+            conns.add(websocket)
+            self._wires[websocket] = wire or Wire(websocket)
+            if first:
+                handler = self._subs[uid] = partial(self._deliver, uid)
+                await self.bus.subscribe(user_channel(uid), handler)
+                await self.bus.presence_join(uid)
+        if first:
+            await self.broadcast_presence(uid, True)
+
+    async def disconnect(self, user_id: int, websocket: WebSocket):
+        uid = int(user_id)
+        async with self._lock:
+            conns = self._conns.get(uid)
+            if not conns or websocket not in conns:
+                return
+            conns.discard(websocket)
+            self._wires.pop(websocket, None)
+            if conns:
+                return
+            self._conns.pop(uid, None)
+            handler = self._subs.pop(uid, None)
+            if handler is not None:
+                await self.bus.unsubscribe(user_channel(uid), handler)
+            await self.bus.presence_leave(uid)
+        await self.broadcast_presence(uid, False)
+
+    async def _deliver(self, user_id: int, payload: dict):
+        for ws in list(self._conns.get(int(user_id), ())):
+            try:
+                await (self._wires.get(ws) or Wire(ws)).send(payload)
+            except Exception:
+                # best-effort: drop sockets that cannot be written to
+                try:
+                    await self.disconnect(user_id, ws)
+                except Exception:
+                    pass
+
+    async def send_personal(self, user_id: int, payload: dict):
+        await self.bus.publish(user_channel(user_id), payload)
+
+    async def broadcast_presence(self, user_id: int, online: bool):
+        """Queue a presence change for the next flush.
+
+        ``online`` is only a hint: the flush announces the user's state across
+        all workers at that moment, so a quick disconnect/reconnect cancels out.
+        """
+        self._presence_pending.add(int(user_id))
+        if self._presence_task is None or self._presence_task.done():
+            self._presence_task = asyncio.ensure_future(self._presence_loop())
+
+    async def _presence_loop(self):
+        while self._presence_pending:
+            await asyncio.sleep(self.presence_interval)
+            try:
+                await self.flush_presence()
+            except Exception:
+                logger.warning("presence flush failed", exc_info=True)
+
+    async def flush_presence(self) -> Dict[int, Dict[str, bool]]:
+        """Send the queued presence changes; returns the diffs per recipient."""
+        changed, self._presence_pending = self._presence_pending, set()
+        if not changed or self.audience is None:
+            return {}
+        online = await self.online(changed)
+        diffs: Dict[int, Dict[str, bool]] = {}
+        for uid in sorted(changed):
+            state = uid in online
+            if (await self.bus.hget(PRESENCE_ANNOUNCED_KEY, uid) == "1") == state:
+                continue
+            if state:
+                await self.bus.hset(PRESENCE_ANNOUNCED_KEY, uid, "1")
+            else:
+                await self.bus.hdel(PRESENCE_ANNOUNCED_KEY, uid)
+            for rid in await self._audience_for(uid):
+                if rid != uid:
+                    diffs.setdefault(rid, {})[str(uid)] = state
+        if not diffs:
+            return {}
+        listening = await self.online(diffs)
+        diffs = {rid: diff for rid, diff in diffs.items() if rid in listening}
+        for rid, diff in diffs.items():
+            await self.send_personal(rid, {"type": "presence", "changes": diff})
+        return diffs
+
+    async def _audience_for(self, user_id: int) -> Set[int]:
+        now = time.monotonic()
+        cached = self._audience_cache.get(user_id)
+        if cached is not None and cached[0] > now:
+            self._audience_cache.move_to_end(user_id)
+            return cached[1]
+        try:
+            loop = asyncio.get_running_loop()
+            ids = {int(uid) for uid in await loop.run_in_executor(None, self.audience, user_id)}
+        except Exception:
+            logger.warning("presence audience lookup failed for user %s", user_id, exc_info=True)
+            return set()
+        self._audience_cache[user_id] = (now + PRESENCE_AUDIENCE_TTL, ids)
+        while len(self._audience_cache) > PRESENCE_AUDIENCE_CACHE_SIZE:
+            self._audience_cache.popitem(last=False)
+        return ids
+
+    def invalidate_audience(self, user_id: Optional[int] = None) -> None:
+        """Forget cached audiences (after follows or memberships change)."""
+        if user_id is None:
+            self._audience_cache.clear()
+        else:
+            self._audience_cache.pop(int(user_id), None)
+
+    def stats(self) -> dict:
+        return {"users": len(self._conns), "sockets": sum(len(c) for c in self._conns.values())}
+
+    async def sweep(self) -> int:
+        """Drop closed sockets a handler never disconnected; returns how many."""
+        dead = [(uid, ws) for uid, conns in list(self._conns.items()) for ws in list(conns) if is_closed(ws)]
+        for uid, ws in dead:
+            await self.disconnect(uid, ws)
+        return len(dead)
+
+    def is_online(self, user_id: int) -> bool:
+        """Connected to this worker (see ``online`` for all workers)."""
+        return bool(self._conns.get(int(user_id)))
+
+    async def online(self, user_ids: Iterable[int]) -> Set[int]:
+        ids = {int(uid) for uid in user_ids}
+        local = {uid for uid in ids if self._conns.get(uid)}
+        if local == ids:
+            return local
+        return local | await self.bus.online(ids - local)
+
+
+def _coalesce_key(payload: dict):
+    if payload.get("type") in EPHEMERAL_TYPES:
+        return (payload.get("type"), payload.get("user_id"))
+    return None
+
+
+class Outbox:
+    """Bounded outbound queue for one socket, drained by its own writer task.
+
+    ``offer`` never blocks: ephemeral events replace a still-queued event with
+    the same key (a newer typing state from the same user) and are dropped when
+    the queue is backed up; anything else past ``max_size`` closes the socket.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: Optional[int] = None,
+                 max_size: Optional[int] = None, ephemeral_max: Optional[int] = None,
+                 on_close: Optional[Callable[["Outbox"], Awaitable[None]]] = None,
+                 wire: Optional[Wire] = None):
+        self.websocket = websocket
+        self.wire = wire or Wire(websocket)
+        self.user_id = user_id
+        self.max_size = max_size or WS_OUTBOX_MAX
+        self.ephemeral_max = min(ephemeral_max or WS_OUTBOX_EPHEMERAL_MAX, self.max_size)
+        self.on_close = on_close
+        self.closed = False
+        self.dropped = 0
+        self._queue = deque()
+        self._pending: Dict[tuple, list] = {}
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> "Outbox":
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def offer(self, payload: dict) -> bool:
+        """Queue ``payload``; False when the socket is closed or was just closed for lagging."""
+        if self.closed:
+            return False
+        key = _coalesce_key(payload)
+        if key is not None:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = payload
+                return True
+            if len(self._queue) >= self.ephemeral_max:
+                self.dropped += 1
+                return True
+        elif len(self._queue) >= self.max_size:
+            logger.info("closing websocket with %d queued messages", len(self._queue))
+            self.close(WS_CLOSE_BACKLOG)
+            return False
+        entry = [key, payload]
+        self._queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self._ready.set()
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    entry = self._queue.popleft()
+                    if entry[0] is not None and self._pending.get(entry[0]) is entry:
+                        del self._pending[entry[0]]
+                    await asyncio.wait_for(self.wire.send(entry[1]), WS_SEND_TIMEOUT)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.debug("websocket writer stopped", exc_info=True)
+            self.close()
+
+    def close(self, code: Optional[int] = None) -> None:
+        """Stop writing; with ``code`` also close the socket so its reader ends."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        asyncio.ensure_future(self._finish(code))
+
+    async def _finish(self, code: Optional[int]):
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+        if self.on_close is not None:
+            try:
+                await self.on_close(self)
+            except Exception:
+                logger.debug("outbox close callback failed", exc_info=True)
+
+
+class RoomHub:
+    """Sockets per chat room (space, classroom) on this worker, fanned out via the bus.
+
+    Deliveries only enqueue onto each socket's ``Outbox``, so fan-out to a large
+    room costs one pass over its members and every socket is written concurrently.
+    Sequenced events are also recorded for ``replay``.
+    """
+
+    def __init__(self, prefix: str, bus: Optional[RealtimeBus] = None):
+        self.prefix = prefix
+        self._bus = bus
+        self._rooms: Dict[int, Dict[WebSocket, Outbox]] = {}
+        self._subs: Dict[int, Callback] = {}
+        self._history: Dict[int, deque] = {}
+        self._release: Dict[int, asyncio.TimerHandle] = {}
+        self.grace = REPLAY_GRACE_SECONDS
+
+    @property
+    def bus(self) -> RealtimeBus:
+        return self._bus or get_bus()
+
+    def channel(self, room_id: int) -> str:
+        return f"{self.prefix}:{int(room_id)}"
+
+    def local(self, room_id: int) -> Set[WebSocket]:
+        return set(self._rooms.get(int(room_id), ()))
+
+    def stats(self) -> dict:
+        outboxes = [box for room in self._rooms.values() for box in room.values()]
+        return {
+            "rooms": len(self._rooms),
+            "sockets": len(outboxes),
+            "queued": sum(len(box) for box in outboxes),
+            "dropped": sum(box.dropped for box in outboxes),
+        }
+
+    async def sweep(self) -> int:
+        """Drop closed sockets and stopped outboxes; returns how many."""
+        dead = [(rid, ws) for rid, room in list(self._rooms.items())
+                for ws, box in list(room.items()) if box.closed or is_closed(ws)]
+        for rid, ws in dead:
+            await self.leave(rid, ws)
+        return len(dead)
+
+    def outbox(self, room_id: int, websocket: WebSocket) -> Optional[Outbox]:
+        return self._rooms.get(int(room_id), {}).get(websocket)
+
+    async def join(self, room_id: int, websocket: WebSocket, user_id: Optional[int] = None,
+                   paused: bool = False, wire: Optional[Wire] = None) -> Outbox:
+        """Add a socket to the room; with ``paused`` its outbox queues until ``start()``."""
+        rid = int(room_id)
+        pending = self._release.pop(rid, None)
+        if pending is not None:
+            pending.cancel()
+        room = self._rooms.setdefault(rid, {})
+        outbox = room.get(websocket)
+        if outbox is None:
+            outbox = room[websocket] = Outbox(
+                websocket, user_id=user_id, on_close=partial(self._drop, rid), wire=wire,
+            )
+            if not paused:
+                outbox.start()
+        if rid not in self._subs:
+            handler = self._subs[rid] = partial(self._deliver, rid)
+            await self.bus.subscribe(self.channel(rid), handler)
+        return outbox
+
+    async def leave(self, room_id: int, websocket: WebSocket) -> None:
+        rid = int(room_id)
+        room = self._rooms.get(rid)
+        if room is None:
+            return
+        outbox = room.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+        if not room:
+            self._rooms.pop(rid, None)
+            if self.grace > 0:
+                if rid not in self._release:
+                    loop = asyncio.get_running_loop()
+                    self._release[rid] = loop.call_later(
+                        self.grace, lambda: asyncio.ensure_future(self._unsubscribe(rid)))
+            else:
+                await self._unsubscribe(rid)
+
+    async def _drop(self, room_id: int, outbox: Outbox) -> None:
+        # an outbox that gave up; the socket may have rejoined with a new one since
+        if self._rooms.get(room_id, {}).get(outbox.websocket) is outbox:
+            await self.leave(room_id, outbox.websocket)
+
+    async def _unsubscribe(self, room_id: int) -> None:
+        self._release.pop(room_id, None)
+        if self._rooms.get(room_id):
+            return
+        self._history.pop(room_id, None)
+        handler = self._subs.pop(room_id, None)
+        if handler is not None:
+            await self.bus.unsubscribe(self.channel(room_id), handler)
+
+    async def broadcast(self, room_id: int, payload: dict, exclude_user_id: Optional[int] = None) -> None:
+        message = {"payload": payload}
+        if exclude_user_id is not None:
+            message["exclude"] = int(exclude_user_id)
+        await self.bus.publish(self.channel(room_id), message)
+
+    def replay(self, room_id: int, after_seq: int) -> Optional[List[dict]]:
+        """Sequenced events after ``after_seq``, or None if the ring cannot vouch for the gap.
+
+        The ring is contiguous from its first entry (this worker has been
+        subscribed since), so it covers any ``after_seq`` at or past that entry.
+        """
+        history = self._history.get(int(room_id))
+        if not history or after_seq < history[0][0]:
+            return None
+        return [payload for seq, payload in history if seq > after_seq]
+
+    async def _deliver(self, room_id: int, message: dict) -> None:
+        payload = message.get("payload")
+        exclude = message.get("exclude")
+        seq = payload.get("seq") if isinstance(payload, dict) else None
+        if seq is not None:
+            history = self._history.get(room_id)
+            if history is None:
+                history = self._history[room_id] = deque(maxlen=REPLAY_BUFFER_SIZE)
+            history.append((int(seq), payload))
+        for outbox in list(self._rooms.get(int(room_id), {}).values()):
+            if exclude is not None and outbox.user_id == exclude:
+                continue
+            outbox.offer(payload)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how late ``sleep(interval)`` wakes up.
+
+    Lag is the time callbacks wait behind other work on the loop, i.e. the
+    extra latency every websocket frame on this worker pays.
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self._samples = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._samples.append(max(0.0, time.monotonic() - started - self.interval))
+
+    def snapshot(self) -> dict:
+        values = sorted(self._samples)
+        return {
+            "samples": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round((values[-1] if values else 0.0) * 1000, 3),
+        }
+
+
+def process_rss_bytes() -> int:
+    """Resident memory of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+    except Exception:
+        return 0
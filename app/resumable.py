@@ -0,0 +1,127 @@
+import os
+import json
+import base64
+import shutil
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from starlette.requests import ClientDisconnect
+
+# Resumable (tus-style) uploads. Bytes are written into a sparse staging file at
+# the offset each PATCH names, so chunks may arrive in parallel and out of order;
+# the set of written byte ranges is persisted on the UploadSession row.
+
+TUS_VERSION = "1.0.0"
+# Staging lives inside UPLOAD_DIR by default so the finished file is renamed,
+# not copied, into place; a staging dir on another filesystem costs a full copy.
+UPLOAD_STAGING_DIR = os.getenv(
+    "UPLOAD_STAGING_DIR", os.path.join(os.getenv("UPLOAD_DIR", "./uploads"), ".staging"))
+# parallel chunks must start on a multiple of this; sequential PATCHes may use any size
+RESUMABLE_CHUNK_SIZE = int(os.getenv("RESUMABLE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+_locks_guard = threading.Lock()
+_locks = {}
+
+
+def upload_lock(upload_id: str) -> threading.Lock:
+    """Serialize bookkeeping updates for one upload within this process."""
+    with _locks_guard:
+        lock = _locks.get(upload_id)
+        if lock is None:
+            lock = _locks[upload_id] = threading.Lock()
+        return lock
+
+
+def forget_upload_lock(upload_id: str) -> None:
+    with _locks_guard:
+        _locks.pop(upload_id, None)
+
+
+def parse_upload_metadata(header: Optional[str]) -> dict:
+    """Decode a tus ``Upload-Metadata`` header: ``key b64value,key2 b64value2``."""
+    meta = {}
+    for pair in (header or "").split(","):
+        pair = pair.strip()
+        if not pair:
+            continue
+        key, _, value = pair.partition(" ")
+        try:
+            meta[key] = base64.b64decode(value.strip()).decode("utf-8") if value.strip() else ""
+        except Exception:
+            continue
+    return meta
+
+
+def load_ranges(raw: Optional[str]) -> List[List[int]]:
+    try:
+        return [[int(a), int(b)] for a, b in json.loads(raw or "[]")]
+    except Exception:
+        return []
+
+
+def add_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Merge [start, end) into a sorted list of disjoint ranges."""
+    merged = []
+    for a, b in sorted(ranges + [[start, end]]):
+        if merged and a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return merged
+
+
+def contiguous_offset(ranges: List[List[int]]) -> int:
+    """Bytes received without gaps from the start of the file."""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+def staging_path(upload_id: str) -> Path:
+    return Path(UPLOAD_STAGING_DIR) / f"{upload_id}.part"
+
+
+def create_staging_file(upload_id: str, size: int) -> Path:
+    path = staging_path(upload_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as fh:
+        # sparse preallocation lets chunks land at any offset
+        fh.truncate(size)
+    return path
+
+
+async def write_chunk(upload_id: str, offset: int, stream, limit: int) -> int:
+    """Write a request body stream at offset, refusing more than limit bytes.
+
+    Returns the number of bytes written; raises ValueError when the body is
+    larger than allowed. A dropped connection keeps whatever arrived.
+    """
+    written = 0
+    with staging_path(upload_id).open("r+b") as fh:
+        fh.seek(offset)
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                if written + len(chunk) > limit:
+                    raise ValueError("chunk exceeds upload length")
+                fh.write(chunk)
+                written += len(chunk)
+        except ClientDisconnect:
+            pass
+    return written
+
+
+def move_to_uploads(upload_id: str, dest: Path) -> None:
+    """Rename the staging file to ``dest`` (a copy only across filesystems)."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(staging_path(upload_id)), str(dest))
+
+
+def discard_staging_file(upload_id: str) -> None:
+    try:
+        staging_path(upload_id).unlink()
+    except FileNotFoundError:
+        pass
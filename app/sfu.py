@@ -0,0 +1,171 @@
+import os
+from typing import Dict, Optional, Set, Union
+
+from .realtime import RealtimeBus
+
+# Video meeting topology.
+#
+# Small meetings are a mesh: every participant negotiates with every other.
+# Past VIDEO_MESH_MAX participants (or always, with VIDEO_TOPOLOGY=sfu) a room
+# is handed to a forwarder, a peer that takes one upstream per participant and
+# forwards it to everyone else; participants then negotiate only with it.
+# Forwarders are separate processes that connect to /ws/video with
+# ``?sfu=<name>`` and the VIDEO_SFU_TOKEN in an ``X-SFU-Token`` header, and are
+# addressed on the signaling channel as the peer "sfu:<name>". A room keeps its
+# forwarder until the meeting ends. VIDEO_TOPOLOGY=mesh never uses one.
+#
+# Caps: a forwarded room admits VIDEO_MAX_PARTICIPANTS. A mesh room is not
+# capped: one that outgrows VIDEO_MESH_MAX with no forwarder free stays a mesh
+# and its participants get a "mesh-oversized" warning. Publishers send the
+# SIMULCAST_LAYERS encodings; the layer a subscriber may receive is capped by
+# room size.
+VIDEO_TOPOLOGY = os.getenv("VIDEO_TOPOLOGY", "auto").lower()
+VIDEO_MESH_MAX = int(os.getenv("VIDEO_MESH_MAX", "6"))
+VIDEO_MAX_PARTICIPANTS = int(os.getenv("VIDEO_MAX_PARTICIPANTS", "50"))
+VIDEO_SFU_TOKEN = os.getenv("VIDEO_SFU_TOKEN", "")
+# rooms one forwarder takes unless it announces its own capacity
+VIDEO_SFU_CAPACITY = int(os.getenv("VIDEO_SFU_CAPACITY", "20"))
+# above this many participants subscribers are capped at the lowest layer
+VIDEO_HALF_LAYER_MAX = int(os.getenv("VIDEO_HALF_LAYER_MAX", "16"))
+# name of an in-process StandInForwarder to start (development and tests only)
+VIDEO_STANDIN_SFU = os.getenv("VIDEO_STANDIN_SFU", "")
+
+FORWARDERS_KEY = "video:forwarders"
+ROOM_FORWARDER_KEY = "video:room-forwarder"
+FORWARDER_PREFIX = "sfu:"
+
+# RTCRtpEncodingParameters for the publisher's video sender, lowest first
+SIMULCAST_LAYERS = [
+    {"rid": "q", "scaleResolutionDownBy": 4, "maxBitrate": 150_000},
+    {"rid": "h", "scaleResolutionDownBy": 2, "maxBitrate": 500_000},
+    {"rid": "f", "scaleResolutionDownBy": 1, "maxBitrate": 1_500_000},
+]
+LAYER_ORDER = [layer["rid"] for layer in SIMULCAST_LAYERS]
+
+Peer = Union[int, str]
+
+
+def forwarder_peer(name: str) -> str:
+    return f"{FORWARDER_PREFIX}{name}"
+
+
+def is_forwarder(peer) -> bool:
+    return isinstance(peer, str) and peer.startswith(FORWARDER_PREFIX)
+
+
+def parse_peer(value) -> Optional[Peer]:
+    """A signaling target: a user id, or "sfu:<name>" for a forwarder."""
+    if is_forwarder(value) and len(value) > len(FORWARDER_PREFIX):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def peer_channel(peer: Peer) -> str:
+    return f"video:{peer}" if is_forwarder(peer) else f"video:{int(peer)}"
+
+
+def layer_cap(room_size: int) -> str:
+    """The highest simulcast layer a subscriber gets in a room this size."""
+    if room_size <= VIDEO_MESH_MAX:
+        return LAYER_ORDER[-1]
+    if room_size <= VIDEO_HALF_LAYER_MAX:
+        return LAYER_ORDER[min(1, len(LAYER_ORDER) - 1)]
+    return LAYER_ORDER[0]
+
+
+def clamp_layer(requested, room_size: int) -> str:
+    cap = layer_cap(room_size)
+    if requested not in LAYER_ORDER:
+        return cap
+    return LAYER_ORDER[min(LAYER_ORDER.index(requested), LAYER_ORDER.index(cap))]
+
+
+class StandInForwarder:
+    """In-process forwarder that speaks the signaling protocol without media.
+
+    It answers every offer with a placeholder SDP and keeps the bookkeeping a
+    real SFU would: one upstream per participant and, per subscriber, the
+    layer of every other publisher it receives. Meant for tests and local
+    development; browsers cannot complete a call against it.
+    """
+
+    def __init__(self, bus: RealtimeBus, name: str = "local"):
+        self.bus = bus
+        self.name = name
+        self.peer = forwarder_peer(name)
+        self.rooms: Dict[int, Dict[int, str]] = {}
+        self.upstreams: Dict[int, Set[int]] = {}
+        self.subscriptions: Dict[int, Dict[int, Dict[int, str]]] = {}
+        self.candidates = 0
+
+    async def start(self) -> "StandInForwarder":
+        await self.bus.subscribe(peer_channel(self.peer), self.handle)
+        return self
+
+    async def stop(self) -> None:
+        await self.bus.unsubscribe(peer_channel(self.peer), self.handle)
+
+    async def _send(self, user_id: int, event: str, payload: dict) -> None:
+        await self.bus.publish(peer_channel(user_id), {
+            "event": event,
+            "payload": dict(payload, sender_id=self.peer),
+        })
+
+    async def handle(self, message: dict) -> None:
+        event = message.get("event")
+        payload = message.get("payload") or {}
+        try:
+            space_id = int(payload.get("space_id") or payload.get("room_id") or 0)
+        except (TypeError, ValueError):
+            return
+        if event == "participant-joined":
+            user_id, cap = int(payload["user_id"]), payload.get("max_layer") or LAYER_ORDER[-1]
+            room = self.rooms.setdefault(space_id, {})
+            room[user_id] = cap
+            subs = self.subscriptions.setdefault(space_id, {})
+            subs[user_id] = {pub: cap for pub in self.upstreams.get(space_id, ()) if pub != user_id}
+        elif event == "participant-left":
+            user_id = int(payload["user_id"])
+            self.rooms.get(space_id, {}).pop(user_id, None)
+            self.upstreams.get(space_id, set()).discard(user_id)
+            subs = self.subscriptions.get(space_id, {})
+            subs.pop(user_id, None)
+            for received in subs.values():
+                received.pop(user_id, None)
+        elif event == "room-config":
+            cap = payload.get("max_layer")
+            if cap not in LAYER_ORDER:
+                return
+            room = self.rooms.get(space_id, {})
+            for user_id in room:
+                room[user_id] = cap
+            for received in self.subscriptions.get(space_id, {}).values():
+                for publisher, layer in received.items():
+                    if LAYER_ORDER.index(layer) > LAYER_ORDER.index(cap):
+                        received[publisher] = cap
+        elif event == "room-closed":
+            self.rooms.pop(space_id, None)
+            self.upstreams.pop(space_id, None)
+            self.subscriptions.pop(space_id, None)
+        elif event == "offer":
+            publisher = int(payload["sender_id"])
+            room = self.rooms.get(space_id, {})
+            if publisher not in room:
+                return
+            self.upstreams.setdefault(space_id, set()).add(publisher)
+            for subscriber, received in self.subscriptions.setdefault(space_id, {}).items():
+                if subscriber != publisher:
+                    received[publisher] = room.get(subscriber, LAYER_ORDER[-1])
+            await self._send(publisher, "answer", {
+                "room_id": space_id,
+                "sdp": {"type": "answer", "sdp": f"stand-in answer from {self.peer}"},
+            })
+        elif event == "select-layer":
+            received = self.subscriptions.get(space_id, {}).get(int(payload["subscriber_id"]))
+            if received is not None and int(payload["publisher_id"]) in received:
+                received[int(payload["publisher_id"])] = payload["layer"]
+        elif event == "ice-candidate":
+            self.candidates += 1
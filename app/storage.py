@@ -0,0 +1,342 @@
+import os
+import time
+import random
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+except Exception:
+    boto3 = None
+    TransferConfig = None
+
+logger = logging.getLogger("slideshare.storage")
+
+# Object storage for uploads and derived artifacts. Keys are paths relative to
+# UPLOAD_DIR ("abc.pdf", "hls/12/master.m3u8"), so both drivers share one layout.
+# STORAGE_BACKEND=s3 keeps a local working copy for conversion, but downloads are
+# redirected to short-lived presigned URLs instead of streaming through the app.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_PRESIGN_TTL = int(os.getenv("STORAGE_PRESIGN_TTL", "300"))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "16")) * 1024 * 1024
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+# bulk artifact publishing (HLS segments etc.)
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "8"))
+S3_UPLOAD_RETRIES = int(os.getenv("S3_UPLOAD_RETRIES", "3"))
+
+ARTIFACT_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+
+
+class StoredObject:
+    __slots__ = ("key", "size", "mtime", "etag")
+
+    def __init__(self, key: str, size: int, mtime: float = None, etag: str = None):
+        self.key = key
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+
+
+class StorageBackend(ABC):
+    """put/get/stat/range-read/presign/delete over keys relative to UPLOAD_DIR."""
+
+    name = "base"
+    remote = False
+
+    @abstractmethod
+    def put_file(self, local_path, key: str, content_type: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredObject]:
+        ...
+
+    @abstractmethod
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        """Bytes [start, end] inclusive, like an HTTP Range."""
+
+    def presign(self, key: str, expires: int = STORAGE_PRESIGN_TTL, filename: Optional[str] = None,
+                inline: bool = False, content_type: Optional[str] = None) -> Optional[str]:
+        """Direct download URL, or None when the driver cannot hand out URLs."""
+        return None
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        ...
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def fetch_to(self, key: str, dest) -> bool:
+        """Copy an object to a local path (e.g. a worker without the upload on disk)."""
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + ".part")
+        try:
+            with self.open(key) as src, tmp.open("wb") as out:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            os.replace(tmp, dest)
+            return True
+        except Exception:
+            logger.exception("fetching %s from %s storage failed", key, self.name)
+            tmp.unlink(missing_ok=True)
+            return False
+
+
+def _clean_key(key: str) -> str:
+    key = str(key).replace("\\", "/").lstrip("/")
+    if any(part == ".." for part in key.split("/")):
+        raise ValueError(f"invalid storage key: {key}")
+    return key
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / _clean_key(key)
+
+    def put_file(self, local_path, key: str, content_type: Optional[str] = None) -> None:
+        dest = self.path(key)
+        if Path(local_path).resolve() == dest.resolve():
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, dest)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.path(key).open("rb")
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            st = self.path(key).stat()
+        except (OSError, ValueError):
+            return None
+        return StoredObject(key, st.st_size, st.st_mtime)
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        with self.open(key) as fh:
+            fh.seek(start)
+            return fh.read(end - start + 1)
+
+    def delete(self, key: str) -> bool:
+        try:
+            self.path(key).unlink()
+            return True
+        except (OSError, ValueError):
+            return False
+
+
+_client_lock = threading.Lock()
+_s3_client = None
+
+
+def s3_client():
+    """Process-wide S3 client (boto3 clients are thread-safe); None without boto3."""
+    global _s3_client
+    if _s3_client is None:
+        if boto3 is None:
+            return None
+        with _client_lock:
+            if _s3_client is None:
+                from botocore.config import Config
+                _s3_client = boto3.session.Session().client(
+                    "s3",
+                    endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    region_name=os.getenv("AWS_REGION"),
+                    config=Config(max_pool_connections=max(10, S3_MAX_CONCURRENCY * 2),
+                                  retries={"max_attempts": 5, "mode": "adaptive"}),
+                )
+    return _s3_client
+
+
+def transfer_config():
+    if TransferConfig is None:
+        return None
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+    )
+
+
+class S3Storage(StorageBackend):
+    name = "s3"
+    remote = True
+
+    def __init__(self, bucket: str, prefix: str = "", client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or s3_client()
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + _clean_key(key)
+
+    def put_file(self, local_path, key: str, content_type: Optional[str] = None) -> None:
+        extra = {"ContentType": content_type} if content_type else None
+        config = transfer_config()
+        kwargs = {}
+        if extra:
+            kwargs["ExtraArgs"] = extra
+        if config is not None:
+            kwargs["Config"] = config
+        # upload_file switches to parallel multipart above the threshold
+        self.client.upload_file(str(local_path), self.bucket, self.object_key(key), **kwargs)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception:
+            return None
+        modified = head.get("LastModified")
+        return StoredObject(
+            key,
+            int(head.get("ContentLength") or 0),
+            modified.timestamp() if modified is not None else None,
+            (head.get("ETag") or "").strip('"') or None,
+        )
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        res = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes={start}-{end}")
+        return res["Body"].read()
+
+    def presign(self, key: str, expires: int = STORAGE_PRESIGN_TTL, filename: Optional[str] = None,
+                inline: bool = False, content_type: Optional[str] = None) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if filename:
+            kind = "inline" if inline else "attachment"
+            params["ResponseContentDisposition"] = f"{kind}; filename*=utf-8''{quote(filename)}"
+        if content_type:
+            params["ResponseContentType"] = content_type
+        try:
+            return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=int(expires))
+        except Exception:
+            logger.exception("presigning %s failed", key)
+            return None
+
+    def delete(self, key: str) -> bool:
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except Exception:
+            return False
+
+
+def put_many(backend: StorageBackend, items, max_workers: int = S3_UPLOAD_WORKERS,
+             retries: int = S3_UPLOAD_RETRIES, backoff: float = 0.5) -> dict:
+    """Upload ``(local_path, key)`` pairs concurrently with retries.
+
+    Transfers share the backend's client and run on a bounded pool (largest
+    first, so a long file does not start last); each is retried with
+    exponential backoff and jitter. Returns ``{key: {"ok", "attempts", "bytes",
+    "error"}}`` so callers can record exactly what was published.
+    """
+    items = [(Path(p), k) for p, k in items]
+    try:
+        items.sort(key=lambda item: item[0].stat().st_size, reverse=True)
+    except OSError:
+        pass
+
+    def _put(item):
+        path, key = item
+        content_type = ARTIFACT_CONTENT_TYPES.get(path.suffix.lower())
+        error = None
+        for attempt in range(1, max(1, retries) + 1):
+            try:
+                backend.put_file(path, key, content_type=content_type)
+                return key, {"ok": True, "attempts": attempt, "bytes": path.stat().st_size, "error": None}
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                if attempt < retries:
+                    time.sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+        logger.warning("storing %s failed after %s attempts: %s", key, retries, error)
+        return key, {"ok": False, "attempts": max(1, retries), "bytes": 0, "error": error}
+
+    if not items:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix="artifact-put") as pool:
+        return dict(pool.map(_put, items))
+
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    """Split ``s3://bucket/key`` into (bucket, key)."""
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def presign_s3_uri(uri: str, expires: int = STORAGE_PRESIGN_TTL, **kwargs) -> Optional[str]:
+    """Presigned GET for an ``s3://`` job result, using the shared client."""
+    bucket, key = parse_s3_uri(uri)
+    if not bucket or s3_client() is None:
+        return None
+    return S3Storage(bucket).presign(key, expires, **kwargs)
+
+
+_storage = None
+
+
+def get_storage() -> StorageBackend:
+    """The configured backend (STORAGE_BACKEND=local|s3); local if S3 is unusable."""
+    global _storage
+    if _storage is None:
+        bucket = os.getenv("S3_BUCKET") or os.getenv("AWS_S3_BUCKET")
+        if STORAGE_BACKEND == "s3" and bucket and boto3 is not None:
+            _storage = S3Storage(bucket, os.getenv("S3_PREFIX", ""))
+        else:
+            if STORAGE_BACKEND == "s3":
+                logger.warning("STORAGE_BACKEND=s3 needs boto3 and S3_BUCKET; using local storage")
+            _storage = LocalStorage(os.getenv("UPLOAD_DIR", "./uploads"))
+    return _storage
+
+
+def artifact_storage() -> Optional[StorageBackend]:
+    """Where derived video artifacts are published, or None to keep them local.
+
+    The configured backend when it is remote; otherwise an S3 bucket named by
+    S3_BUCKET/AWS_S3_BUCKET alone still receives them (with S3_PREFIX), as it
+    did before STORAGE_BACKEND existed.
+    """
+    storage = get_storage()
+    if storage.remote:
+        return storage
+    bucket = os.getenv("S3_BUCKET") or os.getenv("AWS_S3_BUCKET")
+    if bucket and s3_client() is not None:
+        return S3Storage(bucket, os.getenv("S3_PREFIX", ""))
+    return None
+
+
+def set_storage(backend: Optional[StorageBackend]) -> None:
+    """Swap the process-wide backend (tests, or an app factory)."""
+    global _storage
+    _storage = backend
@@ -1,6 +1,9 @@
 
 import os
+import time
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 try:
     from redis import Redis
     from rq import Queue, Worker
@@ -14,6 +17,7 @@ except ImportError:
     redis = None
     q = None
 from pathlib import Path
+from typing import Optional, Tuple
 from .database import engine
 from .ai_client import chat_completion, get_ai_provider
 from sqlmodel import Session, select
@@ -27,31 +31,141 @@ from .convert import (
     generate_video_thumbnail,
     generate_audio_waveform,
     render_code_syntax,
+    write_thumbnail_manifest,
 )
+from .pdf_cache import pdf_cache, open_pdf
+from .storage import StorageBackend, artifact_storage, get_storage, put_many
+from .artifacts import refresh_presentation_artifacts
 
-try:
-    import boto3
-except Exception:
-    boto3 = None
+
+def publish_video_artifacts(storage: StorageBackend, save_dir: Path, hls_index: Optional[str],
+                            web_out: Optional[Path]) -> Tuple[Optional[str], dict]:
+    """Put the HLS ladder and MP4 fallback into remote storage under their UPLOAD_DIR keys.
+
+    Returns the ``s3://`` URI to play from (the playlist only when every
+    rendition made it, else the MP4; None when neither did) and the put report.
+    """
+    root = Path(save_dir).resolve()
+
+    def key_of(path) -> str:
+        return Path(path).resolve().relative_to(root).as_posix()
+
+    items = []
+    playlist_key = None
+    if hls_index and Path(hls_index).exists():
+        hls_dir = Path(hls_index).parent
+        # the whole ladder, keeping the variant directories
+        items += [(p, key_of(p)) for p in sorted(hls_dir.rglob("*")) if p.is_file()]
+        playlist_key = key_of(hls_index)
+    mp4_key = None
+    if web_out is not None and web_out.exists():
+        mp4_key = key_of(web_out)
+        items.append((web_out, mp4_key))
+    report = put_many(storage, items)
+    hls_keys = [k for k in report if k != mp4_key]
+    if playlist_key and hls_keys and all(report[k]["ok"] for k in hls_keys):
+        key = playlist_key
+    elif mp4_key and report.get(mp4_key, {}).get("ok"):
+        key = mp4_key
+    else:
+        return None, report
+    return f"s3://{storage.bucket}/{storage.object_key(key)}", report
+
+
+# Adaptive bitrate ladder: (height, video kbps, audio kbps). Renditions taller than
+# the source are skipped so nothing is upscaled.
+HLS_LADDER = (
+    (360, 800, 96),
+    (720, 2800, 128),
+    (1080, 5000, 160),
+)
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+# kill ffmpeg when it stops reporting progress, instead of a fixed wall-clock cap
+FFMPEG_STALL_TIMEOUT = int(os.getenv("FFMPEG_STALL_TIMEOUT", "120"))
 
 
-def upload_file_to_s3(local_path: str, bucket: str, key: str) -> bool:
+def _ffmpeg_threads() -> int:
+    """Encoder threads per ffmpeg run, sized so concurrent conversions share the CPUs."""
+    env = os.getenv("FFMPEG_THREADS")
+    if env:
+        try:
+            return max(0, int(env))
+        except ValueError:
+            pass
+    return max(1, (os.cpu_count() or 2) // max(1, CONVERSION_WORKERS))
+
+
+def probe_media(src_path: str) -> dict:
+    """Return duration (seconds), video height and audio presence using ffprobe."""
+    info = {"duration": None, "height": None, "has_audio": False}
     try:
-        if boto3 is None:
-            return False
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=os.getenv("AWS_REGION"),
+        res = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration:stream=codec_type,height",
+                "-of", "json", str(src_path),
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60,
         )
-        s3.upload_file(local_path, bucket, key)
-        return True
+        data = json.loads(res.stdout or b"{}")
+        try:
+            info["duration"] = float(data.get("format", {}).get("duration"))
+        except (TypeError, ValueError):
+            pass
+        for stream in data.get("streams", []):
+            if stream.get("codec_type") == "video" and stream.get("height") and not info["height"]:
+                info["height"] = int(stream["height"])
+            elif stream.get("codec_type") == "audio":
+                info["has_audio"] = True
+    except Exception:
+        pass
+    return info
+
+
+def run_ffmpeg(args: list, duration: float = None, on_progress=None) -> bool:
+    """Run ffmpeg with ``-progress`` parsing and a stall watchdog.
+
+    ``args`` are the arguments after the ``ffmpeg`` binary. ``on_progress`` is
+    called with a 0-100 percentage when the duration is known.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-progress", "pipe:1"] + list(args)
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
     except Exception:
         return False
+    last_seen = [time.monotonic()]
+    finished = threading.Event()
+
+    def _watchdog():
+        while not finished.wait(5):
+            if time.monotonic() - last_seen[0] > FFMPEG_STALL_TIMEOUT:
+                try:
+                    proc.kill()
+                except Exception:
+                    pass
+                return
 
+    threading.Thread(target=_watchdog, daemon=True).start()
+    try:
+        for line in proc.stdout:
+            last_seen[0] = time.monotonic()
+            key, _, value = line.strip().partition("=")
+            if key in ("out_time_us", "out_time_ms") and duration and on_progress:
+                try:
+                    pct = min(100.0, int(value) / 1e6 / duration * 100.0)
+                except ValueError:
+                    continue
+                try:
+                    on_progress(pct)
+                except Exception:
+                    pass
+        proc.wait()
+    finally:
+        finished.set()
+    return proc.returncode == 0
 
-def transcode_video(src_path: str, out_path: str) -> bool:
+
+def transcode_video(src_path: str, out_path: str, on_progress=None) -> bool:
     """Transcode a video to a web-optimized MP4 using ffmpeg.
 
     Returns True on success and writes to out_path.
@@ -60,33 +174,138 @@ def transcode_video(src_path: str, out_path: str) -> bool:
         # prefer system ffmpeg; ensure output directory exists
         out_dir = Path(out_path).parent
         out_dir.mkdir(parents=True, exist_ok=True)
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-i",
-            str(src_path),
-            "-c:v",
-            "libx264",
-            "-preset",
-            "veryfast",
-            "-crf",
-            "23",
-            "-movflags",
-            "+faststart",
-            "-c:a",
-            "aac",
-            "-b:a",
-            "128k",
-            str(out_path),
-        ]
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=600)
-        if res.returncode == 0 and Path(out_path).exists():
+        info = probe_media(src_path)
+        ok = run_ffmpeg(
+            [
+                "-y", "-i", str(src_path),
+                "-threads", str(_ffmpeg_threads()),
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+                "-movflags", "+faststart",
+                "-c:a", "aac", "-b:a", "128k",
+                str(out_path),
+            ],
+            duration=info["duration"],
+            on_progress=on_progress,
+        )
+        if ok and Path(out_path).exists():
             return True
     except Exception:
         pass
     return False
 
 
+def transcode_hls_ladder(src_path: str, out_dir: str, on_progress=None):
+    """Encode every ABR rendition in a single ffmpeg pass.
+
+    Writes ``master.m3u8`` plus ``v<N>/index.m3u8`` and segments under out_dir,
+    with keyframes aligned to segment boundaries so players can switch cleanly.
+    Returns ``(master_playlist, top_variant_playlist)`` or None on failure.
+    """
+    try:
+        info = probe_media(src_path)
+        wanted = {int(h) for h in os.getenv("HLS_RENDITIONS", "360,720,1080").split(",") if h.strip().isdigit()}
+        ladder = [r for r in HLS_LADDER if r[0] in wanted] or [HLS_LADDER[0]]
+        if info["height"]:
+            ladder = [r for r in ladder if r[0] <= info["height"]] or [ladder[0]]
+        out = Path(out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+
+        n = len(ladder)
+        graph = f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))
+        graph += "".join(f";[s{i}]scale=-2:{h}[v{i}]" for i, (h, _, _) in enumerate(ladder))
+        args = ["-y", "-i", str(src_path), "-threads", str(_ffmpeg_threads()), "-filter_complex", graph]
+        for i, (_, vkbps, _) in enumerate(ladder):
+            args += [
+                "-map", f"[v{i}]",
+                f"-c:v:{i}", "libx264", f"-preset:v:{i}", "veryfast",
+                f"-b:v:{i}", f"{vkbps}k",
+                f"-maxrate:v:{i}", f"{int(vkbps * 1.07)}k",
+                f"-bufsize:v:{i}", f"{int(vkbps * 1.5)}k",
+            ]
+        if info["has_audio"]:
+            for i, (_, _, akbps) in enumerate(ladder):
+                args += ["-map", "0:a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", f"{akbps}k"]
+            stream_map = " ".join(f"v:{i},a:{i}" for i in range(n))
+        else:
+            stream_map = " ".join(f"v:{i}" for i in range(n))
+        args += [
+            "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            "-sc_threshold", "0",
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_flags", "independent_segments",
+            "-hls_segment_filename", str(out / "v%v" / "segment_%03d.ts"),
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", stream_map,
+            str(out / "v%v" / "index.m3u8"),
+        ]
+        ok = run_ffmpeg(args, duration=info["duration"], on_progress=on_progress)
+        master = out / "master.m3u8"
+        top = out / f"v{n - 1}" / "index.m3u8"
+        if ok and master.exists() and top.exists():
+            return str(master), str(top)
+    except Exception:
+        pass
+    return None
+
+
+def remux_hls_to_mp4(playlist: str, out_path: str) -> bool:
+    """Build the progressive MP4 fallback from an HLS rendition without re-encoding."""
+    try:
+        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+        ok = run_ffmpeg([
+            "-y", "-i", str(playlist),
+            "-c", "copy", "-bsf:a", "aac_adtstoasc",
+            "-movflags", "+faststart",
+            str(out_path),
+        ])
+        return ok and Path(out_path).exists()
+    except Exception:
+        return False
+
+
+def _job_progress(job_id: int, job_log: list, label: str):
+    """Return an on_progress callback that records coarse progress in the job log."""
+    last = [-5]
+
+    def _update(pct: float):
+        step = int(pct) // 5 * 5
+        if step <= last[0]:
+            return
+        last[0] = step
+        with Session(engine) as session:
+            jr = session.get(ConversionJob, job_id)
+            if jr:
+                jr.log = "\n".join(job_log + [f"{label}: {step}%"])
+                session.add(jr)
+                session.commit()
+
+    return _update
+
+
+def _drop_stale_slides(presentation_id: int, src: Path, save_dir: Path):
+    """Remove slide renders and zoom tiles older than the source file.
+
+    Done once per conversion so the slide endpoint can serve cached images
+    without checking the source on every request.
+    """
+    try:
+        src_mtime = src.stat().st_mtime
+    except Exception:
+        return
+    for d in (save_dir / "thumbs" / str(presentation_id), save_dir / "thumbs_hd" / str(presentation_id)):
+        if not d.exists():
+            continue
+        # slide renders, HD buckets and deep-zoom tiles/descriptors
+        for f in [f for f in d.rglob("*") if f.suffix in (".png", ".dzi")]:
+            try:
+                if f.stat().st_mtime < src_mtime:
+                    f.unlink(missing_ok=True)
+            except Exception:
+                pass
+
+
 def convert_presentation(presentation_id: int, filename: str):
     """Worker function to convert presentation to PDF and generate thumbnail."""
     save_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
@@ -94,11 +313,16 @@ def convert_presentation(presentation_id: int, filename: str):
     job_record = None
     with Session(engine) as session:
         job_record = session.exec(
-            select(ConversionJob).where(
-                ConversionJob.presentation_id == presentation_id
-            )
+            select(ConversionJob)
+            .where(ConversionJob.presentation_id == presentation_id)
+            .order_by(ConversionJob.created_at.desc())
         ).first()
-        if not job_record:
+        if job_record:
+            job_record.status = "started"
+            session.add(job_record)
+            session.commit()
+            session.refresh(job_record)
+        else:
             job_record = ConversionJob(
                 presentation_id=presentation_id, status="started"
             )
@@ -108,10 +332,16 @@ def convert_presentation(presentation_id: int, filename: str):
     try:
         job_log = []
         job_log.append("starting conversion")
+        if not src.exists() and get_storage().remote:
+            # workers need not share the web nodes' disk; pull the upload from storage
+            if get_storage().fetch_to(filename, src):
+                job_log.append("fetched source from object storage")
         ext = src.suffix.lower() if src.suffix else ''
         pdf_path = None
         thumbs_dir = save_dir / "thumbs" / str(presentation_id)
         thumbs_dir.mkdir(parents=True, exist_ok=True)
+        _drop_stale_slides(presentation_id, src, save_dir)
+        thumbs = []
 
         # document conversions
         if ext in ('.doc', '.docx', '.odt', '.ppt', '.pptx'):
@@ -137,98 +367,59 @@ def convert_presentation(presentation_id: int, filename: str):
             res = generate_video_thumbnail(str(src), str(thumb_out))
             if res:
                 job_log.append('video thumbnail generated')
-            # attempt to transcode to a web-optimized MP4 for better playback
+            # Encode the ABR ladder in one pass when HLS is enabled and derive the MP4
+            # fallback by remuxing its top rendition; otherwise transcode a single MP4.
             try:
                 web_out = save_dir / f"{presentation_id}_web.mp4"
-                ok = transcode_video(str(src), str(web_out))
-                if ok:
-                    job_log.append(f"transcoded video -> {web_out.name}")
-                    # optionally produce HLS segments if enabled
-                    hls_enabled = os.getenv("ENABLE_HLS", "0").lower() in ("1", "true", "yes")
-                    hls_index = None
-                    if hls_enabled:
-                        try:
-                            hls_dir = save_dir / "hls" / str(presentation_id)
-                            hls_dir.mkdir(parents=True, exist_ok=True)
-                            # simple single-variant HLS (VOD)
-                            hls_index = str(hls_dir / "index.m3u8")
-                            cmd = [
-                                "ffmpeg",
-                                "-y",
-                                "-i",
-                                str(src),
-                                "-c:v",
-                                "libx264",
-                                "-preset",
-                                "veryfast",
-                                "-crf",
-                                "23",
-                                "-c:a",
-                                "aac",
-                                "-b:a",
-                                "128k",
-                                "-hls_time",
-                                "6",
-                                "-hls_playlist_type",
-                                "vod",
-                                "-hls_segment_filename",
-                                str(hls_dir / "segment_%03d.ts"),
-                                hls_index,
-                            ]
-                            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=900)
-                            if Path(hls_index).exists():
-                                job_log.append(f"generated HLS -> {hls_index}")
-                        except Exception:
-                            hls_index = None
-                    # decide whether to upload derived files to S3
-                    s3_bucket = os.getenv("S3_BUCKET") or os.getenv("AWS_S3_BUCKET")
-                    if s3_bucket and boto3 is not None:
-                        try:
-                            # prefer HLS index if available
-                            if hls_index and Path(hls_index).exists():
-                                # upload all files in the hls dir
-                                key_prefix = f"presentations/{presentation_id}/hls/"
-                                for p in Path(hls_dir).glob("*"):
-                                    upload_file_to_s3(str(p), s3_bucket, key_prefix + p.name)
-                                s3_key = key_prefix + "index.m3u8"
-                                with Session(engine) as session:
-                                    jr = session.get(ConversionJob, job_record.id)
-                                    jr.result = f"s3://{s3_bucket}/{s3_key}"
-                                    session.add(jr)
-                                    session.commit()
-                            else:
-                                # upload the web mp4
-                                key = f"presentations/{presentation_id}/{web_out.name}"
-                                if upload_file_to_s3(str(web_out), s3_bucket, key):
-                                    with Session(engine) as session:
-                                        jr = session.get(ConversionJob, job_record.id)
-                                        jr.result = f"s3://{s3_bucket}/{key}"
-                                        session.add(jr)
-                                        session.commit()
-                                else:
-                                    with Session(engine) as session:
-                                        jr = session.get(ConversionJob, job_record.id)
-                                        jr.result = web_out.name
-                                        session.add(jr)
-                                        session.commit()
-                        except Exception:
-                            # fallback to local result
-                            with Session(engine) as session:
-                                jr = session.get(ConversionJob, job_record.id)
-                                jr.result = web_out.name
-                                session.add(jr)
-                                session.commit()
+                hls_enabled = os.getenv("ENABLE_HLS", "0").lower() in ("1", "true", "yes")
+                hls_index = None
+                hls_dir = save_dir / "hls" / str(presentation_id)
+                ok = False
+                if hls_enabled:
+                    job_log.append("encoding HLS ladder")
+                    ladder = transcode_hls_ladder(
+                        str(src), str(hls_dir),
+                        on_progress=_job_progress(job_record.id, job_log, "encoding HLS ladder"),
+                    )
+                    if ladder:
+                        hls_index, top_variant = ladder
+                        job_log.append(f"generated HLS -> {hls_index}")
+                        ok = remux_hls_to_mp4(top_variant, str(web_out))
+                        if ok:
+                            job_log.append(f"remuxed MP4 fallback -> {web_out.name}")
+                if not ok:
+                    ok = transcode_video(
+                        str(src), str(web_out),
+                        on_progress=_job_progress(job_record.id, job_log, "transcoding video"),
+                    )
+                    if ok:
+                        job_log.append(f"transcoded video -> {web_out.name}")
+                if ok or hls_index:
+                    if hls_index and Path(hls_index).exists():
+                        local_result = os.path.relpath(hls_index, start=str(save_dir)).replace("\\", "/")
                     else:
-                        # no S3: store local HLS index if produced, otherwise web mp4 name
+                        local_result = web_out.name
+                    result = local_result
+                    # publish derived files to remote storage (or a bare S3_BUCKET) when configured
+                    storage = artifact_storage()
+                    if storage is not None:
+                        started = time.monotonic()
+                        remote, report = publish_video_artifacts(
+                            storage, save_dir, hls_index, web_out if ok else None)
+                        stored = sum(1 for r in report.values() if r["ok"])
+                        job_log.append(f"uploaded {stored}/{len(report)} artifacts to {storage.name} in {time.monotonic() - started:.1f}s")
+                        if remote:
+                            result = remote
                         with Session(engine) as session:
                             jr = session.get(ConversionJob, job_record.id)
-                            if hls_index and Path(hls_index).exists():
-                                rel = os.path.relpath(hls_index, start=str(save_dir))
-                                jr.result = rel.replace("\\", "/")
-                            else:
-                                jr.result = web_out.name
+                            jr.artifacts = json.dumps(report)
                             session.add(jr)
                             session.commit()
+                    with Session(engine) as session:
+                        jr = session.get(ConversionJob, job_record.id)
+                        jr.result = result
+                        session.add(jr)
+                        session.commit()
             except Exception:
                 pass
 
@@ -258,10 +449,22 @@ def convert_presentation(presentation_id: int, filename: str):
             job_record.log = "\n".join(job_log)
             session.add(job_record)
             session.commit()
+        # conversion may have rewritten the PDF; drop any cached open handles
+        for path in {str(src), pdf_path}:
+            if path:
+                pdf_cache.invalidate(path)
+        # record content hashes so slide URLs are versioned and cacheable forever
+        manifest = write_thumbnail_manifest(str(thumbs_dir)) if thumbs else {}
+        # storage accounting for the upload and everything derived from it
+        refresh_presentation_artifacts(presentation_id)
         # if thumbnails were generated, cache their URLs in Redis for fast lookup
         try:
             if redis is not None and thumbs:
-                urls = [f"/presentations/{presentation_id}/slide/{i}" for i in range(len(thumbs))]
+                urls = []
+                for i in range(len(thumbs)):
+                    version = manifest.get(f"slide_{i}.png")
+                    url = f"/presentations/{presentation_id}/slide/{i}"
+                    urls.append(f"{url}?v={version}" if version else url)
                 key = f"presentation:{presentation_id}:thumbnails"
                 try:
                     redis.set(key, json.dumps(urls))
@@ -283,67 +486,161 @@ def convert_presentation(presentation_id: int, filename: str):
             session.commit()
 
 
-def enqueue_conversion(presentation_id: int, filename: str):
-    # Try to generate a fast, single-page thumbnail synchronously so the UI can show
-    # an immediate preview when clicked. This is a best-effort step and does not
-    # replace the full background conversion performed by the queued worker.
+# In-process fallback for conversions when Redis/RQ is not reachable. The pool is
+# bounded so a burst of uploads cannot spawn unlimited LibreOffice/ffmpeg runs, and
+# request handlers only ever submit work to it (they never convert inline).
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "2"))
+_local_executor = None
+_local_lock = threading.Lock()
+_local_pending = set()
+
+
+def _get_local_executor():
+    global _local_executor
+    with _local_lock:
+        if _local_executor is None:
+            _local_executor = ThreadPoolExecutor(
+                max_workers=max(1, CONVERSION_WORKERS),
+                thread_name_prefix="conversion",
+            )
+        return _local_executor
+
+
+def shutdown_local_executor(wait: bool = False):
+    """Stop the in-process conversion pool (called on app shutdown)."""
+    global _local_executor
+    with _local_lock:
+        ex = _local_executor
+        _local_executor = None
+        _local_pending.clear()
+    if ex is not None:
+        ex.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _rq_workers_available() -> bool:
+    if q is None or redis is None or Worker is None:
+        return False
     try:
-        save_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
-        src = save_dir / filename
-        thumbs_dir = save_dir / "thumbs" / str(presentation_id)
-        thumbs_dir.mkdir(parents=True, exist_ok=True)
-        quick_thumbs = []
-        ext = src.suffix.lower() if src.suffix else ''
-        if src.exists():
-            if ext == '.pdf':
-                quick_thumbs = generate_pdf_thumbnails(str(src), str(thumbs_dir), max_pages=1)
-            elif ext in ('.doc', '.docx', '.odt', '.ppt', '.pptx'):
-                try:
-                    pdfp = convert_doc_to_pdf(str(src), str(save_dir))
-                    if pdfp:
-                        quick_thumbs = generate_pdf_thumbnails(pdfp, str(thumbs_dir), max_pages=1)
-                except Exception:
-                    pass
-            elif ext in ('.mp4', '.mov', '.m4v', '.webm'):
-                try:
-                    out = thumbs_dir / 'video_preview.png'
-                    res = generate_video_thumbnail(str(src), str(out))
-                    if res:
-                        quick_thumbs = [str(out)]
-                except Exception:
-                    pass
-            elif ext in ('.mp3', '.wav', '.m4a', '.ogg'):
-                try:
-                    out = thumbs_dir / 'waveform.png'
-                    res = generate_audio_waveform(str(src), str(out))
-                    if res:
-                        quick_thumbs = [str(out)]
-                except Exception:
-                    pass
-        if quick_thumbs:
-            try:
-                urls = [f"/presentations/{presentation_id}/slide/{i}" for i in range(len(quick_thumbs))]
-                key = f"presentation:{presentation_id}:thumbnails"
-                if redis is not None:
-                    try:
-                        redis.set(key, json.dumps(urls))
-                        redis.expire(key, 7 * 24 * 3600)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+        return len(Worker.all(connection=redis)) > 0
     except Exception:
-        pass
+        return False
 
-    job = q.enqueue(convert_presentation, presentation_id, filename)
+
+def _run_local_conversion(presentation_id: int, filename: str):
+    try:
+        convert_presentation(presentation_id, filename)
+    finally:
+        with _local_lock:
+            _local_pending.discard(int(presentation_id))
+
+
+def submit_local_conversion(presentation_id: int, filename: str) -> bool:
+    """Submit a conversion to the in-process pool.
+
+    Returns False when a conversion for the same presentation is already pending,
+    so repeated polls (thumbnails/preview) do not pile up duplicate jobs.
+    """
+    with _local_lock:
+        if int(presentation_id) in _local_pending:
+            return False
+        _local_pending.add(int(presentation_id))
+    try:
+        _get_local_executor().submit(_run_local_conversion, presentation_id, filename)
+    except Exception:
+        with _local_lock:
+            _local_pending.discard(int(presentation_id))
+        raise
+    return True
+
+
+def enqueue_conversion(presentation_id: int, filename: str):
+    """Queue a conversion and return immediately with a job id.
+
+    Uses RQ when workers are listening, otherwise the in-process pool. No
+    conversion work (not even a quick thumbnail) runs on the caller's thread.
+    """
+    with _local_lock:
+        pending = int(presentation_id) in _local_pending
     with Session(engine) as session:
-        cj = ConversionJob(
-            presentation_id=presentation_id, job_id=job.get_id(), status="queued"
-        )
+        if pending:
+            cj = session.exec(
+                select(ConversionJob)
+                .where(ConversionJob.presentation_id == presentation_id)
+                .order_by(ConversionJob.created_at.desc())
+            ).first()
+            if cj and cj.status in ("queued", "started"):
+                return cj.job_id
+        cj = ConversionJob(presentation_id=presentation_id, status="queued")
         session.add(cj)
         session.commit()
         session.refresh(cj)
-    return job.get_id()
+        cj_id = cj.id
+
+    job_id = None
+    if _rq_workers_available():
+        try:
+            job = q.enqueue(convert_presentation, presentation_id, filename)
+            job_id = job.get_id()
+        except Exception:
+            job_id = None
+    if job_id is None:
+        submit_local_conversion(presentation_id, filename)
+        job_id = f"local-{cj_id}"
+
+    with Session(engine) as session:
+        cj = session.get(ConversionJob, cj_id)
+        if cj:
+            cj.job_id = job_id
+            session.add(cj)
+            session.commit()
+    return job_id
+
+
+_derivatives_pending = set()
+
+
+def generate_image_derivatives(rel_path: str, kind: str) -> int:
+    """Worker: render the WebP sizes for an avatar or chat image upload."""
+    from .images import generate_derivatives
+    upload_dir = Path(os.getenv("UPLOAD_DIR", "./uploads"))
+    src = upload_dir / rel_path
+    if not src.exists():
+        try:
+            get_storage().fetch_to(rel_path, src)
+        except Exception:
+            pass
+    try:
+        return len(generate_derivatives(upload_dir, rel_path, kind))
+    finally:
+        with _local_lock:
+            _derivatives_pending.discard((rel_path, kind))
+
+
+def enqueue_image_derivatives(rel_path: str, kind: str) -> bool:
+    """Schedule derivative rendering off the request path (RQ or the local pool).
+
+    Returns False when the same image is already queued in this process.
+    """
+    key = (rel_path, kind)
+    with _local_lock:
+        if key in _derivatives_pending:
+            return False
+        _derivatives_pending.add(key)
+    try:
+        if _rq_workers_available():
+            try:
+                q.enqueue(generate_image_derivatives, rel_path, kind)
+                with _local_lock:
+                    _derivatives_pending.discard(key)
+                return True
+            except Exception:
+                pass
+        _get_local_executor().submit(generate_image_derivatives, rel_path, kind)
+    except Exception:
+        with _local_lock:
+            _derivatives_pending.discard(key)
+        return False
+    return True
 
 
 def ai_summarize_presentation(presentation_id: int):
@@ -361,9 +658,8 @@ def ai_summarize_presentation(presentation_id: int):
         if pres.filename and pres.filename.endswith(".pdf"):
             ppath = Path(UPLOAD_DIR) / pres.filename
             try:
-                import fitz
-                doc = fitz.open(str(ppath))
-                txt = "\n".join([doc[i].get_text() for i in range(min(len(doc), 5))])
+                with open_pdf(ppath) as doc:
+                    txt = "\n".join([doc[i].get_text() for i in range(min(len(doc), 5))])
                 prompt_text += "\n" + txt
             except Exception:
                 pass
@@ -436,10 +732,9 @@ def ai_generate_quiz(presentation_id: int):
         UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
         if pres.filename and pres.filename.endswith(".pdf"):
             try:
-                import fitz
                 ppath = Path(UPLOAD_DIR) / pres.filename
-                doc = fitz.open(str(ppath))
-                txt = "\n".join([doc[i].get_text() for i in range(min(len(doc), 5))])
+                with open_pdf(ppath) as doc:
+                    txt = "\n".join([doc[i].get_text() for i in range(min(len(doc), 5))])
                 prompt_text += "\n" + txt
             except Exception:
                 pass
@@ -611,9 +906,8 @@ def ai_autograde_submission(submission_id: int):
             if p.exists():
                 try:
                     if p.suffix.lower() == '.pdf':
-                        import fitz
-                        doc = fitz.open(str(p))
-                        body_text = "\n".join([doc[i].get_text() for i in range(len(doc))])
+                        with open_pdf(p) as doc:
+                            body_text = "\n".join([doc[i].get_text() for i in range(len(doc))])
                     else:
                         body_text = p.read_text(encoding='utf-8', errors='ignore')
                 except Exception:
@@ -0,0 +1,100 @@
+import json
+import logging
+from typing import Dict, List, Optional
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger("slideshare.wire")
+
+# How realtime events are framed on one socket.
+#
+# Compression: uvicorn negotiates permessage-deflate with every client that
+# offers it (browsers and the ``websockets`` client do), so text and binary
+# frames alike are compressed on the wire; UVICORN_WS_PER_MESSAGE_DEFLATE=false
+# turns it off.
+#
+# Encoding: a client offering the "msgpack" subprotocol gets binary msgpack
+# frames both ways (when msgpack is installed); everyone else gets JSON text.
+#
+# Profiles: chat events carry the sender's username/full_name/avatar/site_role.
+# A client connecting with ``?profiles=once`` instead gets a
+# ``{"type": "users", "users": {"<id>": {...}}}`` frame the first time a sender
+# (or their profile) is seen on the socket, and messages without those fields.
+PROFILE_FIELDS = ("username", "full_name", "avatar", "site_role")
+
+
+def _sender_of(message: dict) -> Optional[int]:
+    sender = message.get("sender_id", message.get("from"))
+    try:
+        return int(sender)
+    except (TypeError, ValueError):
+        return None
+
+
+class Wire:
+    """Encodes outgoing events and decodes incoming frames for one socket."""
+
+    def __init__(self, websocket: WebSocket, encoding: str = "json", profiles: str = "inline",
+                 subprotocol: Optional[str] = None):
+        if encoding == "msgpack" and msgpack is None:
+            encoding = "json"
+        self.websocket = websocket
+        self.encoding = encoding
+        self.profiles = profiles
+        self.subprotocol = subprotocol
+        self._profiles_sent: Dict[int, dict] = {}
+
+    @classmethod
+    def negotiate(cls, websocket: WebSocket) -> "Wire":
+        """Pick the encoding from the offered subprotocols and the profile mode from the query."""
+        offered = list(websocket.scope.get("subprotocols") or [])
+        encoding = "json"
+        if "msgpack" in offered and msgpack is not None:
+            encoding = "msgpack"
+        subprotocol = encoding if encoding in offered else None
+        profiles = "once" if websocket.query_params.get("profiles") == "once" else "inline"
+        return cls(websocket, encoding=encoding, profiles=profiles, subprotocol=subprotocol)
+
+    def frames(self, payload: dict) -> List[dict]:
+        """The events to send for ``payload``: a ``users`` frame may go first."""
+        if self.profiles != "once" or payload.get("type") != "message":
+            return [payload]
+        nested = isinstance(payload.get("message"), dict)
+        message = payload["message"] if nested else payload
+        sender = _sender_of(message)
+        if sender is None or not any(field in message for field in PROFILE_FIELDS):
+            return [payload]
+        profile = {field: message.get(field) for field in PROFILE_FIELDS}
+        stripped = {k: v for k, v in message.items() if k not in PROFILE_FIELDS}
+        out = [dict(payload, message=stripped) if nested else stripped]
+        if self._profiles_sent.get(sender) != profile:
+            self._profiles_sent[sender] = profile
+            out.insert(0, {"type": "users", "users": {str(sender): profile}})
+        return out
+
+    async def send(self, payload: dict) -> None:
+        for frame in self.frames(payload):
+            if self.encoding == "msgpack":
+                await self.websocket.send_bytes(msgpack.packb(frame, default=str))
+            else:
+                await self.websocket.send_json(frame)
+
+    async def receive(self):
+        """The next decoded frame; None for a frame that does not decode."""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        try:
+            if message.get("bytes") is not None:
+                if msgpack is None:
+                    return None
+                return msgpack.unpackb(message["bytes"], raw=False)
+            return json.loads(message.get("text") or "")
+        except Exception:
+            logger.debug("undecodable websocket frame", exc_info=True)
+            return None
@@ -0,0 +1,89 @@
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+# Streamed ZIP writer for already-compressed files (slide PNGs). Entries are
+# STORED and their CRC-32 goes in a trailing data descriptor, so bytes are emitted
+# while each file is read and the archive size is known before the first byte.
+
+ZIP_CHUNK_SIZE = 256 * 1024
+_ZIP32_LIMIT = 0xFFFFFFFF
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION = 20
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    year = max(1980, t.tm_year)
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+    )
+
+
+class StoredZip:
+    """A ZIP archive of files on disk, produced lazily without temp files.
+
+    ``entries`` is a sequence of ``(path, arcname)``. Sizes are taken when the
+    object is created; ``len(archive)`` is the exact number of bytes ``iter()``
+    will yield. Archives beyond the classic 4 GiB ZIP limits are rejected.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        self.entries: List[tuple] = []
+        for path, arcname in entries:
+            st = os.stat(path)
+            name = str(arcname).encode("utf-8")
+            self.entries.append((Path(path), name, st.st_size, _dos_datetime(st.st_mtime)))
+        self.size = self._compute_size()
+        if self.size > _ZIP32_LIMIT or len(self.entries) > 0xFFFF:
+            raise ValueError("archive too large for ZIP32")
+
+    def _compute_size(self) -> int:
+        total = 22  # end of central directory
+        for _, name, size, _ in self.entries:
+            total += 30 + len(name) + size + 16  # local header, data, data descriptor
+            total += 46 + len(name)  # central directory entry
+        return total
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[bytes]:
+        central = []
+        offset = 0
+        for path, name, size, (dos_time, dos_date) in self.entries:
+            flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+            header = struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50, _VERSION, flags, 0, dos_time, dos_date,
+                0, 0, 0, len(name), 0,
+            ) + name
+            yield header
+            crc = 0
+            remaining = size
+            with open(path, "rb") as fh:
+                while remaining > 0:
+                    chunk = fh.read(min(ZIP_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise IOError(f"{path} shrank while it was being archived")
+                    crc = zlib.crc32(chunk, crc)
+                    remaining -= len(chunk)
+                    yield chunk
+            yield struct.pack("<IIII", 0x08074B50, crc, size, size)
+            central.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50, _VERSION, _VERSION, flags, 0, dos_time, dos_date,
+                crc, size, size, len(name), 0, 0, 0, 0, 0, offset,
+            ) + name)
+            offset += len(header) + size + 16
+        cd = b"".join(central)
+        yield cd
+        yield struct.pack(
+            "<IHHHHIIH",
+            0x06054B50, 0, 0, len(central), len(central), len(cd), offset, 0,
+        )
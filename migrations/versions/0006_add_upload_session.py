@@ -0,0 +1,33 @@
+"""Add uploadsession table for resumable uploads
+
+Revision ID: 0006_add_upload_session
+"""
+from sqlalchemy import text
+
+
+def upgrade(engine):
+    with engine.connect() as conn:
+        conn.execute(text(
+            """
+            CREATE TABLE IF NOT EXISTS uploadsession (
+                id INTEGER PRIMARY KEY,
+                upload_id TEXT NOT NULL UNIQUE,
+                owner_id INTEGER,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                "offset" INTEGER NOT NULL DEFAULT 0,
+                received TEXT,
+                upload_metadata TEXT,
+                status TEXT NOT NULL DEFAULT 'uploading',
+                presentation_id INTEGER,
+                created_at TEXT,
+                updated_at TEXT
+            )
+            """
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploadsession_upload_id ON uploadsession (upload_id)"))
+        conn.commit()
+
+
+def downgrade(engine):
+    return
@@ -0,0 +1,31 @@
+"""Add artifact table for storage accounting and garbage collection
+
+Revision ID: 0007_add_artifact
+"""
+from sqlalchemy import text
+
+
+def upgrade(engine):
+    with engine.connect() as conn:
+        conn.execute(text(
+            """
+            CREATE TABLE IF NOT EXISTS artifact (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                owner_id INTEGER,
+                presentation_id INTEGER,
+                size INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT,
+                updated_at TEXT
+            )
+            """
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_artifact_key ON artifact (key)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_artifact_owner_id ON artifact (owner_id)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_artifact_presentation_id ON artifact (presentation_id)"))
+        conn.commit()
+
+
+def downgrade(engine):
+    return
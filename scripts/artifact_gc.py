@@ -0,0 +1,40 @@
+"""Report (and optionally delete) orphaned files under UPLOAD_DIR.
+
+    python scripts/artifact_gc.py                 # dry run, JSON report
+    python scripts/artifact_gc.py --apply         # delete in batches
+    python scripts/artifact_gc.py --min-age-hours 0 --batch-size 50 --apply
+"""
+import os
+import sys
+import json
+import argparse
+
+# make package importable
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app import artifacts
+from app.database import create_db_and_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apply", action="store_true", help="delete candidates instead of only reporting them")
+    parser.add_argument("--min-age-hours", type=float, default=artifacts.ARTIFACT_GC_MIN_AGE_HOURS)
+    parser.add_argument("--batch-size", type=int, default=artifacts.ARTIFACT_GC_BATCH_SIZE)
+    parser.add_argument("--limit", type=int, default=200, help="items listed in the report")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    report = artifacts.collect_garbage(
+        dry_run=not args.apply,
+        min_age_seconds=args.min_age_hours * 3600,
+        batch_size=args.batch_size,
+        report_limit=args.limit,
+    )
+    report["top_owners"] = artifacts.top_owners()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""Build hashed, minified and precompressed static assets into static/dist/.
+
+    python scripts/build_assets.py
+"""
+import os
+import sys
+
+# make package importable
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.assets import build_assets
+
+
+def main():
+    manifest = build_assets()
+    print(f"built {len(manifest)} assets")
+
+
+if __name__ == "__main__":
+    main()
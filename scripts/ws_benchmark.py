@@ -0,0 +1,393 @@
+"""Load-test the realtime websockets and report latency, throughput and memory.
+
+Simulated users connect to a running server, drive a workload and measure
+end-to-end delivery latency: every sent message carries its send time, and
+receivers compare it with their own clock (run the harness on one host).
+
+    # once: create bench_0..bench_N-1, a benchmark space and follow pairs
+    python scripts/ws_benchmark.py setup --users 2000
+
+    python scripts/ws_benchmark.py run --scenario space --users 2000 --senders 50 --rate 1 --duration 30
+    python scripts/ws_benchmark.py run --scenario chat --users 2000 --rate 0.5
+    python scripts/ws_benchmark.py run --scenario video --users 200 --rate 2
+    python scripts/ws_benchmark.py run ... --json --max-p99-ms 250   # CI gate: exit 1 when slower
+    python scripts/ws_benchmark.py run ... --encoding msgpack --profiles once   # compact framing
+
+    python scripts/ws_benchmark.py cleanup
+
+Tokens are minted locally, so run with the server's SECRET_KEY and
+DATABASE_URL. Set REALTIME_STATS_TOKEN on both sides to also report server
+event-loop lag and memory per connection. Thousands of sockets need a raised
+open-file limit (ulimit -n) on both ends.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import urllib.request
+
+# make package importable
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from sqlmodel import Session, select
+
+from app.auth import create_access_token
+from app.database import create_db_and_tables, engine
+from app.models import Follow, Membership, Message, Notification, Space, SpaceMessage, User
+from app.realtime import LoopLagMonitor, percentile
+
+BENCH_PREFIX = "bench_"
+# bench accounts are recognised by this reserved (RFC 2606) email domain, never
+# by username alone, so cleanup cannot touch a real "bench_..." account
+BENCH_EMAIL_DOMAIN = "@bench.invalid"
+BENCH_SPACE = "ws-benchmark"
+MARK = "bench|"
+
+
+# --- fixtures -------------------------------------------------------------
+
+def _bench_users(session, count=None):
+    query = select(User).where(
+        User.username.startswith(BENCH_PREFIX), User.email.endswith(BENCH_EMAIL_DOMAIN)).order_by(User.id)
+    users = session.exec(query).all()
+    return users[:count] if count else users
+
+
+def setup(count: int) -> None:
+    create_db_and_tables()
+    with Session(engine) as session:
+        existing = {u.username for u in _bench_users(session)}
+        new = [
+            User(username=f"{BENCH_PREFIX}{i}", email=f"{BENCH_PREFIX}{i}{BENCH_EMAIL_DOMAIN}", hashed_password="!")
+            for i in range(count) if f"{BENCH_PREFIX}{i}" not in existing
+        ]
+        session.add_all(new)
+        space = session.exec(select(Space).where(Space.name == BENCH_SPACE)).first()
+        if space is None:
+            space = Space(name=BENCH_SPACE)
+            session.add(space)
+        session.commit()
+        users = _bench_users(session, count)
+        members = set(session.exec(select(Membership.user_id).where(Membership.space_id == space.id)).all())
+        follows = set(session.exec(select(Follow.follower_id).where(Follow.follower_id.in_([u.id for u in users]))).all())
+        for i, user in enumerate(users):
+            if user.id not in members:
+                # the first user hosts video meetings
+                session.add(Membership(user_id=user.id, space_id=space.id, role="teacher" if i == 0 else "student"))
+            partner = users[i ^ 1] if (i ^ 1) < len(users) else None
+            if partner is not None and user.id not in follows:
+                session.add(Follow(follower_id=user.id, following_id=partner.id))
+        session.commit()
+        print(f"{len(users)} bench users ({len(new)} new) in space {space.id}")
+
+
+def cleanup() -> None:
+    with Session(engine) as session:
+        ids = [u.id for u in _bench_users(session)]
+        space = session.exec(select(Space).where(Space.name == BENCH_SPACE)).first()
+        if space is not None:
+            members = session.exec(select(Membership.user_id).where(Membership.space_id == space.id)).all()
+            if set(members) - set(ids):
+                print(f"space {space.id} named {BENCH_SPACE!r} has non-bench members; leaving it alone")
+                space = None
+        rows = []
+        if space is not None:
+            rows += session.exec(select(SpaceMessage).where(SpaceMessage.space_id == space.id)).all()
+            rows += session.exec(select(Membership).where(Membership.space_id == space.id)).all()
+        if ids:
+            rows += session.exec(select(Message).where(Message.sender_id.in_(ids))).all()
+            rows += session.exec(select(Notification).where(Notification.actor_id.in_(ids))).all()
+            rows += session.exec(select(Follow).where(Follow.follower_id.in_(ids))).all()
+        for row in rows:
+            session.delete(row)
+        session.commit()
+        for uid in ids:
+            session.delete(session.get(User, uid))
+        if space is not None:
+            session.delete(space)
+        session.commit()
+        print(f"removed {len(ids)} bench users and {len(rows)} rows")
+
+
+# --- measurement ------------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.sent = 0
+        self.received = 0
+        self.typing_received = 0
+        self.errors = 0
+        self.disconnects = 0
+        self.bytes_received = 0
+        self.closing = False
+
+    def record(self, content: str) -> None:
+        if not isinstance(content, str) or not content.startswith(MARK):
+            return
+        try:
+            sent_ns = int(content[len(MARK):].split("|", 1)[0])
+        except ValueError:
+            return
+        self.received += 1
+        self.latencies.append((time.time_ns() - sent_ns) / 1e6)
+
+
+def _stamp() -> str:
+    return f"{MARK}{time.time_ns()}|{random.getrandbits(32):08x}"
+
+
+def server_stats(base_url: str):
+    token = os.getenv("REALTIME_STATS_TOKEN")
+    if not token:
+        return None
+    req = urllib.request.Request(base_url.rstrip("/") + "/api/realtime/stats", headers={"X-Stats-Token": token})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as res:
+            return json.load(res)
+    except Exception as exc:
+        print(f"stats unavailable: {exc}", file=sys.stderr)
+        return None
+
+
+# --- simulated users --------------------------------------------------------
+
+class Client:
+    def __init__(self, args, user, index, stats, peers):
+        self.args = args
+        self.user = user
+        self.index = index
+        self.stats = stats
+        self.peers = peers
+        self.ws = None
+
+    def url(self) -> str:
+        base = self.args.base_url.replace("http", "ws", 1).rstrip("/")
+        query = "?profiles=once" if self.args.profiles == "once" else ""
+        if self.args.scenario == "space":
+            return f"{base}/ws/spaces/{self.args.space_id}{query}"
+        if self.args.scenario == "chat":
+            return f"{base}/ws/chat/{self.partner_id}{query}"
+        return f"{base}/ws/video{query}"
+
+    async def send(self, payload: dict) -> None:
+        if self.ws.subprotocol == "msgpack":
+            await self.ws.send(msgpack.packb(payload))
+        else:
+            await self.ws.send(json.dumps(payload))
+
+    def decode(self, raw) -> dict:
+        self.stats.bytes_received += len(raw)
+        if isinstance(raw, bytes):
+            return msgpack.unpackb(raw, raw=False)
+        return json.loads(raw)
+
+    @property
+    def partner_id(self) -> int:
+        return self.peers[self.index ^ 1].id if (self.index ^ 1) < len(self.peers) else self.user.id
+
+    async def connect(self) -> bool:
+        cookie = f"access_token=Bearer {create_access_token({'sub': self.user.username})}"
+        try:
+            subprotocols = ["msgpack", "json"] if self.args.encoding == "msgpack" else None
+            self.ws = await websockets.connect(
+                self.url(), additional_headers={"Cookie": cookie}, max_queue=None, open_timeout=30,
+                subprotocols=subprotocols)
+            if self.args.scenario == "video":
+                await self.send({"event": "join-room", "payload": {"room_id": self.args.space_id}})
+            return True
+        except Exception:
+            self.stats.errors += 1
+            return False
+
+    async def read(self):
+        try:
+            async for raw in self.ws:
+                data = self.decode(raw)
+                kind = data.get("type") or data.get("event")
+                if kind == "ping":  # idle receivers would otherwise be timed out
+                    await self.send({"type": "pong", "event": "pong"})
+                elif kind == "message":
+                    msg = data.get("message") or data
+                    # chat echoes to the sender; space messages name it sender_id
+                    if msg.get("sender_id", msg.get("from")) != self.user.id:
+                        self.stats.record(msg.get("content"))
+                elif kind == "ice-candidate":
+                    self.stats.record((data.get("payload") or {}).get("candidate"))
+                elif kind == "typing":
+                    self.stats.typing_received += 1
+                elif kind == "meeting-inactive":
+                    # the host has not started the meeting yet
+                    await asyncio.sleep(0.5)
+                    await self.send({"event": "join-room", "payload": {"room_id": self.args.space_id}})
+        except Exception:
+            pass
+        if not self.stats.closing:  # closed by the server (e.g. a lagging outbox)
+            self.stats.disconnects += 1
+
+    async def send_loop(self, stop_at: float):
+        interval = 1.0 / self.args.rate if self.args.rate > 0 else None
+        await asyncio.sleep(random.random() * (interval or 1))
+        while interval and time.monotonic() < stop_at:
+            try:
+                if self.args.scenario == "space":
+                    if self.args.typing:
+                        await self.send({"type": "typing", "status": "start"})
+                    await self.send({"type": "message", "content": _stamp()})
+                elif self.args.scenario == "chat":
+                    await self.send({"type": "message", "to": self.partner_id, "content": _stamp()})
+                else:
+                    target = self.peers[(self.index + random.randrange(1, len(self.peers))) % len(self.peers)].id
+                    await self.send({"event": "ice-candidate", "payload": {
+                        "room_id": self.args.space_id, "target_id": target, "candidate": _stamp()}})
+                self.stats.sent += 1
+            except Exception:
+                self.stats.errors += 1
+                return
+            await asyncio.sleep(interval)
+
+
+async def run(args) -> dict:
+    with Session(engine) as session:
+        users = _bench_users(session, args.users)
+        space = session.exec(select(Space).where(Space.name == BENCH_SPACE)).first()
+    if len(users) < args.users or space is None:
+        raise SystemExit(f"only {len(users)} bench users; run `setup --users {args.users}` first")
+    args.space_id = space.id
+    stats = Stats()
+    monitor = LoopLagMonitor(interval=0.05)
+    monitor.start()
+    before = server_stats(args.base_url)
+
+    clients = [Client(args, user, i, stats, users) for i, user in enumerate(users)]
+    # the host goes first so the video meeting is open when the rest join
+    batches = [clients[:1]] + [clients[i:i + args.ramp] for i in range(1, len(clients), args.ramp)]
+    started = time.monotonic()
+    readers = []
+    for n, batch in enumerate(batches):
+        ok = await asyncio.gather(*(c.connect() for c in batch))
+        readers += [asyncio.ensure_future(c.read()) for c, up in zip(batch, ok) if up]
+        if 0 < n < len(batches) - 1:
+            await asyncio.sleep(1.0)
+    connect_seconds = time.monotonic() - started
+    connected = [c for c in clients if c.ws is not None]
+    loaded = server_stats(args.base_url)
+
+    senders = connected[:args.senders] if args.senders else connected
+    stop_at = time.monotonic() + args.duration
+    load_started = time.monotonic()
+    await asyncio.gather(*(c.send_loop(stop_at) for c in senders))
+    await asyncio.sleep(args.drain)
+    elapsed = time.monotonic() - load_started
+    after = server_stats(args.base_url)
+
+    stats.closing = True
+    await asyncio.gather(*(c.ws.close() for c in connected), return_exceptions=True)
+    for task in readers:
+        task.cancel()
+    monitor.stop()
+
+    latencies = sorted(stats.latencies)
+    report = {
+        "scenario": args.scenario,
+        "users": len(clients),
+        "connected": len(connected),
+        "connect_seconds": round(connect_seconds, 2),
+        "senders": len(senders),
+        "sent": stats.sent,
+        "delivered": stats.received,
+        "typing_delivered": stats.typing_received,
+        "errors": stats.errors,
+        "dropped_connections": stats.disconnects,
+        "sent_per_sec": round(stats.sent / elapsed, 1) if elapsed else 0,
+        "delivered_per_sec": round(stats.received / elapsed, 1) if elapsed else 0,
+        # decoded frame sizes; permessage-deflate shrinks what crosses the network further
+        "payload_bytes_received": stats.bytes_received,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0,
+        },
+        # a busy harness inflates every latency above; check this first
+        "client_loop_lag": monitor.snapshot(),
+    }
+    if before and loaded:
+        sockets = max(1, len(connected))
+        report["server"] = {
+            "memory_per_connection_bytes": int((loaded["rss_bytes"] - before["rss_bytes"]) / sockets),
+            "rss_bytes": (after or loaded)["rss_bytes"],
+            "loop_lag": (after or loaded)["loop_lag"],
+            "backlog": (after or loaded).get("spaces"),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_setup = sub.add_parser("setup", help="create bench users, space and follows")
+    p_setup.add_argument("--users", type=int, default=1000)
+    sub.add_parser("cleanup", help="remove everything setup created")
+    p_run = sub.add_parser("run", help="connect and drive a workload")
+    p_run.add_argument("--base-url", default=os.getenv("BENCH_BASE_URL", "http://127.0.0.1:8000"))
+    p_run.add_argument("--scenario", choices=("space", "chat", "video"), default="space")
+    p_run.add_argument("--users", type=int, default=1000)
+    p_run.add_argument("--senders", type=int, default=50, help="users that send (0 = all)")
+    p_run.add_argument("--rate", type=float, default=1.0, help="messages per second per sender")
+    p_run.add_argument("--typing", action="store_true", help="space: send a typing event before each message")
+    p_run.add_argument("--duration", type=float, default=30.0, help="seconds of load after everyone connected")
+    p_run.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight deliveries")
+    p_run.add_argument("--ramp", type=int, default=200, help="connections opened per second")
+    p_run.add_argument("--encoding", choices=("json", "msgpack"), default="json",
+                       help="offer the msgpack subprotocol (falls back to json if the server declines)")
+    p_run.add_argument("--profiles", choices=("inline", "once"), default="inline",
+                       help="once: sender profiles come in separate users frames")
+    p_run.add_argument("--json", action="store_true", help="print the report as JSON")
+    p_run.add_argument("--max-p99-ms", type=float, help="exit 1 when p99 latency exceeds this")
+    args = parser.parse_args()
+
+    if args.command == "setup":
+        return setup(args.users)
+    if args.command == "cleanup":
+        return cleanup()
+    if websockets is None:
+        raise SystemExit("the websockets package is required (pip install websockets)")
+    if args.encoding == "msgpack" and msgpack is None:
+        raise SystemExit("--encoding msgpack needs the msgpack package (pip install msgpack)")
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        lat = report["latency_ms"]
+        print(f"{report['scenario']}: {report['connected']}/{report['users']} connected in {report['connect_seconds']}s")
+        print(f"  sent {report['sent']} ({report['sent_per_sec']}/s), delivered {report['delivered']} "
+              f"({report['delivered_per_sec']}/s), errors {report['errors']}, dropped {report['dropped_connections']}")
+        print(f"  received {report['payload_bytes_received']} payload bytes")
+        print(f"  latency ms p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+        print(f"  harness loop lag ms p99 {report['client_loop_lag']['p99_ms']}")
+        server = report.get("server")
+        if server:
+            print(f"  server: {server['memory_per_connection_bytes']} B/connection, "
+                  f"loop lag ms p50 {server['loop_lag']['p50_ms']} p99 {server['loop_lag']['p99_ms']}")
+    if args.max_p99_ms is not None and report["latency_ms"]["p99"] > args.max_p99_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
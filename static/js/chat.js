@@ -219,7 +219,7 @@ document.addEventListener('DOMContentLoaded', function(){
 
     if (m.avatar){
       const img = document.createElement('img');
-      img.src = '/download/' + m.avatar + '?inline=1';
+      img.src = '/images/avatar/64/' + encodeURIComponent(m.avatar);
       img.alt = rawName;
       img.style.width = '100%';
       img.style.height = '100%';
@@ -271,10 +271,13 @@ document.addEventListener('DOMContentLoaded', function(){
       link.href = m.file;
       link.target = '_blank';
       link.rel = 'noopener noreferrer';
-      // show filename as link text
+      // show the original filename (``?name=``; older messages: the last path segment)
       try{
-        const urlParts = m.file.split('/');
-        link.textContent = decodeURIComponent(urlParts[urlParts.length-1]) || 'attachment';
+        const url = new URL(m.file, location.href);
+        const urlParts = url.pathname.split('/');
+        const name = url.searchParams.get('name') || decodeURIComponent(urlParts[urlParts.length-1]);
+        link.textContent = name || 'attachment';
+        if (name) link.download = name;
       }catch(e){ link.textContent = 'attachment'; }
       // if thumbnail exists, show it; otherwise inline image preview when possible
       if (m.thumbnail){
@@ -374,21 +377,49 @@ document.addEventListener('DOMContentLoaded', function(){
     readEl.textContent = 'Seen';
   }
 
+  function isMessageShown(id){
+    return !!qs('#chat-messages [data-message-id="' + id + '"]');
+  }
+
+  function lastShownMessageId(){
+    let last = 0;
+    qsa('#chat-messages [data-message-id]').forEach(el => { last = Math.max(last, parseInt(el.dataset.messageId) || 0); });
+    return last;
+  }
+
+  let reconnectDelay = 1000;
+  // sender profiles arrive once per socket in "users" frames (profiles=once)
+  const senderProfiles = {};
   function connectSocket(){
     if (!otherId) return;
-    // build WS url
+    // build WS url; resume_from asks the server to replay what we missed
     const proto = location.protocol === 'https:' ? 'wss' : 'ws';
-    const url = proto + '://' + location.host + '/ws/chat/' + otherId;
+    const last = lastShownMessageId();
+    const url = proto + '://' + location.host + '/ws/chat/' + otherId + '?profiles=once' + (last ? '&resume_from=' + last : '');
+    let ws;
     try{
-      socket = new WebSocket(url);
+      ws = socket = new WebSocket(url);
     }catch(e){ console.warn('ws conn fail', e); socket = null; return; }
     socket.addEventListener('open', () => {
       console.log('chat socket open');
+      reconnectDelay = 1000;
     });
     socket.addEventListener('message', (ev) => {
       let data;
       try{ data = JSON.parse(ev.data); }catch(e){ return; }
+      if (data.type === 'ping'){ ws.send(JSON.stringify({ type: 'pong', event: 'pong' })); return; }
+      if (data.type === 'users'){ Object.assign(senderProfiles, data.users || {}); return; }
+      if (data.type === 'replay'){
+        if (data.more){ loadHistory(); return; }
+        (data.messages || []).forEach(([id, from, to, content, file, created_at]) => {
+          if (!isMessageShown(id)) appendMessage({ id, from, to, content, file, created_at });
+        });
+        return;
+      }
+      if (data.type === 'message' && data.message) data = Object.assign({ type: 'message' }, data.message);
+      if (data.type === 'message') data = Object.assign({}, senderProfiles[String(data.from)] || {}, data);
       if (data.type === 'message'){
+        if (data.id && isMessageShown(data.id)) return;
         appendMessage({
           id: data.id,
           from: data.from,
@@ -410,8 +441,8 @@ document.addEventListener('DOMContentLoaded', function(){
           markThreadRead();
         }
       } else if (data.type === 'presence'){
-        // optional: show presence
-        updatePresenceDot(data.user_id, data.online);
+        // batched diff: { changes: { "<user id>": true|false } }
+        Object.keys(data.changes || {}).forEach(uid => updatePresenceDot(uid, data.changes[uid]));
       } else if (data.type === 'typing'){
         if (data.from !== otherId) return;
         if (data.status === 'start'){
@@ -427,7 +458,15 @@ document.addEventListener('DOMContentLoaded', function(){
         updateReadState(lastReadId);
       }
     });
-    socket.addEventListener('close', ()=>{ console.log('chat socket closed'); socket = null; });
+    socket.addEventListener('close', ()=>{
+      console.log('chat socket closed');
+      if (socket !== ws) return;  // closed on purpose
+      socket = null;
+      if (otherId){
+        setTimeout(connectSocket, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+      }
+    });
   }
 
   document.getElementById('chat-clear')?.addEventListener('click', clearChat);
@@ -722,17 +761,17 @@ document.addEventListener('DOMContentLoaded', function(){
         await loadHistory();
       }
     }catch(e){ /* ignore */ }
-    // presence: check visible users
-    qsa('.presence-dot').forEach(async el=>{
-      const uid = el.getAttribute('data-user-id');
-      try{
-        const r = await fetch('/api/online/' + uid);
+    // presence: one request for every visible user
+    try{
+      const ids = Array.from(new Set(Array.from(qsa('.presence-dot')).map(el => el.getAttribute('data-user-id')).filter(Boolean)));
+      if (ids.length){
+        const r = await fetch('/api/online?ids=' + ids.slice(0, 500).join(','));
         if (r.ok){
-          const j = await r.json();
-          el.style.background = j.online ? '#10B981' : '#BDBDBD';
+          const online = new Set(((await r.json()).online || []).map(String));
+          ids.forEach(uid => updatePresenceDot(uid, online.has(String(uid))));
         }
-      }catch(e){ }
-    });
+      }
+    }catch(e){ }
     setTimeout(pollBadges, 10000);
   })();
 
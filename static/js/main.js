@@ -540,7 +540,7 @@ document.addEventListener("DOMContentLoaded", () => {
         avatarWrap.style.background = 'linear-gradient(135deg,#eef1ff,#ffd9a8)';
         if (n.actor_avatar){
           const img = document.createElement('img');
-          img.src = '/download/' + n.actor_avatar + '?inline=1';
+          img.src = '/images/avatar/128/' + encodeURIComponent(n.actor_avatar);
           img.alt = n.actor_username + ' avatar';
           img.style.width = '100%';
           img.style.height = '100%';
@@ -20,6 +20,10 @@ class PresentationViewer {
     this.thumbnailSidebar = this.thumbsEl;
 
     this.slides = [];
+    this.slideVersions = {};
+    this.tileSources = {};
+    this.tileLayer = null;
+    this.pendingTileFrame = 0;
     this.currentIndex = 0;
     this.currentZoom = 1;
     this.minZoom = 0.5;
@@ -271,7 +275,150 @@ class PresentationViewer {
 
   buildHdSlideUrl(index) {
     const quality = this.getQualityFactor();
-    return `/presentations/${this.presentationId}/slide/${index}?hd=1&quality=${quality}`;
+    const version = this.slideVersions[index];
+    const suffix = version ? `&v=${encodeURIComponent(version)}` : '';
+    return `/presentations/${this.presentationId}/slide/${index}?hd=1&quality=${quality}${suffix}`;
+  }
+
+  rememberSlideVersions(urls) {
+    this.slideVersions = {};
+    urls.forEach((url, index) => {
+      try {
+        const version = new URL(url, window.location.href).searchParams.get('v');
+        if (version) this.slideVersions[index] = version;
+      } catch (_) {}
+    });
+  }
+
+  slideBaseUrl(index) {
+    return `/presentations/${this.presentationId}/slide/${index}`;
+  }
+
+  async loadTileSource(index) {
+    if (Object.prototype.hasOwnProperty.call(this.tileSources, index)) return this.tileSources[index];
+    let source = null;
+    try {
+      const version = this.slideVersions[index];
+      const query = version ? `?v=${encodeURIComponent(version)}` : '';
+      const res = await fetch(`${this.slideBaseUrl(index)}/tiles.dzi${query}`, { credentials: 'include' });
+      if (res.ok) {
+        const xml = new DOMParser().parseFromString(await res.text(), 'application/xml');
+        const image = xml.getElementsByTagName('Image')[0];
+        const size = xml.getElementsByTagName('Size')[0];
+        const width = Number(size.getAttribute('Width'));
+        const height = Number(size.getAttribute('Height'));
+        if (width > 0 && height > 0) {
+          source = {
+            width,
+            height,
+            tileSize: Number(image.getAttribute('TileSize')) || 512,
+            format: image.getAttribute('Format') || 'png',
+            maxLevel: Math.ceil(Math.log2(Math.max(width, height))),
+          };
+        }
+      }
+    } catch (_) {}
+    this.tileSources[index] = source;
+    return source;
+  }
+
+  scheduleTileUpdate() {
+    if (this.pendingTileFrame) {
+      try { cancelAnimationFrame(this.pendingTileFrame); } catch (_) {}
+    }
+    this.pendingTileFrame = requestAnimationFrame(() => {
+      this.pendingTileFrame = 0;
+      this.updateTiles().catch(() => {});
+    });
+  }
+
+  ensureTileLayer(img) {
+    if (this.tileLayer && this.tileLayer.isConnected && this.tileLayer.parentElement === img.parentElement) {
+      return this.tileLayer;
+    }
+    const layer = document.createElement('div');
+    layer.className = 'presentation-tile-layer';
+    layer.style.position = 'absolute';
+    layer.style.pointerEvents = 'none';
+    layer.style.overflow = 'hidden';
+    img.parentElement.style.setProperty('position', 'relative');
+    img.parentElement.appendChild(layer);
+    this.tileLayer = layer;
+    return layer;
+  }
+
+  // Overlay deep-zoom tiles for the visible part of the current slide so zooming
+  // downloads only the viewport at the needed resolution instead of a whole HD page.
+  async updateTiles() {
+    const img = this.currentImg;
+    if (!img || img.tagName !== 'IMG' || !this.presentationId || !this.mainEl) return;
+    const index = Number(img.dataset.slideIndex || this.currentSlideIndex || 0);
+    const source = await this.loadTileSource(index);
+    if (img !== this.currentImg) return;
+    if (!source) {
+      this.refreshCurrentImageQuality();
+      return;
+    }
+
+    const rect = img.getBoundingClientRect();
+    const targetWidth = rect.width * (window.devicePixelRatio || 1);
+    const layer = this.ensureTileLayer(img);
+    layer.style.left = `${img.offsetLeft}px`;
+    layer.style.top = `${img.offsetTop}px`;
+    layer.style.width = `${img.offsetWidth}px`;
+    layer.style.height = `${img.offsetHeight}px`;
+    if (!rect.width || targetWidth <= (img.naturalWidth || 0)) {
+      layer.innerHTML = '';
+      return;
+    }
+
+    const levelSize = (level) => {
+      const factor = 2 ** (source.maxLevel - level);
+      return [Math.ceil(source.width / factor), Math.ceil(source.height / factor)];
+    };
+    let level = source.maxLevel;
+    while (level > 0 && levelSize(level - 1)[0] >= targetWidth) level -= 1;
+    const [levelWidth, levelHeight] = levelSize(level);
+
+    const view = this.mainEl.getBoundingClientRect();
+    const left = Math.max(rect.left, view.left);
+    const right = Math.min(rect.right, view.right);
+    const top = Math.max(rect.top, view.top);
+    const bottom = Math.min(rect.bottom, view.bottom);
+    if (right <= left || bottom <= top) return;
+
+    const ts = source.tileSize;
+    const lastCol = Math.ceil(levelWidth / ts) - 1;
+    const lastRow = Math.ceil(levelHeight / ts) - 1;
+    const colStart = Math.max(0, Math.floor(((left - rect.left) / rect.width) * levelWidth / ts));
+    const colEnd = Math.min(lastCol, Math.floor(((right - rect.left) / rect.width) * levelWidth / ts));
+    const rowStart = Math.max(0, Math.floor(((top - rect.top) / rect.height) * levelHeight / ts));
+    const rowEnd = Math.min(lastRow, Math.floor(((bottom - rect.top) / rect.height) * levelHeight / ts));
+
+    layer.querySelectorAll('img').forEach((tile) => {
+      if (Number(tile.dataset.level) !== level) tile.remove();
+    });
+    const version = this.slideVersions[index];
+    const query = version ? `?v=${encodeURIComponent(version)}` : '';
+    for (let row = rowStart; row <= rowEnd; row += 1) {
+      for (let col = colStart; col <= colEnd; col += 1) {
+        const key = `${level}/${col}_${row}`;
+        if (layer.querySelector(`img[data-key="${key}"]`)) continue;
+        const tile = document.createElement('img');
+        tile.dataset.key = key;
+        tile.dataset.level = String(level);
+        tile.alt = '';
+        tile.decoding = 'async';
+        tile.style.position = 'absolute';
+        tile.style.left = `${(col * ts / levelWidth) * 100}%`;
+        tile.style.top = `${(row * ts / levelHeight) * 100}%`;
+        tile.style.width = `${(Math.min(ts, levelWidth - col * ts) / levelWidth) * 100}%`;
+        tile.style.height = `${(Math.min(ts, levelHeight - row * ts) / levelHeight) * 100}%`;
+        tile.onerror = () => tile.remove();
+        tile.src = `${this.slideBaseUrl(index)}/tiles_files/${key}.${source.format}${query}`;
+        layer.appendChild(tile);
+      }
+    }
   }
 
   refreshCurrentImageQuality() {
@@ -394,7 +541,7 @@ class PresentationViewer {
     this.mainEl.style.setProperty('overflow-y', 'scroll', 'important');
     this.scheduleForceApplyLiveZoom();
 
-    this.refreshCurrentImageQuality();
+    this.scheduleTileUpdate();
   }
 
   fitZoom() {
@@ -435,6 +582,7 @@ class PresentationViewer {
   prepareZoomLayer() {
     if (!this.mainEl) return;
     this.mainEl.innerHTML = '';
+    this.tileLayer = null;
 
     const zoomStage = document.createElement('div');
     zoomStage.className = 'presentation-zoom-stage';
@@ -516,9 +664,10 @@ class PresentationViewer {
       if (!res.ok) throw new Error('no thumbs');
       const data = await res.json();
       const urls = data.thumbnails || [];
+      this.rememberSlideVersions(urls);
       this.slides = urls.map((url, index) => ({
         id: `slide-${index + 1}`,
-        imageUrl: this.buildHdSlideUrl(index),
+        imageUrl: url,
         thumbnailUrl: url,
       }));
 
@@ -919,9 +1068,10 @@ class PresentationViewer {
         if (resp.ok) {
           const json = await resp.json();
           if (json.thumbnails && json.thumbnails.length) {
+            this.rememberSlideVersions(json.thumbnails);
             this.slides = json.thumbnails.map((url, index) => ({
               id: `slide-${index + 1}`,
-              imageUrl: this.buildHdSlideUrl(index),
+              imageUrl: url,
               thumbnailUrl: url,
             }));
             this.generateThumbnails();
@@ -941,6 +1091,10 @@ class PresentationViewer {
     if (this.isBound) return;
     this.isBound = true;
 
+    if (this.mainEl) {
+      this.mainEl.addEventListener('scroll', () => this.scheduleTileUpdate(), { passive: true });
+    }
+
     if (this.prevBtn) {
       this.prevBtn.addEventListener('click', () => {
         if (this.currentIndex > 0) this.showPage(this.currentIndex - 1);
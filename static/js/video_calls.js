@@ -56,6 +56,10 @@ document.addEventListener('DOMContentLoaded', () => {
         ws.onmessage = (event) => {
           let data = null;
           try { data = JSON.parse(event.data); } catch (e) { return; }
+          if (data && data.event === 'ping') {
+            ws.send(JSON.stringify({ event: 'pong', type: 'pong' }));
+            return;
+          }
           handleSignal(data);
         };
         ws.onclose = () => {
@@ -80,7 +84,11 @@ document.addEventListener('DOMContentLoaded', () => {
     peers: new Map(),
     remoteStreams: new Map(),
     active: false,
-    host: false
+    host: false,
+    // "mesh": a peer connection per participant; "sfu": one to the forwarder
+    topology: 'mesh',
+    forwarder: null,
+    layers: []
   };
 
   const callState = {
@@ -297,18 +305,58 @@ document.addEventListener('DOMContentLoaded', () => {
 
     pc.ontrack = (event) => {
       const [stream] = event.streams;
-      if (stream) {
-        meeting.remoteStreams.set(peerId, stream);
-        attachVideoTile(peerId, stream, false);
-      }
+      if (!stream) return;
+      // a forwarder labels each stream it relays with its publisher: "user-<id>"
+      const match = peerId === meeting.forwarder ? /^user-(\d+)$/.exec(stream.id) : null;
+      const ownerId = match ? parseInt(match[1]) : peerId;
+      meeting.remoteStreams.set(ownerId, stream);
+      attachVideoTile(ownerId, stream, false);
     };
 
     const stream = await getMeetingLocalStream();
-    stream.getTracks().forEach((track) => pc.addTrack(track, stream));
+    if (peerId === meeting.forwarder && meeting.layers.length) {
+      // one simulcast upstream; the forwarder picks a layer per subscriber
+      stream.getAudioTracks().forEach((track) => pc.addTrack(track, stream));
+      stream.getVideoTracks().forEach((track) => pc.addTransceiver(track, {
+        direction: 'sendrecv',
+        streams: [stream],
+        sendEncodings: meeting.layers
+      }));
+    } else {
+      stream.getTracks().forEach((track) => pc.addTrack(track, stream));
+    }
 
     return pc;
   };
 
+  const sendMeetingOffer = async (spaceId, peerId) => {
+    const pc = await createMeetingPeer(peerId);
+    const offer = await pc.createOffer();
+    await pc.setLocalDescription(offer);
+    signaling.send({
+      event: 'offer',
+      payload: {
+        target_id: peerId,
+        room_id: spaceId,
+        sdp: pc.localDescription
+      }
+    });
+  };
+
+  const applyTopology = (payload) => {
+    const forwarder = payload.topology === 'sfu' ? payload.forwarder : null;
+    if (forwarder === meeting.forwarder) return false;
+    // drop the old connections; they are renegotiated with the new topology
+    meeting.peers.forEach((pc) => pc.close());
+    meeting.peers.clear();
+    meeting.remoteStreams.forEach((_, uid) => removeVideoTile(uid));
+    meeting.remoteStreams.clear();
+    meeting.topology = forwarder ? 'sfu' : 'mesh';
+    meeting.forwarder = forwarder;
+    meeting.layers = payload.layers || [];
+    return true;
+  };
+
   const closeMeeting = async () => {
     if (!meeting.active) return;
     meeting.active = false;
@@ -328,6 +376,9 @@ document.addEventListener('DOMContentLoaded', () => {
     meeting.screenStream = null;
     meeting.spaceId = null;
     meeting.title = null;
+    meeting.topology = 'mesh';
+    meeting.forwarder = null;
+    meeting.layers = [];
     clearMeetingUI();
     closeMeetingModal();
   };
@@ -336,18 +387,9 @@ document.addEventListener('DOMContentLoaded', () => {
     if (!spaceId || !Array.isArray(users)) return;
     for (const uid of users) {
       addParticipantLabel(uid, `User #${uid}`);
-      const pc = await createMeetingPeer(uid);
-      const offer = await pc.createOffer();
-      await pc.setLocalDescription(offer);
-      signaling.send({
-        event: 'offer',
-        payload: {
-          target_id: uid,
-          room_id: spaceId,
-          sdp: pc.localDescription
-        }
-      });
+      if (meeting.topology === 'mesh') await sendMeetingOffer(spaceId, uid);
     }
+    if (meeting.forwarder) await sendMeetingOffer(spaceId, meeting.forwarder);
   };
 
   const startMeeting = async (spaceId, spaceName) => {
@@ -512,10 +554,35 @@ document.addEventListener('DOMContentLoaded', () => {
     const payload = data.payload || {};
 
     if (event === 'room-users') {
+      applyTopology(payload);
+      if (payload.warning === 'mesh-oversized') {
+        showToast('This meeting is large; video quality may drop for everyone.');
+      }
       await handleMeetingUsers(payload.space_id, payload.users || []);
       return;
     }
 
+    if (event === 'topology') {
+      if (!meeting.active || payload.space_id !== meeting.spaceId) return;
+      if (!applyTopology(payload)) return;
+      if (meeting.forwarder) {
+        await sendMeetingOffer(meeting.spaceId, meeting.forwarder);
+      } else {
+        // back to mesh: whoever has the higher id offers, so each pair negotiates once
+        (meetingList ? meetingList.querySelectorAll('[data-user-id]') : []).forEach((el) => {
+          const uid = parseInt(el.getAttribute('data-user-id'));
+          if (uid && uid !== myId && myId > uid) sendMeetingOffer(meeting.spaceId, uid);
+        });
+      }
+      return;
+    }
+
+    if (event === 'room-full') {
+      showToast(`This meeting is full (${payload.max_participants} participants).`);
+      await closeMeeting();
+      return;
+    }
+
     if (event === 'user-joined') {
       addParticipantLabel(payload.user_id, payload.username || `User #${payload.user_id}`);
       return;
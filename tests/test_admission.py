@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from app import main
+from app.auth import create_access_token
+from app.database import create_db_and_tables, engine
+from app.models import Membership, Space, User
+from app.realtime import ConnectionLimiter, Heartbeat, TokenBucket
+
+
+class Client:
+    def __init__(self, host):
+        self.host = host
+
+
+class FakeSocket:
+    def __init__(self, host="10.0.0.1"):
+        self.client = Client(host)
+        self.client_state = WebSocketState.CONNECTED
+        self.application_state = WebSocketState.CONNECTED
+        self.inbox = asyncio.Queue()
+        self.sent = []
+        self.close_code = None
+
+    async def send_json(self, payload):
+        self.sent.append(payload)
+
+    async def receive(self):
+        return {"type": "websocket.receive", "text": json.dumps(await self.inbox.get())}
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+def test_token_bucket_and_limiter_caps():
+    bucket = TokenBucket(rate=0, burst=2)
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+
+    limiter = ConnectionLimiter(per_user=2, per_ip=3)
+    a, b, c, d = FakeSocket(), FakeSocket(), FakeSocket(), FakeSocket("10.0.0.2")
+    assert limiter.admit(a, 1) and limiter.admit(b, 1)
+    assert not limiter.admit(c, 1)  # third socket for user 1
+    assert limiter.admit(c)  # anonymous sockets count only against the address
+    assert not limiter.admit(FakeSocket(), 2)  # address full
+    assert limiter.admit(d, 2)
+    limiter.release(a)
+    limiter.release(a)
+    assert limiter.admit(FakeSocket("10.0.0.3"), 1)
+
+    b.client_state = WebSocketState.DISCONNECTED
+    assert limiter.sweep() == 1
+    assert limiter.stats() == {"sockets": 3, "users": 2, "addresses": 3, "refused": 2}
+
+
+def test_heartbeat_drops_floods_then_closes():
+    async def scenario():
+        ws = FakeSocket()
+        heartbeat = Heartbeat(ws, ping_interval=0, idle_timeout=0, rate=0.001, burst=2)
+        for n in range(6):
+            ws.inbox.put_nowait({"type": "message", "n": n})
+        assert [(await heartbeat.receive_json())["n"] for _ in range(2)] == [0, 1]
+        with pytest.raises(WebSocketDisconnect):
+            await heartbeat.receive_json()
+        return ws, heartbeat
+
+    ws, heartbeat = asyncio.run(scenario())
+    assert ws.close_code == 1008 and heartbeat.throttled == 3
+
+
+@pytest.fixture
+def space_member():
+    create_db_and_tables()
+    with Session(engine) as session:
+        member = User(username="admit_member", email="admit_member@example.com", hashed_password="x")
+        outsider = User(username="admit_outsider", email="admit_outsider@example.com", hashed_password="x")
+        space = Space(name="admission space")
+        session.add_all([member, outsider, space])
+        session.commit()
+        session.add(Membership(user_id=member.id, space_id=space.id, role="student"))
+        session.commit()
+        ids = member.id, outsider.id, space.id
+    yield ids
+    main._ws_membership_cache.clear()
+    with Session(engine) as session:
+        for row in session.exec(select(Membership).where(Membership.space_id == ids[2])).all():
+            session.delete(row)
+        session.delete(session.get(Space, ids[2]))
+        for uid in ids[:2]:
+            session.delete(session.get(User, uid))
+        session.commit()
+
+
+def _client(username):
+    client = TestClient(main.app)
+    client.cookies.set("access_token", f"Bearer {create_access_token({'sub': username})}")
+    return client
+
+
+def test_space_socket_refused_before_accept(space_member, monkeypatch):
+    member_id, _, space_id = space_member
+    monkeypatch.setattr(main.space_rooms, "grace", 0)
+    url = f"/ws/spaces/{space_id}"
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with _client("admit_outsider").websocket_connect(url):
+            pass
+    assert refused.value.code == 1008
+
+    monkeypatch.setattr(main.ws_limiter, "per_user", 1)
+    client = _client("admit_member")
+    with client.websocket_connect(url) as ws:
+        ws.send_json({"type": "typing"})
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect(url):
+                pass
+        assert main.ws_limiter.stats()["sockets"] == 1
+    assert main.ws_limiter.stats()["sockets"] == 0
+
+
+def test_membership_cache_serves_handshakes_until_forgotten(space_member):
+    member_id, _, space_id = space_member
+
+    async def role():
+        return await main._ws_member_role(member_id, space_id)
+
+    assert asyncio.run(role()) == "student"
+    with Session(engine) as session:
+        session.delete(session.exec(select(Membership).where(Membership.user_id == member_id)).first())
+        session.commit()
+    assert asyncio.run(role()) == "student"  # cached
+    main._forget_ws_membership(member_id)
+    assert asyncio.run(role()) is None
@@ -0,0 +1,84 @@
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import artifacts
+from app.models import Presentation, User
+
+
+def _setup(tmp_path, monkeypatch):
+    """A private UPLOAD_DIR and database, so the sweep sees only this test's files and rows."""
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    monkeypatch.setenv("UPLOAD_DIR", str(uploads))
+    engine = create_engine(f"sqlite:///{tmp_path / 'artifacts.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(artifacts, "engine", engine)
+    with Session(engine) as session:
+        user = User(username="artifact_owner", email="artifact_owner@example.com", hashed_password="x")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        pres = Presentation(title="kept", filename="artifact_keep.pdf", owner_id=user.id)
+        session.add(pres)
+        session.commit()
+        session.refresh(pres)
+        return uploads, user.id, pres.id
+
+
+def test_registry_usage_and_gc_sweep(tmp_path, monkeypatch):
+    root, owner_id, pid = _setup(tmp_path, monkeypatch)
+    dead = pid + 100000
+    (root / "artifact_keep.pdf").write_bytes(b"%PDF-" + b"x" * 95)
+    (root / f"thumbs/{pid}").mkdir(parents=True)
+    (root / f"thumbs/{pid}/slide_0.png").write_bytes(b"p" * 50)
+    (root / f"{pid}_web.mp4").write_bytes(b"v" * 10)
+    # orphans
+    (root / "artifact_orphan.pdf").write_bytes(b"o" * 7)
+    (root / f"thumbs_hd/{dead}").mkdir(parents=True)
+    (root / f"thumbs_hd/{dead}/q80.png").write_bytes(b"h" * 30)
+    (root / f"{dead}_web.mp4").write_bytes(b"w" * 3)
+    (root / "render.tmp").write_bytes(b"t")
+
+    assert artifacts.refresh_presentation_artifacts(pid) == 160
+    used = artifacts.usage(owner_id)
+    assert used["bytes"] == 160
+    assert used["by_kind"] == {"upload": 100, "thumbs": 50, "video": 10}
+    artifacts.record_artifact("artifact_orphan.pdf", "upload", owner_id)
+    # recorded before its file is written, like an in-flight conversion
+    artifacts.record_artifact("artifact_pending.pdf", "upload", owner_id, size=0)
+
+    # fresh files and fresh records are protected by the minimum age
+    assert artifacts.collect_garbage(dry_run=True, min_age_seconds=3600)["candidates"] == 0
+
+    report = artifacts.collect_garbage(dry_run=True, min_age_seconds=0)
+    found = {item["key"]: item["reason"] for item in report["items"]}
+    assert found == {
+        "artifact_orphan.pdf": "not referenced",
+        f"thumbs_hd/{dead}/": "presentation deleted",
+        f"{dead}_web.mp4": "presentation deleted",
+        "render.tmp": "abandoned temporary file",
+        "artifact_pending.pdf": "stale record",
+    }
+    assert report["bytes"] == 41
+    assert (root / "artifact_orphan.pdf").exists()
+
+    report = artifacts.collect_garbage(dry_run=False, min_age_seconds=0, batch_size=2)
+    assert report["deleted"] == 5 and report["freed"] == 41
+    assert not (root / "artifact_orphan.pdf").exists()
+    assert not (root / f"thumbs_hd/{dead}").exists()
+    assert (root / "artifact_keep.pdf").exists()
+    assert (root / f"thumbs/{pid}/slide_0.png").exists()
+    assert artifacts.usage(owner_id)["bytes"] == 160
+
+    assert artifacts.release_presentation_artifacts(pid) == 160
+    assert not (root / f"thumbs/{pid}").exists()
+    assert artifacts.usage(owner_id)["files"] == 0
+
+
+def test_scheduled_sweep_runs_once_per_interval(tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path))
+    runs = []
+    monkeypatch.setattr(artifacts, "collect_garbage", lambda: runs.append(1))
+    assert artifacts._scheduled_sweep(3600)
+    # another worker's timer firing right after finds the sweep already done
+    assert not artifacts._scheduled_sweep(3600)
+    assert runs == [1]
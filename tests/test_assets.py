@@ -0,0 +1,58 @@
+import gzip
+import json
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from fastapi.testclient import TestClient
+
+from app import assets
+
+
+def test_minify_css_keeps_strings():
+    css = '/* header */\na  ,  b {\n  content: "/* not a comment */" ;\n  margin : 0 auto;\n}\n'
+    out = assets.minify_css(css)
+    assert "header" not in out
+    assert '"/* not a comment */"' in out
+    assert out.startswith("a,b{")
+
+
+def test_build_and_serve_precompressed(tmp_path, monkeypatch):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "styles.css").write_text("body {\n  color: red;\n}\n" * 200)
+    (tmp_path / "js" / "app.js").write_text("console.log('hi');\n" * 100)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG")
+
+    manifest = assets.build_assets(tmp_path)
+    assert set(manifest) == {"styles.css", "js/app.js"}
+    built = tmp_path / manifest["styles.css"]
+    assert built.name.startswith("styles.") and built.exists()
+    assert (built.parent / (built.name + ".gz")).exists()
+    assert json.loads((tmp_path / "dist" / "manifest.json").read_text()) == manifest
+    # rebuilding unchanged sources produces the same names
+    assert assets.build_assets(tmp_path) == manifest
+
+    monkeypatch.setattr(assets, "STATIC_DIR", tmp_path)
+    monkeypatch.setattr(assets.load_manifest, "__defaults__", (tmp_path,))
+    assert assets.asset_url("styles.css") == f"/static/{manifest['styles.css']}"
+    assert assets.asset_url("missing.css", version="abc") == "/static/missing.css?v=abc"
+
+    app = Starlette(routes=[Mount("/static", app=assets.PrecompressedStaticFiles(directory=str(tmp_path)))])
+    client = TestClient(app)
+    url = f"/static/{manifest['styles.css']}"
+    res = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["cache-control"] == assets.IMMUTABLE_CACHE_CONTROL
+    assert res.headers["content-type"].startswith("text/css")
+    assert res.content == built.read_bytes()  # httpx decoded the gzip body
+    assert int(res.headers["content-length"]) == len(gzip.compress(built.read_bytes(), 9, mtime=0))
+
+    res = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in res.headers
+    assert res.content == built.read_bytes()
+
+    res = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": res.headers["etag"]})
+    assert res.status_code == 200  # the gzip variant has its own validator
+
+    res = client.get("/static/styles.css")
+    assert res.headers["cache-control"] == "no-cache"
@@ -0,0 +1,47 @@
+import threading
+
+from sqlmodel import Session, select
+
+from app import tasks
+from app.database import engine, create_db_and_tables
+from app.models import ConversionJob, Presentation
+
+
+def setup_module(module):
+    create_db_and_tables()
+
+
+def test_enqueue_conversion_uses_local_pool_without_blocking(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fake_convert(presentation_id, filename):
+        calls.append((presentation_id, filename))
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(tasks, "_rq_workers_available", lambda: False)
+    monkeypatch.setattr(tasks, "convert_presentation", fake_convert)
+
+    with Session(engine) as session:
+        p = Presentation(title="Queue Test", filename="queue_test.pptx")
+        session.add(p)
+        session.commit()
+        session.refresh(p)
+        pid = p.id
+
+    try:
+        job_id = tasks.enqueue_conversion(pid, "queue_test.pptx")
+        assert job_id.startswith("local-")
+        assert started.wait(5)
+        # a second request while the first is pending reuses the queued job
+        assert tasks.enqueue_conversion(pid, "queue_test.pptx") == job_id
+        with Session(engine) as session:
+            jobs = session.exec(select(ConversionJob).where(ConversionJob.presentation_id == pid)).all()
+            assert len(jobs) == 1
+            assert jobs[0].job_id == job_id
+    finally:
+        release.set()
+        tasks.shutdown_local_executor(wait=True)
+    assert calls == [(pid, "queue_test.pptx")]
@@ -0,0 +1,109 @@
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app import main
+
+client = TestClient(main.app)
+
+FILENAME = "file_serving_test.bin"
+DATA = bytes(range(256)) * 4
+
+
+def setup_module(module):
+    (Path(main.UPLOAD_DIR) / FILENAME).write_bytes(DATA)
+
+
+def teardown_module(module):
+    (Path(main.UPLOAD_DIR) / FILENAME).unlink(missing_ok=True)
+
+
+def test_download_full_and_conditional():
+    res = client.get(f"/download/{FILENAME}")
+    assert res.status_code == 200
+    assert res.content == DATA
+    assert res.headers["accept-ranges"] == "bytes"
+    assert res.headers["content-disposition"] == f'attachment; filename="{FILENAME}"'
+    etag = res.headers["etag"]
+
+    res = client.get(f"/download/{FILENAME}", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+
+
+def test_download_single_and_multi_range():
+    res = client.get(f"/download/{FILENAME}", headers={"Range": "bytes=10-19"})
+    assert res.status_code == 206
+    assert res.content == DATA[10:20]
+    assert res.headers["content-range"] == f"bytes 10-19/{len(DATA)}"
+
+    res = client.get(f"/download/{FILENAME}", headers={"Range": "bytes=0-1,100-101"})
+    assert res.status_code == 206
+    assert res.headers["content-type"].startswith("multipart/byteranges")
+    assert DATA[100:102] in res.content
+
+    res = client.get(f"/download/{FILENAME}", headers={"Range": f"bytes={len(DATA)}-"})
+    assert res.status_code == 416
+
+
+def test_if_range_mismatch_returns_full_file():
+    res = client.get(f"/download/{FILENAME}", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert res.status_code == 200
+    assert res.content == DATA
+
+    etag = client.head(f"/download/{FILENAME}").headers["etag"]
+    res = client.get(f"/download/{FILENAME}", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert res.status_code == 206
+    assert res.content == DATA[:10]
+
+
+def test_download_offloads_to_nginx_when_proxy_opts_in(monkeypatch):
+    from app import file_serving
+
+    monkeypatch.setattr(file_serving, "ACCEL_REDIRECT_ROOT", main.UPLOAD_DIR)
+    res = client.get(f"/download/{FILENAME}", headers={"X-Sendfile-Type": "X-Accel-Redirect"})
+    assert res.status_code == 200
+    assert res.headers["x-accel-redirect"] == f"/_protected/uploads/{FILENAME}"
+    assert res.headers["content-disposition"] == f'attachment; filename="{FILENAME}"'
+    assert res.content == b""
+
+    # without the proxy header the app streams the file itself
+    res = client.get(f"/download/{FILENAME}")
+    assert "x-accel-redirect" not in res.headers
+    assert res.content == DATA
+
+
+def test_slide_images_stream_as_stored_zip(tmp_path, monkeypatch):
+    import io
+    import zipfile
+
+    from sqlmodel import Session
+    from app.database import engine, create_db_and_tables
+    from app.models import Presentation
+
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    create_db_and_tables()
+    with Session(engine) as session:
+        p = Presentation(title="Zip", filename="zip_test.pdf")
+        session.add(p)
+        session.commit()
+        session.refresh(p)
+        pid = p.id
+    thumbs_dir = tmp_path / "thumbs" / str(pid)
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(3):
+        (thumbs_dir / f"slide_{i}.png").write_bytes(DATA * (i + 1))
+    try:
+        res = client.get(f"/presentations/{pid}/download?kind=images")
+        assert res.status_code == 200
+        assert int(res.headers["content-length"]) == len(res.content)
+        with zipfile.ZipFile(io.BytesIO(res.content)) as zf:
+            assert zf.testzip() is None
+            assert [i.compress_type for i in zf.infolist()] == [zipfile.ZIP_STORED] * 3
+            assert zf.read("slide_2.png") == DATA * 3
+
+        res = client.get(f"/presentations/{pid}/download?kind=images", headers={"If-None-Match": res.headers["etag"]})
+        assert res.status_code == 304
+    finally:
+        with Session(engine) as session:
+            session.delete(session.get(Presentation, pid))
+            session.commit()
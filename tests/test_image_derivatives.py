@@ -0,0 +1,118 @@
+import io
+import shutil
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import images, main, tasks
+
+client = TestClient(main.app, follow_redirects=False)
+
+AVATAR = "avatar_derivative_test.png"
+
+
+def setup_module(module):
+    Image.new("RGB", (300, 200), (200, 40, 40)).save(Path(main.UPLOAD_DIR) / AVATAR)
+
+
+def teardown_module(module):
+    upload_dir = Path(main.UPLOAD_DIR)
+    digest = images.source_hash(upload_dir / AVATAR)
+    for size in images.DERIVATIVE_SIZES["avatar"]:
+        images.derivative_path(upload_dir, digest, "avatar", size).unlink(missing_ok=True)
+    (upload_dir / AVATAR).unlink(missing_ok=True)
+
+
+def test_generate_derivatives_is_content_addressed(tmp_path):
+    Image.new("RGB", (640, 480), (10, 120, 200)).save(tmp_path / "a.jpg")
+    shutil.copy(tmp_path / "a.jpg", tmp_path / "b.jpg")
+
+    out = images.generate_derivatives(tmp_path, "a.jpg", "avatar")
+    assert [Image.open(p).size for p in out] == [(32, 32), (64, 64), (128, 128)]
+    assert all(Image.open(p).format == "WEBP" for p in out)
+    # same bytes under another name reuse the rendered files
+    assert images.generate_derivatives(tmp_path, "b.jpg", "avatar") == out
+
+    chat = images.generate_derivatives(tmp_path, "a.jpg", "chat")
+    assert Image.open(chat[0]).size == (320, 240)
+
+    (tmp_path / "c.svg").write_text("<svg/>")
+    assert images.generate_derivatives(tmp_path, "c.svg", "avatar") == []
+
+
+def test_derivative_route_schedules_then_serves(monkeypatch):
+    queued = []
+    monkeypatch.setattr(main, "enqueue_image_derivatives", lambda rel, kind: queued.append((rel, kind)))
+
+    res = client.get(f"/images/avatar/64/{AVATAR}")
+    assert res.status_code == 302
+    assert res.headers["location"] == f"/media/{AVATAR}"
+    assert queued == [(AVATAR, "avatar")]
+
+    tasks.generate_image_derivatives(AVATAR, "avatar")
+    url = main.avatar_url(AVATAR, 40)
+    assert url.startswith(f"/images/avatar/64/{AVATAR}?v=")
+    res = client.get(url)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "image/webp"
+    assert "immutable" in res.headers["cache-control"]
+    assert Image.open(io.BytesIO(res.content)).size == (64, 64)
+
+    assert client.get(f"/images/avatar/48/{AVATAR}").status_code == 404
+
+
+def test_chat_attachments_with_the_same_name_do_not_overwrite(tmp_path, monkeypatch):
+    from starlette.datastructures import UploadFile
+    from sqlmodel import Session, select
+    from app.database import engine
+    from app.models import Artifact
+
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path))
+    urls = [main._save_chat_upload(42, UploadFile(io.BytesIO(body), filename="notes v2.txt"))[0]
+            for body in (b"first", b"second")]
+    try:
+        assert urls[0] != urls[1]
+        assert all(url.endswith("?name=notes%20v2.txt") for url in urls)
+        stored = [tmp_path / url[len("/uploads/"):].split("?", 1)[0] for url in urls]
+        assert [p.read_bytes() for p in stored] == [b"first", b"second"]
+    finally:
+        with Session(engine) as session:
+            for row in session.exec(select(Artifact).where(Artifact.key.startswith("chat/42/"))).all():
+                session.delete(row)
+            session.commit()
+
+
+def test_profile_refuses_svg_and_oversized_avatars(tmp_path, monkeypatch):
+    from sqlmodel import Session
+    from app.auth import create_access_token
+    from app.database import create_db_and_tables, engine
+    from app.models import User
+
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "AVATAR_MAX_BYTES", 1024)
+    errors = []
+    monkeypatch.setattr(main.templates, "TemplateResponse",
+                        lambda name, ctx: errors.append(ctx.get("error")) or main.HTMLResponse(""))
+    create_db_and_tables()
+    with Session(engine) as session:
+        user = User(username="avatar_guard", email="avatar_guard@example.com", hashed_password="x")
+        session.add(user)
+        session.commit()
+        uid = user.id
+    client.cookies.set("access_token", f"Bearer {create_access_token({'sub': 'avatar_guard'})}")
+    try:
+        svg = ("a.svg", b"<svg onload='alert(1)'/>", "image/svg+xml")
+        client.post("/me/edit", files={"avatar": svg})
+        big = ("a.png", b"\0" * 2048, "image/png")
+        client.post("/me/edit", files={"avatar": big})
+        assert errors == ["Unsupported avatar type", "Avatar is too large"]
+        assert list(tmp_path.iterdir()) == []
+        with Session(engine) as session:
+            assert session.get(User, uid).avatar is None
+    finally:
+        client.cookies.clear()
+        with Session(engine) as session:
+            session.delete(session.get(User, uid))
+            session.commit()
@@ -0,0 +1,43 @@
+import hashlib
+
+import fitz
+
+from app.ingest import UploadIngest, UploadTooLarge, content_matches_extension, sniff_mimetype
+
+
+def test_sniff_mimetype_from_magic_bytes():
+    assert sniff_mimetype(b"%PDF-1.7\n...") == "application/pdf"
+    assert sniff_mimetype(b"PK\x03\x04....[Content_Types].xml...ppt/slides/slide1.xml", "a.pptx").endswith("presentationml.presentation")
+    assert sniff_mimetype(b"\x00\x00\x00\x18ftypisom\x00\x00") == "video/mp4"
+    assert sniff_mimetype(b"\x00\x00\x00\x14ftypqt  ") == "video/quicktime"
+    assert sniff_mimetype(b"\x1a\x45\xdf\xa3\x01") == "video/webm"
+    assert sniff_mimetype(b"MZ\x90\x00") is None
+    assert not content_matches_extension(sniff_mimetype(b"MZ\x90\x00"), "slides.pdf")
+
+
+def test_ingest_hashes_counts_and_extracts_in_one_pass(tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Ingested lecture")
+    data = doc.tobytes()
+    doc.close()
+
+    ingest = UploadIngest(tmp_path / "a.pdf", "a.pdf", max_bytes=len(data))
+    for i in range(0, len(data), 100):
+        ingest.feed(data[i:i + 100])
+    result = ingest.finish()
+    assert result.size == len(data)
+    assert result.sha256 == hashlib.sha256(data).hexdigest()
+    assert result.mimetype == "application/pdf"
+    assert "Ingested lecture" in result.sample_text
+    assert (tmp_path / "a.pdf").read_bytes() == data
+
+
+def test_ingest_enforces_size_limit_and_cleans_up(tmp_path):
+    ingest = UploadIngest(tmp_path / "big.pdf", "big.pdf", max_bytes=10)
+    try:
+        ingest.feed(b"%PDF-" + b"x" * 20)
+    except UploadTooLarge:
+        pass
+    else:
+        raise AssertionError("expected UploadTooLarge")
+    assert not (tmp_path / "big.pdf").exists()
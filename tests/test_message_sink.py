@@ -0,0 +1,75 @@
+import asyncio
+
+from sqlmodel import Session, select
+
+from app.database import create_db_and_tables, engine
+from app.message_sink import MessageSink
+from app.models import Message, Notification, User
+
+
+def _users():
+    create_db_and_tables()
+    with Session(engine) as session:
+        users = [User(username=f"sink_user_{i}", email=f"sink_user_{i}@example.com", hashed_password="x") for i in range(2)]
+        session.add_all(users)
+        session.commit()
+        return [u.id for u in users]
+
+
+def _cleanup(user_ids):
+    with Session(engine) as session:
+        for model, column in ((Notification, Notification.actor_id), (Message, Message.sender_id)):
+            for row in session.exec(select(model).where(column.in_(user_ids))).all():
+                session.delete(row)
+        for uid in user_ids:
+            session.delete(session.get(User, uid))
+        session.commit()
+
+
+def test_concurrent_writes_share_one_transaction():
+    a, b = _users()
+    try:
+        sink = MessageSink(interval_ms=20)
+
+        async def scenario():
+            writes = []
+            for i in range(5):
+                note = Notification(recipient_id=b, actor_id=a, verb="message", target_type="message")
+                writes.append(sink.write(Message(sender_id=a, recipient_id=b, content=f"m{i}"), notifications=[note]))
+            rows = await asyncio.gather(*writes)
+            await sink.close()
+            return rows
+
+        rows = asyncio.run(scenario())
+        assert sink.batches == 1
+        ids = [row.id for row in rows]
+        assert all(ids) and ids == sorted(ids)
+        with Session(engine) as session:
+            notes = session.exec(select(Notification).where(Notification.actor_id == a)).all()
+            assert sorted(n.target_id for n in notes) == ids
+            assert [m.content for m in session.exec(select(Message).where(Message.sender_id == a).order_by(Message.id))] == [f"m{i}" for i in range(5)]
+    finally:
+        _cleanup([a, b])
+
+
+def test_bad_row_fails_alone():
+    a, b = _users()
+    try:
+        sink = MessageSink(interval_ms=20)
+
+        async def scenario():
+            results = await asyncio.gather(
+                sink.write(Message(sender_id=a, recipient_id=b, content="ok")),
+                sink.write(Message(sender_id=a, recipient_id=b, content=None)),
+                return_exceptions=True,
+            )
+            await sink.close()
+            return results
+
+        good, bad = asyncio.run(scenario())
+        assert good.id is not None and good.content == "ok"
+        assert isinstance(bad, Exception)
+        with Session(engine) as session:
+            assert len(session.exec(select(Message).where(Message.sender_id == a)).all()) == 1
+    finally:
+        _cleanup([a, b])
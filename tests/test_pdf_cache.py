@@ -0,0 +1,61 @@
+import os
+
+import fitz
+
+from app.pdf_cache import PdfDocumentCache
+
+
+def make_pdf(path, text):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), text)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def test_reuses_open_document_until_file_changes(tmp_path):
+    cache = PdfDocumentCache(max_docs=4, max_bytes=10 * 1024 * 1024)
+    pdf = make_pdf(tmp_path / "a.pdf", "first")
+
+    with cache.open(pdf) as doc:
+        first = doc
+        assert "first" in doc[0].get_text()
+    with cache.open(pdf) as doc:
+        assert doc is first
+    assert cache.stats()["documents"] == 1
+
+    make_pdf(pdf, "second")
+    st = os.stat(pdf)
+    os.utime(pdf, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    with cache.open(pdf) as doc:
+        assert doc is not first
+        assert "second" in doc[0].get_text()
+    assert first.is_closed
+    assert cache.stats()["documents"] == 1
+
+
+def test_evicts_least_recently_used_and_invalidate(tmp_path):
+    cache = PdfDocumentCache(max_docs=2, max_bytes=10 * 1024 * 1024)
+    paths = [make_pdf(tmp_path / f"{i}.pdf", str(i)) for i in range(3)]
+    docs = []
+    for p in paths:
+        with cache.open(p) as doc:
+            docs.append(doc)
+    assert cache.stats()["documents"] == 2
+    assert docs[0].is_closed and not docs[2].is_closed
+
+    cache.invalidate(paths[2])
+    assert docs[2].is_closed
+    assert cache.stats()["documents"] == 1
+
+
+def test_document_evicted_while_borrowed_closes_on_release(tmp_path):
+    cache = PdfDocumentCache(max_docs=1, max_bytes=10 * 1024 * 1024)
+    a = make_pdf(tmp_path / "a.pdf", "a")
+    b = make_pdf(tmp_path / "b.pdf", "b")
+    with cache.open(a) as doc_a:
+        with cache.open(b):
+            pass
+        assert not doc_a.is_closed
+    assert doc_a.is_closed
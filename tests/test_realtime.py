@@ -0,0 +1,374 @@
+import json
+import time
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from app.realtime import Heartbeat, LoopLagMonitor, MemoryBus, Outbox, RoomHub, WebSocketManager, percentile, set_bus
+
+
+class FakeSocket:
+    def __init__(self, fail=False, gate=None):
+        self.client_state = WebSocketState.CONNECTING
+        self.application_state = WebSocketState.CONNECTED
+        self.inbox = asyncio.Queue()
+        self.sent = []
+        self.fail = fail
+        self.gate = gate
+        self.close_code = None
+
+    async def accept(self, subprotocol=None):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def send_json(self, payload):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("closed")
+        self.sent.append(payload)
+
+    async def receive(self):
+        return {"type": "websocket.receive", "text": json.dumps(await self.inbox.get())}
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+async def _drain():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_personal_messages_and_presence_cross_workers():
+    async def scenario():
+        bus = MemoryBus()
+        worker_a, worker_b = WebSocketManager(bus), WebSocketManager(bus)
+        alice, bob = FakeSocket(), FakeSocket()
+        await worker_a.connect(1, alice)
+        await worker_b.connect(2, bob)
+        assert alice.client_state == WebSocketState.CONNECTED
+
+        # sent through worker A, delivered by worker B
+        await worker_a.send_personal(2, {"type": "message", "content": "hi"})
+        assert bob.sent == [{"type": "message", "content": "hi"}]
+
+        assert await worker_a.online([1, 2, 3]) == {1, 2}
+        assert not worker_a.is_online(2)
+
+        await worker_b.disconnect(2, bob)
+        assert await worker_a.online([2]) == set()
+        await worker_a.send_personal(2, {"type": "message"})
+        assert len(bob.sent) == 1
+
+    asyncio.run(scenario())
+
+
+def test_room_hub_fans_out_across_workers_and_drops_dead_sockets():
+    async def scenario():
+        bus = MemoryBus()
+        hub_a, hub_b = RoomHub("space", bus), RoomHub("space", bus)
+        ws1, ws2, dead = FakeSocket(), FakeSocket(), FakeSocket(fail=True)
+        await hub_a.join(7, ws1)
+        await hub_b.join(7, ws2)
+        await hub_b.join(7, dead)
+
+        await hub_a.broadcast(7, {"type": "message", "id": 1})
+        await _drain()
+        assert ws1.sent == ws2.sent == [{"type": "message", "id": 1}]
+        assert dead not in hub_b.local(7)
+
+        await hub_b.leave(7, ws2)
+        assert bus.has_subscribers("space:7")  # hub_a still listens
+        await hub_a.broadcast(7, {"type": "message", "id": 2})
+        await _drain()
+        assert len(ws2.sent) == 1 and len(ws1.sent) == 2
+
+    asyncio.run(scenario())
+
+
+def test_slow_member_does_not_stall_room_and_typing_skips_sender():
+    async def scenario():
+        hub = RoomHub("space", MemoryBus())
+        gate = asyncio.Event()
+        fast, slow, sender = FakeSocket(), FakeSocket(gate=gate), FakeSocket()
+        await hub.join(1, fast, user_id=1)
+        await hub.join(1, slow, user_id=2)
+        await hub.join(1, sender, user_id=3)
+
+        await hub.broadcast(1, {"type": "message", "id": 1})
+        for status in ("start", "stop", "start"):
+            await hub.broadcast(1, {"type": "typing", "user_id": 3, "status": status}, exclude_user_id=3)
+        await _drain()
+        assert fast.sent == [{"type": "message", "id": 1}, {"type": "typing", "user_id": 3, "status": "start"}]
+        assert sender.sent == [{"type": "message", "id": 1}]
+        assert slow.sent == []
+
+        gate.set()
+        await _drain()
+        # queued typing updates from one user collapse into the latest
+        assert slow.sent == [{"type": "message", "id": 1}, {"type": "typing", "user_id": 3, "status": "start"}]
+
+    asyncio.run(scenario())
+
+
+def test_outbox_drops_ephemeral_then_disconnects_lagging_client():
+    async def scenario():
+        hub = RoomHub("space", MemoryBus())
+        ws = FakeSocket(gate=asyncio.Event())
+        outbox = await hub.join(1, ws, user_id=1)
+        outbox.max_size, outbox.ephemeral_max = 4, 2
+        outbox.offer({"type": "message", "id": 0})
+        await _drain()  # the writer is now blocked sending it
+
+        for i in (1, 2):
+            assert outbox.offer({"type": "message", "id": i})
+        assert outbox.offer({"type": "seen", "user_id": 9, "message_id": 1})
+        assert outbox.dropped == 1 and len(outbox) == 2
+
+        assert outbox.offer({"type": "message", "id": 3})
+        assert outbox.offer({"type": "message", "id": 4})
+        assert not outbox.offer({"type": "message", "id": 5})
+        await _drain()
+        assert ws.close_code == 1013
+        assert ws not in hub.local(1)
+
+    asyncio.run(scenario())
+
+
+def test_outbox_stops_on_send_failure():
+    async def scenario():
+        closed = []
+
+        async def on_close(box):
+            closed.append(box)
+
+        outbox = Outbox(FakeSocket(fail=True), on_close=on_close).start()
+        outbox.offer({"type": "message"})
+        await _drain()
+        assert outbox.closed and closed == [outbox]
+
+    asyncio.run(scenario())
+
+
+def test_presence_is_scoped_debounced_and_batched():
+    async def scenario():
+        bus = MemoryBus()
+        # 1 and 2 know each other; 3 only cares about 1; 4 is unrelated
+        graph = {1: {2, 3}, 2: {1}, 3: {1}, 4: set(), 5: {2}}
+        worker_a = WebSocketManager(bus, audience=lambda uid: graph[uid])
+        worker_b = WebSocketManager(bus, audience=lambda uid: graph[uid])
+        for manager in (worker_a, worker_b):
+            manager.presence_interval = 3600  # flushed by hand below
+        sockets = {uid: FakeSocket() for uid in (1, 2, 3, 4)}
+        await worker_a.connect(1, sockets[1])
+        await worker_b.connect(2, sockets[2])
+        await worker_b.connect(3, sockets[3])
+        await worker_b.connect(4, sockets[4])
+        await worker_a.flush_presence()
+        await worker_b.flush_presence()
+        assert sockets[2].sent == [{"type": "presence", "changes": {"1": True}}]
+        assert sockets[3].sent == [{"type": "presence", "changes": {"1": True}}]
+        assert sockets[1].sent == [{"type": "presence", "changes": {"2": True, "3": True}}]
+        assert sockets[4].sent == []
+
+        # a tab that reconnects before the flush produces nothing
+        await worker_a.disconnect(1, sockets[1])
+        await worker_a.connect(1, FakeSocket())
+        assert await worker_a.flush_presence() == {}
+
+        # several changes reach a recipient as one diff; offline users get nothing
+        await worker_b.disconnect(3, sockets[3])
+        await worker_b.disconnect(2, sockets[2])
+        await worker_b.connect(5, FakeSocket())
+        diffs = await worker_b.flush_presence()
+        assert diffs == {1: {"2": False, "3": False}}
+
+    asyncio.run(scenario())
+
+
+def test_presence_diff_is_against_what_any_worker_announced():
+    async def scenario():
+        bus = MemoryBus()
+        graph = {1: {2}, 2: {1}}
+        worker_a = WebSocketManager(bus, audience=lambda uid: graph[uid])
+        worker_b = WebSocketManager(bus, audience=lambda uid: graph[uid])
+        for manager in (worker_a, worker_b):
+            manager.presence_interval = 3600
+        watcher = FakeSocket()
+        await worker_b.connect(2, watcher)
+        await worker_b.flush_presence()
+        on_a, on_b = FakeSocket(), FakeSocket()
+        await worker_a.connect(1, on_a)
+        await worker_b.connect(1, on_b)
+        assert await worker_a.flush_presence() == {2: {"1": True}}
+        assert await worker_b.flush_presence() == {}
+
+        await worker_a.disconnect(1, on_a)
+        await worker_b.disconnect(1, on_b)
+        assert await worker_a.flush_presence() == {2: {"1": False}}
+        assert await worker_b.flush_presence() == {}
+
+        # back on the worker that last saw them online
+        await worker_a.connect(1, FakeSocket())
+        assert await worker_a.flush_presence() == {2: {"1": True}}
+
+    asyncio.run(scenario())
+
+
+def test_bulk_online_endpoint(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    client = TestClient(main.app)
+    assert client.get("/api/online?ids=1,2,3").status_code == 401
+
+    async def online(ids):
+        return set(ids)
+
+    monkeypatch.setattr(main.manager, "online", online)
+    monkeypatch.setattr(main, "_presence_audience", lambda uid: {2, 3})
+    main.app.dependency_overrides[main.get_current_user] = lambda: main.User(id=1, username="viewer")
+    try:
+        # 4 is not in user 1's audience, so its presence is not disclosed
+        assert client.get("/api/online?ids=1,2,4").json() == {"online": [1, 2]}
+        assert client.get("/api/online").json() == {"online": []}
+        assert client.get("/api/online?ids=1,x").status_code == 400
+        assert client.get("/api/online?ids=" + ",".join(map(str, range(501)))).status_code == 400
+    finally:
+        main.app.dependency_overrides.pop(main.get_current_user, None)
+
+
+def test_room_replay_ring_survives_brief_reconnect():
+    async def scenario():
+        hub = RoomHub("space", MemoryBus())
+        ws = FakeSocket()
+        await hub.join(4, ws, user_id=1)
+        assert hub.replay(4, 0) is None  # nothing seen yet: caller falls back to the db
+        for seq in (10, 12, 15):
+            await hub.broadcast(4, {"type": "message", "seq": seq})
+        await hub.broadcast(4, {"type": "typing", "user_id": 2})
+
+        await hub.leave(4, ws)  # still subscribed for the grace period
+        await hub.broadcast(4, {"type": "message", "seq": 16})
+        assert [p["seq"] for p in hub.replay(4, 12)] == [15, 16]
+        assert hub.replay(4, 16) == []
+        assert hub.replay(4, 9) is None  # the gap before the ring is unknown
+
+        outbox = await hub.join(4, ws, user_id=1, paused=True)
+        await hub.broadcast(4, {"type": "message", "seq": 17})
+        await _drain()
+        assert {"type": "message", "seq": 17} not in ws.sent  # held until start()
+        assert len(outbox) == 1
+        outbox.start()
+        await _drain()
+        assert ws.sent[-1] == {"type": "message", "seq": 17}
+
+        hub.grace = 0
+        await hub.leave(4, ws)
+        assert hub.replay(4, 12) is None
+
+    asyncio.run(scenario())
+
+
+def test_loop_lag_monitor_sees_blocking_work():
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.05)  # blocks the loop
+        await asyncio.sleep(0.03)
+        monitor.stop()
+        return monitor.snapshot()
+
+    snap = asyncio.run(scenario())
+    assert snap["samples"] >= 2
+    assert snap["max_ms"] >= 40
+    assert percentile([1, 2, 3, 4], 50) in (2, 3) and percentile([], 99) == 0.0
+
+
+def test_realtime_stats_requires_token(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    client = TestClient(main.app)
+    assert client.get("/api/realtime/stats").status_code == 404
+    monkeypatch.setattr(main, "REALTIME_STATS_TOKEN", "t0ken")
+    assert client.get("/api/realtime/stats", headers={"X-Stats-Token": "nope"}).status_code == 404
+    body = client.get("/api/realtime/stats", headers={"X-Stats-Token": "t0ken"}).json()
+    assert body["spaces"]["sockets"] == 0 and body["rss_bytes"] > 0
+    assert set(body["loop_lag"]) == {"samples", "p50_ms", "p99_ms", "max_ms"}
+
+
+def test_heartbeat_pings_swallows_pongs_and_closes_idle_sockets():
+    async def scenario():
+        ws = FakeSocket()
+        heartbeat = Heartbeat(ws, ping_interval=0.01, idle_timeout=0.05).start()
+        ws.inbox.put_nowait({"type": "pong"})
+        ws.inbox.put_nowait({"type": "message", "content": "hi"})
+        assert await heartbeat.receive_json() == {"type": "message", "content": "hi"}
+        with pytest.raises(WebSocketDisconnect):
+            await heartbeat.receive_json()
+        heartbeat.stop()
+        return ws
+
+    ws = asyncio.run(scenario())
+    assert ws.close_code == 1001
+    assert {"type": "ping", "event": "ping"} in ws.sent
+
+
+def test_sweeps_drop_sockets_handlers_left_behind():
+    async def scenario():
+        bus = MemoryBus()
+        manager, hub = WebSocketManager(bus), RoomHub("space", bus)
+        live, dead = FakeSocket(), FakeSocket()
+        await manager.connect(1, live)
+        await manager.connect(2, dead)
+        await hub.join(3, live, user_id=1)
+        await hub.join(3, dead, user_id=2)
+        dead.client_state = WebSocketState.DISCONNECTED
+        assert await manager.sweep() == 1 and await hub.sweep() == 1
+        assert await manager.online([1, 2]) == {1}
+        assert hub.local(3) == {live}
+        assert await manager.sweep() == 0
+
+    asyncio.run(scenario())
+
+
+def test_meeting_ends_when_host_is_gone(monkeypatch):
+    from app import main
+
+    async def scenario():
+        set_bus(MemoryBus())
+        try:
+            host, guest = FakeSocket(), FakeSocket()
+            await main.video_state.register_socket(1, host)
+            await main.video_state.register_socket(2, guest)
+            await main.video_state.start_meeting(5, 1)
+            for uid in (1, 2):
+                await main.video_state.join_room(uid, 5)
+
+            monkeypatch.setattr(main, "VIDEO_HOST_GRACE_SECONDS", 0)
+            assert (await main.sweep_realtime())["meetings_ended"] == 0  # host still connected
+
+            # the host's socket died without its handler cleaning up
+            host.client_state = WebSocketState.DISCONNECTED
+            swept = await main.sweep_realtime()
+            assert swept["video"] == 1
+            assert not await main.video_state.is_meeting_active(5)
+            assert {"event": "meeting-ended", "payload": {"space_id": 5}} in guest.sent
+
+            # a meeting whose host is on no worker at all is ended by the grace check
+            await main.video_state.start_meeting(6, 9)
+            await main.video_state.join_room(2, 6)
+            time.sleep(0.01)
+            assert (await main.sweep_realtime())["meetings_ended"] == 1
+            assert await main.video_state.room_users(6) == set()
+            await main.video_state.unregister_socket(guest)
+        finally:
+            set_bus(None)
+
+    asyncio.run(scenario())
@@ -0,0 +1,119 @@
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import main, resumable
+from app.auth import create_access_token, get_password_hash
+from app.database import create_db_and_tables, engine
+from app.models import Artifact, Presentation, User
+
+client = TestClient(main.app)
+
+
+def setup_module(module):
+    create_db_and_tables()
+    with Session(engine) as session:
+        if not session.exec(select(User).where(User.username == "resumable_user")).first():
+            session.add(User(username="resumable_user", email="resumable@example.com", hashed_password=get_password_hash("x")))
+            session.commit()
+
+
+def auth():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'resumable_user'})}"}
+
+
+@pytest.fixture
+def uploads(monkeypatch, tmp_path):
+    """Stage into tmp_path and land finished files in tmp_path/uploads.
+
+    Creating a presentation clears thumbs/<id>, so the real UPLOAD_DIR must
+    stay out of reach; conversion is not part of what these tests cover.
+    """
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(resumable, "UPLOAD_STAGING_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(upload_dir))
+    monkeypatch.setenv("UPLOAD_DIR", str(upload_dir))
+    monkeypatch.setattr(main, "enqueue_conversion", lambda *a, **k: None)
+    return upload_dir
+
+
+def metadata(**values):
+    return ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in values.items())
+
+
+def test_parallel_chunks_resume_and_create_presentation(uploads, monkeypatch, tmp_path):
+    monkeypatch.setattr(resumable, "RESUMABLE_CHUNK_SIZE", 1024)
+    import fitz
+
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "resumable " * 200)
+    data = doc.tobytes(garbage=0, deflate=False) + b"%" + b"pad" * 700 + b"\n"
+    doc.close()
+    assert 2048 < len(data)  # chunks at 0, 1024, 2048
+
+    res = client.post("/api/uploads/resumable", headers={
+        **auth(),
+        "Upload-Length": str(len(data)),
+        "Upload-Metadata": metadata(filename="lecture.pdf", title="Resumable lecture", description="Uploaded in several chunks"),
+    })
+    assert res.status_code == 201
+    location = res.headers["location"]
+    assert res.headers["upload-offset"] == "0"
+
+    # a later chunk may arrive first; the contiguous offset does not move
+    res = client.patch(location, content=data[1024:2048], headers={**auth(), "Upload-Offset": "1024"})
+    assert res.status_code == 204
+    assert res.headers["upload-offset"] == "0"
+
+    # misaligned, non-sequential offsets are rejected
+    res = client.patch(location, content=b"x", headers={**auth(), "Upload-Offset": "7"})
+    assert res.status_code == 409
+
+    res = client.patch(location, content=data[:1024], headers={**auth(), "Upload-Offset": "0"})
+    assert res.headers["upload-offset"] == "2048"
+
+    res = client.head(location, headers=auth())
+    assert res.headers["upload-offset"] == "2048"
+    assert res.headers["upload-received"] == "0-2048"
+
+    res = client.patch(location, content=data[2048:], headers={**auth(), "Upload-Offset": "2048"})
+    assert res.status_code == 200
+    pid = res.json()["id"]
+    with Session(engine) as session:
+        p = session.get(Presentation, pid)
+        assert p.title == "Resumable lecture"
+        assert p.file_size == len(data)
+        assert p.mimetype == "application/pdf"
+        saved = uploads / p.filename
+    try:
+        assert saved.read_bytes() == data
+        assert not list(tmp_path.glob("*.part"))
+        assert client.patch(location, content=b"x", headers={**auth(), "Upload-Offset": "0"}).status_code == 409
+    finally:
+        with Session(engine) as session:
+            for row in session.exec(select(Artifact).where(Artifact.presentation_id == pid)).all():
+                session.delete(row)
+            session.delete(session.get(Presentation, pid))
+            session.commit()
+
+
+def test_rejects_unsupported_type_and_missing_length():
+    assert client.post("/api/uploads/resumable", headers={**auth(), "Upload-Metadata": metadata(filename="a.pdf")}).status_code == 400
+    res = client.post("/api/uploads/resumable", headers={**auth(), "Upload-Length": "10", "Upload-Metadata": metadata(filename="a.exe")})
+    assert res.status_code == 400
+
+
+def test_content_not_matching_extension_is_415(uploads, tmp_path):
+    data = b"not a pdf at all" * 8
+    res = client.post("/api/uploads/resumable", headers={
+        **auth(), "Upload-Length": str(len(data)), "Upload-Metadata": metadata(filename="fake.pdf")})
+    location = res.headers["location"]
+    res = client.patch(location, content=data, headers={**auth(), "Upload-Offset": "0"})
+    assert res.status_code == 415
+    assert res.json()["detail"] == "File content does not match its type"
+    # the session is spent and nothing was kept in UPLOAD_DIR or staging
+    assert client.patch(location, content=b"x", headers={**auth(), "Upload-Offset": "0"}).status_code == 409
+    assert not list(tmp_path.glob("*.part")) and not list(uploads.iterdir())
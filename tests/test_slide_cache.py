@@ -0,0 +1,93 @@
+import shutil
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.convert import write_thumbnail_manifest
+
+client = TestClient(main.app)
+
+PRESENTATION_ID = 987654
+
+
+def setup_module(module):
+    thumbs_dir = Path(main.UPLOAD_DIR) / "thumbs" / str(PRESENTATION_ID)
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    (thumbs_dir / "slide_0.png").write_bytes(b"\x89PNG\r\n\x1a\nslide-zero")
+    write_thumbnail_manifest(str(thumbs_dir))
+
+
+def teardown_module(module):
+    shutil.rmtree(Path(main.UPLOAD_DIR) / "thumbs" / str(PRESENTATION_ID), ignore_errors=True)
+
+
+def test_versioned_slide_url_is_immutable_with_strong_etag():
+    url = main.slide_url(PRESENTATION_ID, 0)
+    assert "?v=" in url
+    version = url.split("?v=", 1)[1]
+
+    res = client.get(url)
+    assert res.status_code == 200
+    assert res.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert res.headers["etag"] == f'"{version}"'
+
+    res = client.get(url, headers={"If-None-Match": f'"{version}"'})
+    assert res.status_code == 304
+    assert res.content == b""
+
+
+def test_unversioned_slide_url_revalidates():
+    res = client.get(f"/presentations/{PRESENTATION_ID}/slide/0")
+    assert res.status_code == 200
+    assert "must-revalidate" in res.headers["cache-control"]
+    assert res.headers["etag"]
+
+
+def test_hd_fallback_to_standard_slide_is_not_immutable():
+    url = main.slide_url(PRESENTATION_ID, 0)
+    res = client.get(url + "&hd=1&quality=2")
+    assert res.status_code == 200
+    assert res.content.endswith(b"slide-zero")
+    assert "must-revalidate" in res.headers["cache-control"]
+
+
+def test_deep_zoom_tiles_render_lazily_and_cache(tmp_path, monkeypatch):
+    import fitz
+    from sqlmodel import Session
+    from app.database import engine, create_db_and_tables
+    from app.models import Presentation
+
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    create_db_and_tables()
+    pdf_name = f"tiles_test_{PRESENTATION_ID}.pdf"
+    pdf_path = tmp_path / pdf_name
+    doc = fitz.open()
+    doc.new_page(width=200, height=100).insert_text((20, 50), "tiles")
+    doc.save(str(pdf_path))
+    doc.close()
+    with Session(engine) as session:
+        p = Presentation(title="Tiles", filename=pdf_name)
+        session.add(p)
+        session.commit()
+        session.refresh(p)
+        pid = p.id
+    try:
+        res = client.get(f"/presentations/{pid}/slide/0/tiles.dzi")
+        assert res.status_code == 200
+        assert 'TileSize="512"' in res.text
+        assert 'Width="2400" Height="1200"' in res.text
+
+        # level 0 is a single pixel; the top level is split into 512px tiles
+        res = client.get(f"/presentations/{pid}/slide/0/tiles_files/12/4_2.png")
+        assert res.status_code == 200
+        tile = fitz.Pixmap(res.content)
+        assert (tile.width, tile.height) == (2400 - 4 * 512, 1200 - 2 * 512)
+        assert (main._tiles_dir(pid, 0) / "12" / "4_2.png").exists()
+
+        assert client.get(f"/presentations/{pid}/slide/0/tiles_files/12/5_0.png").status_code == 404
+        assert client.get(f"/presentations/{pid}/slide/0/tiles_files/13/0_0.png").status_code == 404
+    finally:
+        with Session(engine) as session:
+            session.delete(session.get(Presentation, pid))
+            session.commit()
@@ -0,0 +1,137 @@
+import io
+from datetime import datetime, timezone
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app import main, storage
+from app.storage import LocalStorage, S3Storage
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the S3 API the storage driver uses."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None, Config=None):
+        self.objects[(bucket, key)] = (Path(filename).read_bytes(), (ExtraArgs or {}).get("ContentType"))
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise KeyError(Key)
+        data, _ = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "LastModified": datetime.now(timezone.utc), "ETag": '"abc"'}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data, _ = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        return f"https://storage.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def test_s3_driver_round_trip(tmp_path):
+    client = FakeS3Client()
+    s3 = S3Storage("bucket", prefix="uploads", client=client)
+    src = tmp_path / "deck.pdf"
+    src.write_bytes(b"%PDF-1.4 0123456789")
+
+    s3.put_file(src, "deck.pdf", content_type="application/pdf")
+    assert ("bucket", "uploads/deck.pdf") in client.objects
+    assert s3.stat("deck.pdf").size == src.stat().st_size
+    assert s3.read_range("deck.pdf", 9, 12) == b"0123"
+    assert s3.presign("deck.pdf", expires=60).startswith("https://storage.test/bucket/uploads/deck.pdf")
+    assert s3.fetch_to("deck.pdf", tmp_path / "copy.pdf")
+    assert (tmp_path / "copy.pdf").read_bytes() == src.read_bytes()
+    assert s3.delete("deck.pdf") and s3.stat("deck.pdf") is None
+
+
+def test_local_driver_rejects_escaping_keys(tmp_path):
+    local = LocalStorage(tmp_path)
+    (tmp_path / "a.txt").write_bytes(b"hello")
+    assert local.read_range("a.txt", 1, 3) == b"ell"
+    assert local.stat("../a.txt") is None
+
+
+def test_download_redirects_to_presigned_url_for_remote_objects(tmp_path):
+    client = FakeS3Client()
+    src = tmp_path / "remote_only.pdf"
+    src.write_bytes(b"%PDF-1.4 remote")
+    s3 = S3Storage("bucket", client=client)
+    s3.put_file(src, "remote_only.pdf")
+    storage.set_storage(s3)
+    try:
+        res = TestClient(main.app).get("/download/remote_only.pdf", follow_redirects=False)
+        assert res.status_code == 302
+        assert res.headers["location"].startswith("https://storage.test/bucket/remote_only.pdf")
+        assert not (Path(main.UPLOAD_DIR) / "remote_only.pdf").exists()
+    finally:
+        storage.set_storage(None)
+
+
+def test_put_many_retries_and_reports_each_artifact(tmp_path):
+    client = FakeS3Client()
+    calls = {}
+    real_upload = client.upload_file
+
+    def flaky_upload(filename, bucket, key, ExtraArgs=None, Config=None):
+        calls[key] = calls.get(key, 0) + 1
+        if key.endswith("segment_001.ts") and calls[key] == 1:
+            raise ConnectionError("reset")
+        if key.endswith("segment_002.ts"):
+            raise ConnectionError("down")
+        real_upload(filename, bucket, key, ExtraArgs=ExtraArgs, Config=Config)
+
+    client.upload_file = flaky_upload
+    files = []
+    for name in ("master.m3u8", "segment_000.ts", "segment_001.ts", "segment_002.ts"):
+        (tmp_path / name).write_bytes(name.encode())
+        files.append((tmp_path / name, f"hls/{name}"))
+
+    report = storage.put_many(S3Storage("bucket", client=client), files, max_workers=4, retries=3, backoff=0)
+
+    assert report["hls/master.m3u8"]["ok"]
+    assert report["hls/segment_001.ts"] == {"ok": True, "attempts": 2, "bytes": len(b"segment_001.ts"), "error": None}
+    assert not report["hls/segment_002.ts"]["ok"] and report["hls/segment_002.ts"]["attempts"] == 3
+    assert client.objects[("bucket", "hls/master.m3u8")][1] == "application/vnd.apple.mpegurl"
+
+
+def test_video_artifacts_use_the_storage_key_layout(tmp_path):
+    from app.tasks import publish_video_artifacts
+
+    client = FakeS3Client()
+    s3 = S3Storage("bucket", prefix="site", client=client)
+    variant = tmp_path / "hls" / "7" / "720p"
+    variant.mkdir(parents=True)
+    (variant / "index.m3u8").write_text("#EXTM3U")
+    (variant / "seg0.ts").write_bytes(b"ts")
+    master = tmp_path / "hls" / "7" / "master.m3u8"
+    master.write_text("#EXTM3U")
+    mp4 = tmp_path / "7_web.mp4"
+    mp4.write_bytes(b"mp4")
+
+    result, report = publish_video_artifacts(s3, tmp_path, str(master), mp4)
+    assert result == "s3://bucket/site/hls/7/master.m3u8"
+    assert sorted(report) == ["7_web.mp4", "hls/7/720p/index.m3u8", "hls/7/720p/seg0.ts", "hls/7/master.m3u8"]
+    assert ("bucket", "site/hls/7/720p/seg0.ts") in client.objects
+    assert publish_video_artifacts(s3, tmp_path, None, mp4)[0] == "s3://bucket/site/7_web.mp4"
+
+
+def test_artifacts_still_go_to_a_bare_s3_bucket(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "_storage", LocalStorage(tmp_path))
+    monkeypatch.delenv("S3_BUCKET", raising=False)
+    monkeypatch.delenv("AWS_S3_BUCKET", raising=False)
+    assert storage.artifact_storage() is None
+
+    monkeypatch.setenv("S3_BUCKET", "media")
+    monkeypatch.setenv("S3_PREFIX", "site")
+    monkeypatch.setattr(storage, "s3_client", lambda: FakeS3Client())
+    target = storage.artifact_storage()
+    assert target.bucket == "media" and target.object_key("hls/1/master.m3u8") == "site/hls/1/master.m3u8"
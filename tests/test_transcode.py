@@ -0,0 +1,31 @@
+from pathlib import Path
+
+from app import tasks
+
+
+def test_hls_ladder_is_one_ffmpeg_pass_without_upscaling(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_run(args, duration=None, on_progress=None):
+        calls.append(args)
+        (tmp_path / "master.m3u8").write_text("#EXTM3U\n")
+        (tmp_path / "v1").mkdir(exist_ok=True)
+        (tmp_path / "v1" / "index.m3u8").write_text("#EXTM3U\n")
+        on_progress(50.0)
+        return True
+
+    progress = []
+    monkeypatch.setattr(tasks, "probe_media", lambda src: {"duration": 10.0, "height": 720, "has_audio": True})
+    monkeypatch.setattr(tasks, "run_ffmpeg", fake_run)
+
+    master, top = tasks.transcode_hls_ladder("in.mp4", str(tmp_path), on_progress=progress.append)
+
+    assert len(calls) == 1
+    args = calls[0]
+    assert master == str(tmp_path / "master.m3u8")
+    assert top == str(tmp_path / "v1" / "index.m3u8")
+    assert args[args.index("-var_stream_map") + 1] == "v:0,a:0 v:1,a:1"
+    graph = args[args.index("-filter_complex") + 1]
+    assert "split=2" in graph and "scale=-2:720" in graph and "1080" not in graph
+    assert progress == [50.0]
+    assert Path(args[-1]).name == "index.m3u8"
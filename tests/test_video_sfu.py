@@ -0,0 +1,134 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import main, sfu
+from app.auth import create_access_token
+from app.database import create_db_and_tables, engine
+from app.models import Membership, Space, User
+from app.realtime import MemoryBus, set_bus
+
+
+def test_layer_cap_follows_room_size(monkeypatch):
+    monkeypatch.setattr(sfu, "VIDEO_MESH_MAX", 4)
+    monkeypatch.setattr(sfu, "VIDEO_HALF_LAYER_MAX", 10)
+    assert [sfu.layer_cap(n) for n in (2, 4, 5, 10, 11)] == ["f", "f", "h", "h", "q"]
+    assert sfu.clamp_layer("f", 8) == "h" and sfu.clamp_layer("q", 8) == "q"
+    assert sfu.clamp_layer("bogus", 20) == "q"
+    assert sfu.parse_peer("sfu:local") == "sfu:local" and sfu.parse_peer("7") == 7
+    assert sfu.parse_peer("sfu:") is None and sfu.parse_peer(None) is None
+
+
+def _setup():
+    create_db_and_tables()
+    with Session(engine) as session:
+        users = [User(username=f"sfu_user_{i}", email=f"sfu_user_{i}@example.com", hashed_password="x") for i in range(4)]
+        space = Space(name="sfu space")
+        session.add_all(users + [space])
+        session.commit()
+        for i, user in enumerate(users):
+            session.add(Membership(user_id=user.id, space_id=space.id, role="teacher" if i == 0 else "student"))
+        session.commit()
+        return [u.id for u in users], [u.username for u in users], space.id
+
+
+def _cleanup(user_ids, space_id):
+    with Session(engine) as session:
+        for row in session.exec(select(Membership).where(Membership.space_id == space_id)).all():
+            session.delete(row)
+        session.delete(session.get(Space, space_id))
+        for uid in user_ids:
+            session.delete(session.get(User, uid))
+        session.commit()
+
+
+def _until(ws, event):
+    while True:
+        data = ws.receive_json()
+        if data.get("event") == event:
+            return data["payload"]
+
+
+def test_large_meeting_moves_to_forwarder_and_enforces_caps(monkeypatch):
+    monkeypatch.setattr(sfu, "VIDEO_MESH_MAX", 2)
+    monkeypatch.setattr(sfu, "VIDEO_MAX_PARTICIPANTS", 3)
+    monkeypatch.setattr(sfu, "VIDEO_STANDIN_SFU", "local")
+    ids, names, space_id = _setup()
+    set_bus(MemoryBus())
+    try:
+        with TestClient(main.app) as client:
+            forwarder = main._standin_forwarder
+            sockets = []
+            for name in names:
+                client.cookies.set("access_token", f"Bearer {create_access_token({'sub': name})}")
+                sockets.append(client.websocket_connect("/ws/video").__enter__())
+            host, a, b, c = sockets
+            join = {"event": "join-room", "payload": {"room_id": space_id}}
+
+            host.send_json(join)
+            assert _until(host, "room-users")["topology"] == "mesh"
+            a.send_json(join)
+            room = _until(a, "room-users")
+            assert room["topology"] == "mesh" and room["users"] == [ids[0]]
+
+            # the third participant outgrows the mesh
+            b.send_json(join)
+            room = _until(b, "room-users")
+            assert room["topology"] == "sfu" and room["forwarder"] == "sfu:local"
+            assert sorted(room["users"]) == ids[:2] and room["layers"] == sfu.SIMULCAST_LAYERS
+            switched = _until(host, "topology")
+            assert switched["forwarder"] == "sfu:local" and switched["max_participants"] == 3
+            assert _until(a, "topology")["topology"] == "sfu"
+
+            c.send_json(join)
+            assert _until(c, "room-full") == {"space_id": space_id, "max_participants": 3}
+
+            # one upstream per publisher, answered by the forwarder
+            for ws in (b, a):
+                ws.send_json({"event": "offer", "payload": {"target_id": "sfu:local", "room_id": space_id, "sdp": {}}})
+                assert _until(ws, "answer")["sender_id"] == "sfu:local"
+            assert forwarder.upstreams[space_id] == {ids[1], ids[2]}
+            assert forwarder.subscriptions[space_id][ids[0]] == {ids[1]: "h", ids[2]: "h"}
+
+            # subscribers cannot ask for more than the room size allows
+            a.send_json({"event": "select-layer", "payload": {"room_id": space_id, "publisher_id": ids[2], "layer": "f"}})
+            a.send_json({"event": "select-layer", "payload": {"room_id": space_id, "publisher_id": ids[2], "layer": "q"}})
+            a.send_json({"event": "offer", "payload": {"target_id": "sfu:local", "room_id": space_id, "sdp": {}}})
+            _until(a, "answer")
+            assert forwarder.subscriptions[space_id][ids[1]] == {ids[2]: "q"}
+
+            host.send_json({"event": "leave-room", "payload": {"room_id": space_id}})
+            _until(a, "meeting-ended")
+            assert space_id not in forwarder.rooms
+            for ws in sockets:
+                ws.__exit__(None, None, None)
+    finally:
+        set_bus(None)
+        _cleanup(ids, space_id)
+
+
+def test_meeting_stays_uncapped_mesh_without_a_forwarder(monkeypatch):
+    monkeypatch.setattr(sfu, "VIDEO_MESH_MAX", 2)
+    monkeypatch.setattr(sfu, "VIDEO_STANDIN_SFU", "")
+    ids, names, space_id = _setup()
+    set_bus(MemoryBus())
+    try:
+        with TestClient(main.app) as client:
+            sockets = []
+            for name in names:
+                client.cookies.set("access_token", f"Bearer {create_access_token({'sub': name})}")
+                sockets.append(client.websocket_connect("/ws/video").__enter__())
+            join = {"event": "join-room", "payload": {"room_id": space_id}}
+            rooms = []
+            for ws in sockets:
+                ws.send_json(join)
+                rooms.append(_until(ws, "room-users"))
+            assert all(room["topology"] == "mesh" and room["max_participants"] is None for room in rooms)
+            assert "warning" not in rooms[1] and rooms[3]["warning"] == "mesh-oversized"
+            assert len(rooms[3]["users"]) == 3
+            sockets[0].send_json({"event": "leave-room", "payload": {"room_id": space_id}})
+            _until(sockets[1], "meeting-ended")
+            for ws in sockets:
+                ws.__exit__(None, None, None)
+    finally:
+        set_bus(None)
+        _cleanup(ids, space_id)
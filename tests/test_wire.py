@@ -0,0 +1,72 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import main
+from app.auth import create_access_token
+from app.database import create_db_and_tables, engine
+from app.models import Membership, Space, SpaceMessage, User
+from app.wire import Wire
+
+
+def test_profiles_once_sends_each_sender_profile_once():
+    wire = Wire(None, profiles="once")
+    alice = {"username": "alice", "full_name": "Alice", "avatar": None, "site_role": "teacher"}
+    first = {"type": "message", "seq": 1, "message": dict(alice, id=1, sender_id=7, content="hi")}
+    frames = wire.frames(first)
+    assert frames == [
+        {"type": "users", "users": {"7": alice}},
+        {"type": "message", "seq": 1, "message": {"id": 1, "sender_id": 7, "content": "hi"}},
+    ]
+    assert "username" in first["message"]  # the shared payload is left alone
+
+    # a direct message carries the sender at the top level
+    assert wire.frames(dict(alice, type="message", id=2, **{"from": 7})) == [
+        {"type": "message", "id": 2, "from": 7}]
+    renamed = dict(alice, full_name="Alice B", type="message", id=3, **{"from": 7})
+    assert wire.frames(renamed)[0] == {"type": "users", "users": {"7": dict(alice, full_name="Alice B")}}
+
+    assert Wire(None).frames(first) == [first]
+    assert wire.frames({"type": "typing", "user_id": 7}) == [{"type": "typing", "user_id": 7}]
+
+
+def test_space_socket_speaks_msgpack_with_compact_profiles(monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    monkeypatch.setattr(main.space_rooms, "grace", 0)  # no replay ring left behind for other tests
+    create_db_and_tables()
+    with Session(engine) as session:
+        user = User(username="wire_user", email="wire_user@example.com", hashed_password="x", full_name="Wire User")
+        space = Space(name="wire space")
+        session.add(user)
+        session.add(space)
+        session.commit()
+        session.add(Membership(user_id=user.id, space_id=space.id, role="student"))
+        session.commit()
+        user_id, space_id = user.id, space.id
+    try:
+        client = TestClient(main.app)
+        client.cookies.set("access_token", f"Bearer {create_access_token({'sub': 'wire_user'})}")
+        url = f"/ws/spaces/{space_id}?profiles=once"
+        with client.websocket_connect(url, subprotocols=["msgpack", "json"]) as ws:
+            assert ws.accepted_subprotocol == "msgpack"
+            for content in ("one", "two"):
+                ws.send_bytes(msgpack.packb({"type": "message", "content": content}))
+            frames = [msgpack.unpackb(ws.receive_bytes(), raw=False) for _ in range(3)]
+        assert frames[0] == {"type": "users", "users": {str(user_id): {
+            "username": "wire_user", "full_name": "Wire User", "avatar": None, "site_role": None}}}
+        assert [f["message"]["content"] for f in frames[1:]] == ["one", "two"]
+        assert "username" not in frames[1]["message"]
+
+        # clients that offer nothing keep getting JSON with profiles inline
+        with client.websocket_connect(f"/ws/spaces/{space_id}") as ws:
+            assert ws.accepted_subprotocol is None
+            ws.send_json({"type": "message", "content": "three"})
+            assert ws.receive_json()["message"]["username"] == "wire_user"
+    finally:
+        with Session(engine) as session:
+            for model, column in ((SpaceMessage, SpaceMessage.space_id), (Membership, Membership.space_id)):
+                for row in session.exec(select(model).where(column == space_id)).all():
+                    session.delete(row)
+            session.delete(session.get(Space, space_id))
+            session.delete(session.get(User, user_id))
+            session.commit()
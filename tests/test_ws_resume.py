@@ -0,0 +1,95 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from sqlmodel import Session, select
+
+from app import main
+from app.auth import create_access_token
+from app.database import create_db_and_tables, engine
+from app.models import Membership, Message, Space, SpaceMessage, User
+
+
+def _setup():
+    create_db_and_tables()
+    with Session(engine) as session:
+        user = User(username="resume_user", email="resume_user@example.com", hashed_password="x", full_name="Resume User")
+        space = Space(name="resume space")
+        session.add(user)
+        session.add(space)
+        session.commit()
+        session.add(Membership(user_id=user.id, space_id=space.id, role="student"))
+        msgs = [SpaceMessage(space_id=space.id, sender_id=user.id, content=f"old {i}") for i in range(3)]
+        session.add_all(msgs)
+        session.commit()
+        return user.id, user.username, space.id, [m.id for m in msgs]
+
+
+def _cleanup(user_id, space_id):
+    with Session(engine) as session:
+        for model, column in ((SpaceMessage, SpaceMessage.space_id), (Membership, Membership.space_id)):
+            for row in session.exec(select(model).where(column == space_id)).all():
+                session.delete(row)
+        session.delete(session.get(Space, space_id))
+        session.delete(session.get(User, user_id))
+        session.commit()
+
+
+def test_space_socket_replays_missed_messages():
+    user_id, username, space_id, ids = _setup()
+    try:
+        client = TestClient(main.app)
+        client.cookies.set("access_token", f"Bearer {create_access_token({'sub': username})}")
+        with client.websocket_connect(f"/ws/spaces/{space_id}?resume_from={ids[0]}") as ws:
+            replay = ws.receive_json()
+            assert replay["type"] == "replay" and replay["more"] is False
+            assert [row[0] for row in replay["messages"]] == ids[1:]
+            assert replay["seq"] == ids[2]
+            assert replay["users"] == {str(user_id): {
+                "username": username, "full_name": "Resume User", "avatar": None, "site_role": None}}
+
+            ws.send_json({"type": "message", "content": "live"})
+            live = ws.receive_json()
+            assert live["type"] == "message" and live["seq"] == live["message"]["id"] > ids[2]
+
+        with client.websocket_connect(f"/ws/spaces/{space_id}?resume_from={live['seq']}") as ws:
+            assert ws.receive_json()["messages"] == []
+    finally:
+        _cleanup(user_id, space_id)
+
+
+def test_dm_replay_needs_a_session_and_stays_in_one_conversation():
+    create_db_and_tables()
+    with Session(engine) as session:
+        users = [User(username=f"dm_resume_{i}", email=f"dm_resume_{i}@example.com", hashed_password="x") for i in range(3)]
+        session.add_all(users)
+        session.commit()
+        a, b, c = [u.id for u in users]
+        session.add_all([Message(sender_id=a, recipient_id=b, content="to b"),
+                         Message(sender_id=c, recipient_id=a, content="secret from c")])
+        session.commit()
+    try:
+        client = TestClient(main.app)
+        # no cookie: refused before accept, nothing is replayed
+        with pytest.raises(WebSocketDisconnect) as refused:
+            with client.websocket_connect(f"/ws/chat/{a}?resume_from=0") as ws:
+                ws.receive_json()
+        assert refused.value.code == 1008
+
+        client.cookies.set("access_token", f"Bearer {create_access_token({'sub': 'dm_resume_0'})}")
+        with client.websocket_connect(f"/ws/chat/{b}?resume_from=0") as ws:
+            assert [row[3] for row in ws.receive_json()["messages"]] == ["to b"]
+        with client.websocket_connect(f"/ws/chat/{a}?resume_from=0") as ws:
+            assert ws.receive_json()["messages"] == []
+            # a bad recipient is answered on the same socket instead of closing it
+            ws.send_json({"type": "message", "content": "nowhere"})
+            assert ws.receive_json()["type"] == "error"
+            # the sender is the session user, whatever "from" claims
+            ws.send_json({"type": "message", "from": c, "to": b, "content": "spoofed"})
+            assert ws.receive_json()["message"]["from"] == a
+    finally:
+        with Session(engine) as session:
+            for row in session.exec(select(Message).where(Message.sender_id.in_([a, b, c]))).all():
+                session.delete(row)
+            for uid in (a, b, c):
+                session.delete(session.get(User, uid))
+            session.commit()